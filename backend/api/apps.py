@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import metrics, signals  # noqa: F401
+        from .archive import drop_archive_view, install_archive_view
+        from .search import install_search_indexes
+        post_migrate.connect(install_search_indexes, sender=self)
+        pre_migrate.connect(drop_archive_view, sender=self)
+        post_migrate.connect(install_archive_view, sender=self)
+        metrics.install()
+        if settings.AUDITLOG_ASYNC:
+            from . import audit_writer
+            audit_writer.install()
@@ -0,0 +1,170 @@
+"""
+Retention for the audit log.
+
+Entries older than ``AUDITLOG_HOT_RETENTION`` are moved out of auditlog's own
+table into one archive table per month (``api_logentry_archive_YYYYMM``),
+chunk by chunk, each chunk in its own short transaction. The archived copy
+drops the ``serialized_data`` snapshot unless asked to keep it; the changes
+themselves are kept.
+
+The ``api_logentry_with_archive`` view (``LogEntryWithArchive``) unions the
+live table with every archive table; it is recreated whenever an archive
+table is added or dropped, and around ``migrate``, since SQLite cannot
+rebuild a table that a view refers to.
+
+Archive tables older than ``AUDITLOG_ARCHIVE_RETENTION`` can be exported to
+gzipped JSONL files and dropped; exported months are no longer queryable.
+"""
+import gzip
+import json
+import re
+from collections import defaultdict
+from pathlib import Path
+
+from auditlog.models import LogEntry
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from .filters import LogEntryFilter
+from .models import LogEntryWithArchive
+
+ARCHIVE_TABLE_PREFIX = 'api_logentry_archive_'
+_archive_table_re = re.compile(rf'^{ARCHIVE_TABLE_PREFIX}(\d{{6}})$')
+
+
+def _columns():
+    return [field.column for field in LogEntry._meta.concrete_fields]
+
+
+def archive_table_name(timestamp):
+    return f'{ARCHIVE_TABLE_PREFIX}{timestamp:%Y%m}'
+
+
+def archive_tables(connection):
+    return sorted(name for name in connection.introspection.table_names() if _archive_table_re.match(name))
+
+
+def create_archive_table(connection, table):
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {qn(table)} AS SELECT * FROM {qn(LogEntry._meta.db_table)} WHERE 1 = 0')
+        cursor.execute(f'CREATE INDEX {qn(table + "_ts")} ON {qn(table)} (timestamp)')
+        cursor.execute(f'CREATE INDEX {qn(table + "_obj")} ON {qn(table)} (content_type_id, object_id, timestamp)')
+
+
+def drop_archive_view(using=DEFAULT_DB_ALIAS, **kwargs):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP VIEW IF EXISTS {connection.ops.quote_name(LogEntryWithArchive._meta.db_table)}')
+
+
+def install_archive_view(using=DEFAULT_DB_ALIAS, **kwargs):
+    connection = connections[using]
+    if LogEntry._meta.db_table not in connection.introspection.table_names():
+        return
+    qn = connection.ops.quote_name
+    columns = ', '.join(qn(column) for column in _columns())
+    selects = [f'SELECT {columns} FROM {qn(table)}'
+               for table in [LogEntry._meta.db_table] + archive_tables(connection)]
+    drop_archive_view(using)
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE VIEW {qn(LogEntryWithArchive._meta.db_table)} AS {" UNION ALL ".join(selects)}')
+
+
+def archive_cutoff():
+    return timezone.now() - settings.AUDITLOG_HOT_RETENTION
+
+
+def log_entries_for(params):
+    """
+    ``LogEntry`` manager, or the view including the archive when a
+    ``timestamp__gte``/``timestamp__lte`` filter in ``params`` reaches past
+    the hot retention window.
+    """
+    form = LogEntryFilter(params, queryset=LogEntry.objects.none()).form
+    if form.is_valid():
+        cutoff = archive_cutoff()
+        bounds = (form.cleaned_data.get('timestamp__gte'), form.cleaned_data.get('timestamp__lte'))
+        if any(bound is not None and bound < cutoff for bound in bounds):
+            return LogEntryWithArchive.objects
+    return LogEntry.objects
+
+
+def archive_log_entries(before, chunk_size=5000, keep_snapshots=False, using=DEFAULT_DB_ALIAS):
+    """
+    Moves entries older than ``before`` to the monthly archive tables.
+    Returns the number of entries moved.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    columns = _columns()
+    selected = ', '.join('NULL' if column == 'serialized_data' and not keep_snapshots else qn(column)
+                         for column in columns)
+    tables = set(archive_tables(connection))
+    moved = 0
+    while True:
+        chunk = list(
+            LogEntry.objects.using(using)
+            .filter(timestamp__lt=before)
+            .order_by('timestamp', 'id')
+            .values_list('id', 'timestamp')[:chunk_size]
+        )
+        if not chunk:
+            return moved
+        months = defaultdict(list)
+        for pk, timestamp in chunk:
+            months[archive_table_name(timestamp)].append(pk)
+        new_tables = set(months) - tables
+        if new_tables:
+            for table in new_tables:
+                create_archive_table(connection, table)
+            tables |= new_tables
+            install_archive_view(using)
+
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            for table, ids in months.items():
+                cursor.execute(
+                    f'INSERT INTO {qn(table)} ({", ".join(qn(c) for c in columns)}) '
+                    f'SELECT {selected} FROM {qn(LogEntry._meta.db_table)} '
+                    f'WHERE id IN ({", ".join(["%s"] * len(ids))})',
+                    ids,
+                )
+            LogEntry.objects.using(using).filter(id__in=[pk for pk, _ in chunk]).delete()
+        moved += len(chunk)
+
+
+def export_archive_tables(before, directory, using=DEFAULT_DB_ALIAS):
+    """
+    Writes archive tables of the months before ``before`` to
+    ``<directory>/<table>.jsonl.gz`` and drops them. Returns the exported paths.
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    last_table = archive_table_name(before)
+    tables = [table for table in archive_tables(connection) if table < last_table]
+    if not tables:
+        return []
+    # PostgreSQL refuses to drop a table the view depends on.
+    drop_archive_view(using)
+    exported = []
+    try:
+        for table in tables:
+            path = directory / f'{table}.jsonl.gz'
+            partial = path.with_suffix('.part')
+            with gzip.open(partial, 'wt', encoding='utf-8') as file, connection.cursor() as cursor:
+                cursor.execute(f'SELECT * FROM {qn(table)} ORDER BY timestamp, id')
+                names = [column[0] for column in cursor.description]
+                while rows := cursor.fetchmany(2000):
+                    for row in rows:
+                        file.write(json.dumps(dict(zip(names, row)), ensure_ascii=False, cls=DjangoJSONEncoder) + '\n')
+            partial.rename(path)
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {qn(table)}')
+            exported.append(path)
+    finally:
+        install_archive_view(using)
+    return exported
@@ -0,0 +1,166 @@
+"""
+Async read-only versions of the list/retrieve endpoints, under ``async/``.
+
+They use the querysets, filters, serializers, pagination and permissions of
+the synchronous views; only the request handling differs. Authentication,
+permission checks and building the filtered queryset (which may look up a
+parent object or validate filter values against the database) run in one
+``sync_to_async`` call, the main query goes through the async ORM, and the
+already loaded rows are serialized on the event loop. Querysets must
+therefore load every relation the serializer touches (``select_related`` /
+``prefetch_related``): a lazy query there raises ``SynchronousOnlyOperation``.
+
+Under ASGI (``freevigilance.asgi``) a slow list does not hold a worker; under
+WSGI the views still work, Django just runs them in an event loop of their own.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework import generics
+from rest_framework.response import Response
+
+from .fieldsets import SparseFieldsetMixin
+from .filters import ObligationFilter, PVAFilter, TaskFilter
+from .pagination import TaskCursorPagination
+from .projections import ProjectedListMixin
+from .routers import ReplicaReadMixin
+from .serializers import ObligationSerializer, PVASerializer, TaskSerializer
+from .views import (
+    CommentListCreateView, ObligationTaskListView, ObligationViewSet, PVAObligationListView, PVAViewSet,
+    TaskChangelogListView, TaskViewSet,
+)
+
+
+class AsyncAPIView(generics.GenericAPIView):
+    """``GenericAPIView`` with an async ``dispatch``; handlers are coroutines."""
+    # Documented by the synchronous endpoints.
+    schema = None
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def options(self, request, *args, **kwargs):
+        return await sync_to_async(super().options)(request, *args, **kwargs)
+
+    async def aget_filtered_queryset(self):
+        return await sync_to_async(lambda: self.filter_queryset(self.get_queryset()))()
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        paginate = getattr(self.paginator, 'apaginate_queryset', None)
+        if paginate is None:
+            return await sync_to_async(self.paginate_queryset)(queryset)
+        return await paginate(queryset, self.request, view=self)
+
+    async def aget_object(self):
+        queryset = await self.aget_filtered_queryset()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        # Same responses as ``rest_framework.generics.get_object_or_404`` in the synchronous views.
+        try:
+            instance = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            raise Http404(f'No {queryset.model._meta.object_name} matches the given query.')
+        except (TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, instance)
+        return instance
+
+
+class AsyncListAPIView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        queryset = await self.aget_filtered_queryset()
+        projection = None
+        if isinstance(self, ProjectedListMixin):
+            projection = self.get_list_projection(queryset)
+        if projection is None:
+            serialize = lambda items: self.get_serializer(items, many=True).data
+        else:
+            queryset = self.projected_queryset(queryset, projection)
+            serialize = projection.rows
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize(page))
+        return Response(serialize([item async for item in queryset]))
+
+
+class AsyncRetrieveAPIView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        return Response(self.get_serializer(await self.aget_object()).data)
+
+
+class AsyncTaskMixin(ReplicaReadMixin, SparseFieldsetMixin):
+    serializer_class = TaskSerializer
+    filterset_class = TaskFilter
+    get_queryset = TaskViewSet.get_queryset
+
+
+class AsyncTaskListView(ProjectedListMixin, AsyncTaskMixin, AsyncListAPIView):
+    pagination_class = TaskCursorPagination
+
+
+class AsyncTaskDetailView(AsyncTaskMixin, AsyncRetrieveAPIView):
+    pass
+
+
+class AsyncObligationMixin(ReplicaReadMixin, SparseFieldsetMixin):
+    queryset = ObligationViewSet.queryset
+    serializer_class = ObligationSerializer
+    filterset_class = ObligationFilter
+
+
+class AsyncObligationListView(AsyncObligationMixin, AsyncListAPIView):
+    pass
+
+
+class AsyncObligationDetailView(AsyncObligationMixin, AsyncRetrieveAPIView):
+    pass
+
+
+class AsyncPVAMixin(ReplicaReadMixin, SparseFieldsetMixin):
+    queryset = PVAViewSet.queryset
+    serializer_class = PVASerializer
+    filterset_class = PVAFilter
+
+
+class AsyncPVAListView(AsyncPVAMixin, AsyncListAPIView):
+    pass
+
+
+class AsyncPVADetailView(AsyncPVAMixin, AsyncRetrieveAPIView):
+    pass
+
+
+class AsyncObligationTaskListView(AsyncListAPIView, ObligationTaskListView):
+    pass
+
+
+class AsyncPVAObligationListView(AsyncListAPIView, PVAObligationListView):
+    pass
+
+
+class AsyncCommentListView(AsyncListAPIView, CommentListCreateView):
+    http_method_names = ['get', 'head', 'options']
+
+
+class AsyncTaskChangelogListView(AsyncListAPIView, TaskChangelogListView):
+    pass
@@ -0,0 +1,56 @@
+from auditlog.cid import get_cid
+from auditlog.context import auditlog_disabled
+from auditlog.diff import model_instance_diff
+from auditlog.models import LogEntry
+from auditlog.registry import auditlog
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ObjectDoesNotExist
+from django.utils.encoding import smart_str
+
+
+def build_log_entry(instance, action, changes, actor=None, **kwargs):
+    """
+    Unsaved counterpart of ``LogEntry.objects.log_create``: fills in the same
+    fields, so that entries can be written with a single ``bulk_create``.
+    """
+    pk = instance.pk
+    try:
+        object_repr = smart_str(instance)
+    except ObjectDoesNotExist:
+        object_repr = ''
+    kwargs.setdefault('object_id', pk if isinstance(pk, int) else None)
+    kwargs.setdefault('serialized_data', LogEntry.objects._get_serialized_data_or_none(instance))
+    kwargs.setdefault('cid', get_cid())
+    return LogEntry(
+        content_type=ContentType.objects.get_for_model(instance),
+        object_pk=smart_str(pk),
+        object_repr=object_repr,
+        action=action,
+        changes=changes,
+        actor=actor,
+        **kwargs,
+    )
+
+
+def bulk_log(pairs, action, actor=None, changes_text=''):
+    """
+    Write audit entries for ``(old, new)`` instance pairs in one query.
+
+    ``old`` is ``None`` for created objects and ``new`` is ``None`` for deleted
+    ones. Models not tracked by auditlog and updates without changes are skipped,
+    as in the signal-driven path. ``changes_text`` may be a callable taking the
+    logged instance. Returns the created entries.
+    """
+    if auditlog_disabled.get():
+        return []
+    entries = []
+    for old, new in pairs:
+        instance = new if new is not None else old
+        if not auditlog.contains(instance.__class__):
+            continue
+        changes = model_instance_diff(old, new)
+        if not changes:
+            continue
+        text = changes_text(instance) if callable(changes_text) else changes_text
+        entries.append(build_log_entry(instance, action, changes, actor=actor, changes_text=text))
+    return LogEntry.objects.bulk_create(entries)
@@ -0,0 +1,314 @@
+"""
+Asynchronous audit log writer.
+
+With ``AUDITLOG_ASYNC`` enabled, the auditlog receivers of the tracked models
+are replaced by the ones below: they build the entry in the request, with its
+diff, actor, remote address and timestamp, and hand it to ``writer.log()``,
+which passes it to a background thread once the surrounding transaction
+commits. The thread writes the entries with one ``bulk_create`` per batch.
+``LogEntry`` and its manager are left alone: ``LogEntry.objects.create`` still
+inserts the row.
+
+Every queued entry is first appended to the writer's current spool segment
+(``<pid>-<n>.jsonl`` under ``AUDITLOG_ASYNC_SPOOL_DIR``). Each flush rotates
+the segment and deletes it once its entries are in the database, so the spool
+only ever holds what has not been written yet. Segments left behind by dead
+processes are replayed when a writer starts; a replaying process first claims
+a segment by renaming it to its own pid, so two processes never insert the
+same segment. Entries survive a crash at least once: a crash between the
+insert and the deletion of a segment replays it. An actor deleted before its entries are written is
+cleared from them, as deleting it afterwards would have. The queue is
+bounded; when it is full the entry is written synchronously instead of being
+dropped.
+Remaining entries are flushed when the interpreter exits.
+"""
+import atexit
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from pathlib import Path
+
+from auditlog.context import auditlog_value
+from auditlog.diff import model_instance_diff
+from auditlog.models import LogEntry
+from auditlog.receivers import check_disable
+from auditlog.registry import auditlog
+from auditlog.signals import post_log, pre_log
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils.dateparse import parse_datetime
+
+from .audit import build_log_entry
+
+logger = logging.getLogger(__name__)
+
+# Set by ``api.middleware.AuditlogMiddleware``: auditlog attaches the actor in a
+# ``pre_save`` receiver, which never runs for entries saved by the writer thread.
+audit_actor = ContextVar('audit_actor', default=None)
+
+
+def _entry_to_record(entry):
+    return {
+        field.attname: field.value_from_object(entry)
+        for field in LogEntry._meta.concrete_fields
+        if not field.primary_key
+    }
+
+
+def _record_to_entry(record):
+    return LogEntry(**dict(record, timestamp=parse_datetime(record['timestamp'])))
+
+
+def _write(entries, batch_size=None):
+    # ``actor`` is a foreign key: entries of a user deleted meanwhile would fail the whole batch, every retry.
+    actor_ids = {entry.actor_id for entry in entries if entry.actor_id is not None}
+    if actor_ids:
+        existing = set(get_user_model().objects.filter(pk__in=actor_ids).values_list('pk', flat=True))
+        for entry in entries:
+            if entry.actor_id not in existing:
+                entry.actor_id = None
+    LogEntry.objects.bulk_create(entries, batch_size=batch_size)
+
+
+def _segment_pid(path):
+    try:
+        return int(path.stem.split('-', 1)[0])
+    except ValueError:
+        return None
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AuditLogWriter:
+    """
+    Per-process queue of audit entries written by a background thread. The
+    ``AUDITLOG_ASYNC_*`` settings are read when the writer starts, unless given.
+    """
+
+    def __init__(self, spool_dir=None, batch_size=None, flush_interval=None, queue_size=None):
+        self.options = {'spool_dir': spool_dir, 'batch_size': batch_size,
+                        'flush_interval': flush_interval, 'queue_size': queue_size}
+        self.pid = None
+        self.thread = None
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+
+    def _option(self, name):
+        value = self.options[name]
+        return getattr(settings, f'AUDITLOG_ASYNC_{name.upper()}') if value is None else value
+
+    def start(self, thread=True):
+        # Also restarts the writer in a forked worker: threads do not survive a fork.
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.spool_dir = Path(self._option('spool_dir'))
+            self.batch_size = self._option('batch_size')
+            self.flush_interval = self._option('flush_interval')
+            self.queue_size = self._option('queue_size')
+            self.segments = itertools.count()
+            self.pending = []
+            # The rotated segment being written, kept until it is in the database.
+            self.flushing = None
+            self.stopping = False
+            self.spool_dir.mkdir(parents=True, exist_ok=True)
+            self._open_segment()
+        self.replay()
+        if thread:
+            self.thread = threading.Thread(target=self._run, name='auditlog-writer', daemon=True)
+            self.thread.start()
+            atexit.register(self.stop)
+
+    def _open_segment(self):
+        self.segment = self.spool_dir / f'{self.pid}-{next(self.segments)}.jsonl'
+        self.spool = open(self.segment, 'a', encoding='utf-8')
+
+    def replay(self):
+        """Writes the spool segments of processes that are gone."""
+        for path in sorted(self.spool_dir.glob('*.jsonl')):
+            pid = _segment_pid(path)
+            if pid is None or pid == self.pid or _process_alive(pid):
+                continue
+            # Renaming is atomic: of several processes replaying, only one gets the segment.
+            claimed = path.with_name(f'{self.pid}-{next(self.segments)}.jsonl')
+            try:
+                path.rename(claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, encoding='utf-8') as spool:
+                entries = [_record_to_entry(json.loads(line)) for line in spool if line.strip()]
+            with transaction.atomic():
+                _write(entries, self.batch_size)
+            claimed.unlink()
+            logger.info('Replayed %d audit log entries from %s', len(entries), path)
+
+    def log(self, entry, using=None):
+        """
+        Writes ``entry``, an unsaved ``LogEntry``, if the current transaction
+        commits: in a batch from the background thread with ``AUDITLOG_ASYNC``,
+        else right away.
+        """
+        try:
+            context = auditlog_value.get()
+        except LookupError:
+            pass
+        else:
+            entry.remote_addr = context['remote_addr']
+        actor = audit_actor.get()
+        if entry.actor_id is None and isinstance(actor, get_user_model()):
+            entry.actor_id = actor.pk
+        if not settings.AUDITLOG_ASYNC:
+            entry.save(using=using)
+            return
+        self.start()
+        # Like a synchronous insert, the entry is discarded if the transaction is rolled back.
+        transaction.on_commit(lambda: self.put(entry), using=using)
+
+    def put(self, entry):
+        with self.condition:
+            if len(self.pending) < self.queue_size:
+                self.spool.write(json.dumps(_entry_to_record(entry), cls=DjangoJSONEncoder) + '\n')
+                self.spool.flush()
+                self.pending.append(entry)
+                if len(self.pending) >= self.batch_size:
+                    self.condition.notify()
+                return
+        _write([entry])
+
+    def rotate(self):
+        """Takes the pending entries and their spool segment, starting a new segment."""
+        with self.lock:
+            if not self.pending:
+                return None
+            rotated = self.segment, self.pending
+            self.spool.close()
+            self.pending = []
+            self._open_segment()
+        return rotated
+
+    def flush(self):
+        """
+        Writes the pending entries and deletes their spool segment. A segment
+        that could not be written is written first by the next call.
+        """
+        if self.flushing is None:
+            self.flushing = self.rotate()
+        if self.flushing is None:
+            return 0
+        path, entries = self.flushing
+        with transaction.atomic():
+            _write(entries, self.batch_size)
+        path.unlink()
+        self.flushing = None
+        return len(entries)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            with self.condition:
+                if not self.stopping and len(self.pending) < self.batch_size:
+                    self.condition.wait(self.flush_interval)
+                stopping = self.stopping
+            while True:
+                try:
+                    while self.flush():
+                        pass
+                    break
+                except Exception:
+                    # The entries stay in their segment; retry until the database is back.
+                    logger.exception('Failed to write audit log entries')
+                    time.sleep(self.flush_interval)
+                finally:
+                    close_old_connections()
+
+    def stop(self, timeout=30):
+        """
+        Flushes queued entries and stops the thread. Entries that could not be
+        written within ``timeout`` seconds remain in the spool.
+        """
+        if self.pid != os.getpid():
+            return
+        if self.thread is not None:
+            with self.condition:
+                self.stopping = True
+                self.condition.notify()
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                return
+        else:
+            while self.flush():
+                pass
+        with self.lock:
+            self.spool.close()
+            if not self.pending:
+                self.segment.unlink(missing_ok=True)
+            self.pid = self.thread = None
+
+
+writer = AuditLogWriter()
+
+
+def _log(action, instance, sender, old, new, fields_to_check=None):
+    """``auditlog.receivers._create_log_entry`` writing through ``writer``."""
+    pre_log_results = pre_log.send(sender, instance=instance, action=action)
+    if any(result is False for _, result in pre_log_results):
+        return
+    changes = model_instance_diff(old, new, fields_to_check=fields_to_check)
+    if not changes:
+        return
+    entry = build_log_entry(instance, action, changes)
+    writer.log(entry, using=instance._state.db)
+    post_log.send(sender, instance=instance, instance_old=old, action=action, error=None,
+                  pre_log_results=pre_log_results, changes=changes, log_entry=entry, log_created=True)
+
+
+@check_disable
+def log_create(sender, instance, created, **kwargs):
+    if created:
+        _log(LogEntry.Action.CREATE, instance, sender, None, instance)
+
+
+@check_disable
+def log_update(sender, instance, **kwargs):
+    if not instance._state.adding:
+        old = sender.objects.filter(pk=instance.pk).first()
+        _log(LogEntry.Action.UPDATE, instance, sender, old, instance, kwargs.get('update_fields'))
+
+
+@check_disable
+def log_delete(sender, instance, **kwargs):
+    if instance.pk is not None:
+        _log(LogEntry.Action.DELETE, instance, sender, instance, None)
+
+
+RECEIVERS = {post_save: log_create, pre_save: log_update, post_delete: log_delete}
+
+
+def install():
+    """
+    Connects the tracked models to ``RECEIVERS`` instead of auditlog's own
+    create/update/delete receivers. auditlog 3.0 has no setting for the
+    receivers, so this goes through its registry's signal table.
+    """
+    models = auditlog.get_models()
+    for model in models:
+        auditlog._disconnect_signals(model)
+    auditlog._signals.update(RECEIVERS)
+    for model in models:
+        auditlog._connect_signals(model)
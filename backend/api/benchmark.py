@@ -0,0 +1,363 @@
+"""
+In-process load test of the API (``manage.py benchmark_api``).
+
+Every endpoint of ``api/urls.py`` gets one or more scenarios: a request with
+ids taken from the database (fill it with ``seed_data`` first). Each scenario
+is run with ``concurrency`` threads, each with its own test client (the full
+middleware stack, no network) and database connection, logged in as the
+given user, or as a staff user made for the run by ``temporary_user()`` and
+deleted with what it created afterwards. Per request the latency and the
+number of SQL queries on all database aliases are recorded; streamed
+responses are read to the end.
+
+With ``base_url`` the same scenarios are sent over HTTP to a running server
+instead, e.g. to the WSGI deployment and then to the ASGI one, comparing the
+two reports. The server has to use the same database and ``SECRET_KEY``
+(the ids and the token come from here); SQL queries are not counted.
+Scenarios labelled ``serializer`` turn ``LIST_PROJECTIONS`` off to measure
+the lists without the ``.values()`` fast path, so they only run in-process.
+
+Write scenarios create comments and tasks and change existing ones, so the
+benchmark should run against a copy of the data. ``events/`` is never done:
+it does not end.
+"""
+import json
+import statistics
+import subprocess
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+from urllib.parse import urlencode, urljoin
+
+from auditlog.models import LogEntry
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.urls import URLResolver, reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import urls
+from .audit_writer import writer as audit_writer
+from .models import PVA, Comment, DeletionJob, MedicinalProduct, Obligation, ResponsibilityType, Task, User
+
+SKIPPED_ENDPOINTS = {'task-events'}
+
+
+class Scenario:
+    def __init__(self, label, url_name, kwargs=None, query=None, method='get', data=None, settings=None):
+        self.label = label
+        self.url_name = url_name
+        self.method = method
+        # Overridden for the scenario; only possible in-process.
+        self.settings = settings
+        self.path = reverse(url_name, kwargs=kwargs)
+        if query:
+            self.path += '?' + urlencode(query)
+        # ``data`` is a request body or a function of the request number returning one.
+        self.data = data
+
+    @property
+    def writes(self):
+        return self.method != 'get'
+
+    def body(self, number):
+        return self.data(number) if callable(self.data) else self.data
+
+
+def percentiles(values):
+    """``(p50, p95, p99)`` of ``values``."""
+    if len(values) < 2:
+        return (values[0],) * 3 if values else (0.0,) * 3
+    cuts = statistics.quantiles(values, n=100)
+    return cuts[49], cuts[94], cuts[98]
+
+
+def endpoint_names(patterns=None):
+    """Names of the URL patterns of ``api/urls.py``; format suffix duplicates share the name."""
+    names = set()
+    for pattern in urls.urlpatterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            names |= endpoint_names(pattern.url_patterns)
+        elif pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+@contextmanager
+def temporary_user():
+    """A staff user without a password for the run; deleted afterwards, with the tasks and comments it created."""
+    user = User.objects.create_user(f'benchmark-{uuid.uuid4().hex[:12]}', first_name='Benchmark', is_staff=True)
+    try:
+        yield user
+    finally:
+        # Its queued audit entries first: they refer to it.
+        audit_writer.stop()
+        user.delete()
+
+
+def data_counts():
+    return {model._meta.label: model.objects.count()
+            for model in (User, PVA, Obligation, Task, Comment, LogEntry)}
+
+
+def scenarios(user):
+    task = Task.objects.order_by('?').first()
+    open_tasks = list(Task.objects.filter(status__in=[Task.NOT_STARTED, Task.IN_PROGRESS], is_recurring=False)
+                      .order_by('?').values_list('id', flat=True)[:10])
+    obligation = Obligation.objects.order_by('?').first()
+    pva = PVA.objects.order_by('?').first()
+    if task is None or not open_tasks or obligation is None or pva is None:
+        return None
+    responsibility_type = ResponsibilityType.objects.first()
+    product = MedicinalProduct.objects.first()
+    deadline = (timezone.now() + timedelta(days=30)).isoformat()
+
+    result = [
+        Scenario('api root', 'api-root'),
+        Scenario('users', 'user-list'),
+        Scenario('users/me', 'user-me'),
+        Scenario('users/<id>', 'user-detail', {'pk': user.pk}),
+        Scenario('tasks', 'task-list'),
+        Scenario('tasks page', 'task-list', query={'page_size': 100}),
+        Scenario('tasks search', 'task-list', query={'search': 'отчет'}),
+        Scenario('tasks fields', 'task-list', query={'fields': 'id,title,status,deadline', 'expand': ''}),
+        Scenario('tasks serializer', 'task-list', settings={'LIST_PROJECTIONS': False}),
+        Scenario('tasks page serializer', 'task-list', query={'page_size': 100}, settings={'LIST_PROJECTIONS': False}),
+        Scenario('tasks/<id>', 'task-detail', {'pk': task.pk}),
+        Scenario('tasks/completed', 'task-completed'),
+        Scenario('tasks/my', 'task-my'),
+        Scenario('tasks/my/completed', 'task-my-completed'),
+        Scenario('tasks/stats', 'task-stats'),
+        Scenario('tasks/calendar', 'task-calendar'),
+        Scenario('tasks/export', 'task-export'),
+        Scenario('obligations', 'obligation-list'),
+        Scenario('obligations/<id>', 'obligation-detail', {'pk': obligation.pk}),
+        Scenario('obligations/export', 'obligation-export'),
+        Scenario('obligations/<id>/tasks', 'obligation-tasks', {'id': obligation.pk}),
+        Scenario('obligations/<id>/tasks serializer', 'obligation-tasks', {'id': obligation.pk},
+                 settings={'LIST_PROJECTIONS': False}),
+        Scenario('pvas', 'pva-list'),
+        Scenario('pvas/<id>', 'pva-detail', {'pk': pva.pk}),
+        Scenario('pvas/export', 'pva-export'),
+        Scenario('pvas/<id>/obligations', 'pva-tasks', {'id': pva.pk}),
+        Scenario('responsibility-types', 'responsibilitytype-list'),
+        Scenario('medicinal-products', 'medicinalproduct-list'),
+        Scenario('tasks/<id>/comments', 'task-comments', {'id': task.pk}),
+        Scenario('tasks/<id>/changelog', 'task-changelog', {'id': task.pk}),
+        Scenario('auditlog', 'auditlog'),
+        Scenario('auditlog page', 'auditlog', query={'page_size': 100}),
+        Scenario('sync', 'sync', query={'since': (timezone.now() - timedelta(days=1)).isoformat()}),
+        Scenario('metrics', 'metrics'),
+        Scenario('profiles', 'profile-list'),
+        Scenario('deletion-jobs', 'deletionjob-list'),
+        Scenario('async/tasks', 'async-task-list'),
+        Scenario('async/tasks/<id>', 'async-task-detail', {'pk': task.pk}),
+        Scenario('async/obligations', 'async-obligation-list'),
+        Scenario('async/obligations/<id>', 'async-obligation-detail', {'pk': obligation.pk}),
+        Scenario('async/pvas', 'async-pva-list'),
+        Scenario('async/pvas/<id>', 'async-pva-detail', {'pk': pva.pk}),
+        Scenario('async/obligations/<id>/tasks', 'async-obligation-tasks', {'id': obligation.pk}),
+        Scenario('async/pvas/<id>/obligations', 'async-pva-obligations', {'id': pva.pk}),
+        Scenario('async/tasks/<id>/comments', 'async-task-comments', {'id': task.pk}),
+        Scenario('async/tasks/<id>/changelog', 'async-task-changelog', {'id': task.pk}),
+
+        Scenario('POST tasks', 'task-list', method='post', data=lambda number: {
+            'title': f'Benchmark task {number}', 'description': 'Benchmark', 'obligation': obligation.pk,
+            'deadline': deadline}),
+        Scenario('PATCH tasks/<id>', 'task-detail', {'pk': open_tasks[0]}, method='patch',
+                 data=lambda number: {'description': f'Benchmark {number}'}),
+        Scenario('POST tasks/<id>/change-status', 'task-change-status', {'pk': open_tasks[0]}, method='post',
+                 data={'status': Task.IN_PROGRESS}),
+        Scenario('PATCH tasks/bulk', 'task-bulk', method='patch', data=lambda number: [
+            {'id': task_id, 'description': f'Benchmark {number}'} for task_id in open_tasks]),
+        Scenario('POST tasks/<id>/comments', 'task-comments', {'id': task.pk}, method='post',
+                 data=lambda number: {'text': f'Benchmark comment {number}'}),
+        Scenario('PATCH users/<id>', 'user-detail', {'pk': user.pk}, method='patch', data={'first_name': 'Benchmark'}),
+        Scenario('POST events/ticket', 'event-ticket', method='post'),
+    ]
+    if responsibility_type is not None:
+        result.append(Scenario('responsibility-types/<id>', 'responsibilitytype-detail', {'pk': responsibility_type.pk}))
+    if product is not None:
+        result.append(Scenario('medicinal-products/<id>', 'medicinalproduct-detail', {'pk': product.pk}))
+    deletion_job = DeletionJob.objects.first()
+    if deletion_job is not None:
+        result.append(Scenario('deletion-jobs/<id>', 'deletionjob-detail', {'pk': deletion_job.pk}))
+    return result
+
+
+class HTTPResponse:
+    streaming = False
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+    def close(self):
+        pass
+
+
+class HTTPClient:
+    """The part of the test client's interface the scenarios use, sending requests to ``base_url``."""
+
+    def __init__(self, base_url, token, timeout=60):
+        self.base_url = base_url
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.timeout = timeout
+
+    def request(self, method, path, data=None):
+        headers = dict(self.headers)
+        if data is not None:
+            data = json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(urljoin(self.base_url, path), data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return HTTPResponse(response.status)
+        except urllib.error.HTTPError as error:
+            error.read()
+            return HTTPResponse(error.code)
+        except OSError:
+            # Refused or timed out: counted as an error.
+            return HTTPResponse(599)
+
+    def get(self, path, data=None, content_type=None):
+        return self.request('GET', path, data)
+
+    def post(self, path, data=None, content_type=None):
+        return self.request('POST', path, data)
+
+    def patch(self, path, data=None, content_type=None):
+        return self.request('PATCH', path, data)
+
+
+def _request(client, scenario, number):
+    queries = 0
+
+    def count(execute, sql, params, many, context):
+        nonlocal queries
+        queries += 1
+        return execute(sql, params, many, context)
+
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(count))
+        start = time.perf_counter()
+        body = scenario.body(number)
+        if body is None:
+            response = getattr(client, scenario.method)(scenario.path)
+        else:
+            response = getattr(client, scenario.method)(scenario.path, body, content_type='application/json')
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        latency = time.perf_counter() - start
+    response.close()
+    return latency, response.status_code, queries
+
+
+def _worker(token, scenario, numbers, base_url=None):
+    if base_url is None:
+        client = Client(raise_request_exception=False, HTTP_AUTHORIZATION=f'Bearer {token}')
+    else:
+        client = HTTPClient(base_url, token)
+    try:
+        return [_request(client, scenario, number) for number in numbers]
+    finally:
+        connections.close_all()
+
+
+def run_scenario(scenario, token, concurrency, requests, base_url=None):
+    """Runs ``requests`` requests of ``scenario`` in ``concurrency`` threads and returns the summary."""
+    numbers = range(requests)
+    with ThreadPoolExecutor(concurrency) as pool:
+        start = time.perf_counter()
+        chunks = pool.map(lambda i: _worker(token, scenario, numbers[i::concurrency], base_url), range(concurrency))
+        results = [result for chunk in chunks for result in chunk]
+        elapsed = time.perf_counter() - start
+
+    latencies = [latency * 1000 for latency, _, _ in results]
+    statuses = Counter(status for _, status, _ in results)
+    queries = [count for _, _, count in results]
+    p50, p95, p99 = percentiles(latencies)
+    return {
+        'endpoint': scenario.label,
+        'url_name': scenario.url_name,
+        'method': scenario.method.upper(),
+        'path': scenario.path,
+        'concurrency': concurrency,
+        'requests': len(results),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'status_codes': {str(status): count for status, count in sorted(statuses.items())},
+        'throughput': len(results) / elapsed if elapsed else 0.0,
+        'latency_ms': {'p50': p50, 'p95': p95, 'p99': p99, 'mean': statistics.fmean(latencies),
+                       'max': max(latencies)},
+        'queries': None if base_url else {'mean': statistics.fmean(queries), 'max': max(queries)},
+    }
+
+
+def run(user, concurrency_levels, requests, read_only=False, only=None, base_url=None, log=lambda result: None):
+    """
+    Runs all scenarios as ``user`` (reads only with ``read_only``, those whose
+    label contains one of ``only`` if given) at each concurrency level, in
+    process or against the server at ``base_url``, and returns the report, or
+    ``None`` if the database has no data to run them on.
+    """
+    selected = scenarios(user)
+    if selected is None:
+        return None
+    covered = {scenario.url_name for scenario in selected}
+    if read_only:
+        selected = [scenario for scenario in selected if not scenario.writes]
+    if only:
+        selected = [scenario for scenario in selected if any(part in scenario.label for part in only)]
+    if base_url:
+        selected = [scenario for scenario in selected if scenario.settings is None]
+    token = str(RefreshToken.for_user(user).access_token)
+    # Worker threads open connections of their own; the data has to be committed.
+    connection.close()
+
+    report = {
+        'started_at': timezone.now().isoformat(),
+        'git_commit': git_commit(),
+        'target': base_url or 'in-process',
+        'database': connection.vendor,
+        'replicas': len(settings.DATABASE_READ_REPLICAS),
+        'data': data_counts(),
+        'options': {'concurrency': list(concurrency_levels), 'requests': requests, 'read_only': read_only,
+                    'endpoints': only, 'base_url': base_url},
+        'not_covered': sorted(endpoint_names() - covered - SKIPPED_ENDPOINTS),
+        'results': [],
+    }
+    for scenario in selected:
+        with override_settings(**scenario.settings or {}):
+            # One untimed request, so that lazy imports and caches do not count.
+            _worker(token, scenario, [requests], base_url)
+            for concurrency in concurrency_levels:
+                result = run_scenario(scenario, token, concurrency, requests, base_url)
+                report['results'].append(result)
+                log(result)
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, previous):
+    """``(endpoint, concurrency, result, previous result)`` for the results present in both reports."""
+    earlier = {(result['endpoint'], result['concurrency']): result for result in previous['results']}
+    for result in report['results']:
+        key = (result['endpoint'], result['concurrency'])
+        if key in earlier:
+            yield (*key, result, earlier[key])
@@ -0,0 +1,68 @@
+"""
+Cached list endpoints for rarely changing reference data.
+
+The serialized list is kept in the ``REFERENCE_DATA_CACHE`` cache together with
+a strong ETag of its JSON. Cache keys carry a per-model generation number that
+is bumped on every save/delete of the model, so a list computed concurrently
+with a change is never stored under the current key. A request whose
+``If-None-Match`` matches gets an empty 304.
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.cache import parse_etags, patch_cache_control, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def _cache():
+    return caches[settings.REFERENCE_DATA_CACHE]
+
+
+def _generation_key(model):
+    return f'api:list-generation:{model._meta.label_lower}'
+
+
+def _generation(model):
+    # Starts from the clock, so that a generation lost to eviction is never reused.
+    return _cache().get_or_set(_generation_key(model), time.time_ns, timeout=None)
+
+
+def invalidate_cached_list(model):
+    try:
+        _cache().incr(_generation_key(model))
+    except ValueError:
+        _generation(model)
+
+
+class CachedListMixin:
+    """
+    Serves ``list`` from the cache with ETag/``If-None-Match`` support. Only for
+    unfiltered, unpaginated lists that do not depend on the user; the model
+    has to be passed to ``invalidate_cached_list`` whenever it changes.
+    """
+
+    def list(self, request, *args, **kwargs):
+        model = self.get_queryset().model
+        key = f'api:list:{model._meta.label_lower}:{_generation(model)}'
+        cached = _cache().get(key)
+        if cached is None:
+            data = self.get_serializer(self.filter_queryset(self.get_queryset()), many=True).data
+            content = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, sort_keys=True)
+            cached = (quote_etag(hashlib.sha256(content.encode()).hexdigest()), list(data))
+            _cache().set(key, cached, settings.REFERENCE_DATA_CACHE_TIMEOUT)
+        etag, data = cached
+
+        if_none_match = parse_etags(request.headers.get('If-None-Match', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(data)
+        response['ETag'] = etag
+        # Browsers keep the list and revalidate it on every use.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
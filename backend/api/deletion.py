@@ -0,0 +1,227 @@
+"""
+Background deletion of PVAs and obligations.
+
+``DELETE`` of a PVA or an obligation does not delete anything in the
+request: it creates a ``DeletionJob`` and returns it with 202, and its
+progress can be followed under ``api/deletion-jobs/<id>/``. The job runs in
+a thread once the request commits (``manage.py run_deletion_jobs`` picks up
+the jobs of a process that died) and deletes bottom-up — comments, tasks,
+obligations, the PVA — ``DELETION_CHUNK_SIZE`` rows per transaction, so no
+transaction holds the database for the whole tree and no more than a chunk
+of ids is loaded at once.
+
+Rows are deleted without being loaded and without signals: the job does what
+the receivers would (task counters, tombstones for delta sync) and, instead
+of one audit entry per row, writes one entry for the deleted object with the
+ids of everything deleted under it in ``additional_data``. A job resumed
+after a crash only lists the rows it deleted itself.
+
+Until the job is done the object stays visible with part of its contents
+gone; another ``DELETE`` of it returns the job already under way.
+"""
+import logging
+import threading
+from collections import defaultdict
+
+from auditlog.cid import get_cid
+from auditlog.diff import model_instance_diff
+from auditlog.models import LogEntry
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.urls import reverse
+from django.utils import timezone
+from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.response import Response
+
+from .audit import build_log_entry
+from .models import PVA, Comment, DeletionJob, Obligation, ReminderLog, Task, TaskSchedule, TaskStats, Tombstone
+from .serializers import DeletionJobSerializer
+from .stats import KEY_FIELDS, apply_stats_changes, stats_key
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = [DeletionJob.PENDING, DeletionJob.RUNNING]
+
+
+def _scope(model, object_id):
+    """Querysets of the rows deleted with the object, children first."""
+    if model is PVA:
+        obligations = Obligation.objects.filter(pva_id=object_id)
+        under = 'obligation__pva_id'
+    else:
+        obligations = Obligation.objects.filter(id=object_id)
+        under = 'obligation_id'
+    querysets = [
+        Comment.objects.filter(**{f'task__{under}': object_id}),
+        Task.objects.filter(**{under: object_id}),
+        obligations,
+    ]
+    if model is PVA:
+        querysets.append(PVA.objects.filter(id=object_id))
+    return querysets
+
+
+def start_deletion(instance, user=None):
+    """
+    Creates the deletion job of ``instance`` (a PVA or an obligation) and runs
+    it after commit. Returns ``(job, created)``; a job already under way is
+    returned instead of starting another.
+    """
+    content_type = ContentType.objects.get_for_model(instance)
+    with transaction.atomic():
+        job = DeletionJob.objects.filter(content_type=content_type, object_id=instance.pk,
+                                         status__in=ACTIVE_STATUSES).first()
+        if job is not None:
+            return job, False
+        job = DeletionJob.objects.create(
+            content_type=content_type,
+            object_id=instance.pk,
+            object_repr=str(instance)[:255],
+            total={queryset.model._meta.label: queryset.count()
+                   for queryset in _scope(type(instance), instance.pk)},
+            requested_by=user,
+        )
+    if settings.DELETION_ASYNC:
+        transaction.on_commit(lambda: threading.Thread(
+            target=_run_in_thread, args=(job.pk,), name=f'deletion-job-{job.pk}', daemon=True,
+        ).start())
+    else:
+        run_job(job.pk)
+        job.refresh_from_db()
+    return job, True
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        connection.close()
+
+
+def run_job(job_id, chunk_size=None):
+    """Runs a pending job; returns whether it was claimed (not taken by another runner)."""
+    now = timezone.now()
+    if not DeletionJob.objects.filter(id=job_id, status=DeletionJob.PENDING).update(
+            status=DeletionJob.RUNNING, started_at=now, updated_at=now):
+        return False
+    job = DeletionJob.objects.select_related('content_type', 'requested_by').get(id=job_id)
+    try:
+        Deletion(job, chunk_size or settings.DELETION_CHUNK_SIZE).run()
+    except Exception as error:
+        logger.exception('Deletion job %s failed', job.pk)
+        DeletionJob.objects.filter(id=job.pk).update(
+            status=DeletionJob.FAILED, error=str(error), updated_at=timezone.now(), finished_at=timezone.now())
+    return True
+
+
+class Deletion:
+    def __init__(self, job, chunk_size):
+        self.job = job
+        self.chunk_size = chunk_size
+        self.model = job.content_type.model_class()
+        # ids of the deleted rows by model label, for the audit entry
+        self.ids = defaultdict(list)
+
+    def run(self):
+        root = self.model.objects.filter(id=self.job.object_id).first()
+        comments, tasks, obligations, *pvas = _scope(self.model, self.job.object_id)
+        self.delete_chunks(comments)
+        self.delete_chunks(tasks, self.before_tasks, self.after_tasks)
+        self.delete_chunks(obligations, self.before_obligations)
+        if pvas:
+            self.delete_chunks(pvas[0], self.before_pvas)
+        with transaction.atomic():
+            self.log(root)
+            now = timezone.now()
+            self.job.status = DeletionJob.DONE
+            self.job.updated_at = self.job.finished_at = now
+            self.job.save(update_fields=['status', 'updated_at', 'finished_at'])
+
+    def delete_chunks(self, queryset, before=None, after=None):
+        while True:
+            with transaction.atomic():
+                # Writing first takes the SQLite write lock up front: a transaction that reads first fails
+                # instead of waiting when it comes to write while another connection is writing.
+                self.job.updated_at = timezone.now()
+                self.job.save(update_fields=['updated_at'])
+                ids = list(queryset.order_by('id').values_list('id', flat=True)[:self.chunk_size])
+                if not ids:
+                    return
+                if before is not None:
+                    before(ids)
+                self.delete_rows(queryset.model, ids)
+                if after is not None:
+                    after(ids)
+                self.job.save(update_fields=['deleted'])
+
+    def delete_rows(self, model, ids):
+        if not ids:
+            return
+        # No collector and no signals: what they would do is done here.
+        queryset = model.objects.filter(id__in=ids)
+        queryset._raw_delete(queryset.db)
+        if model is not PVA:
+            content_type = ContentType.objects.get_for_model(model)
+            Tombstone.objects.bulk_create([Tombstone(content_type=content_type, object_id=pk) for pk in ids])
+        label = model._meta.label
+        self.ids[label] += ids
+        self.job.deleted[label] = self.job.deleted.get(label, 0) + len(ids)
+
+    def before_tasks(self, ids):
+        # Comments added since the comments were deleted.
+        self.delete_rows(Comment, list(Comment.objects.filter(task_id__in=ids).values_list('id', flat=True)))
+        reminders = ReminderLog.objects.filter(task_id__in=ids)
+        reminders._raw_delete(reminders.db)
+        rows = list(Task.objects.filter(id__in=ids).values_list(*KEY_FIELDS, 'schedule_id'))
+        apply_stats_changes([(stats_key(row[:-1]), None) for row in rows])
+        self.schedule_ids = {row[-1] for row in rows if row[-1] is not None}
+
+    def after_tasks(self, ids):
+        TaskSchedule.objects.filter(id__in=self.schedule_ids, tasks__isnull=True).delete()
+
+    def before_obligations(self, ids):
+        # Tasks added since the tasks were deleted.
+        task_ids = list(Task.objects.filter(obligation_id__in=ids).values_list('id', flat=True))
+        if task_ids:
+            self.before_tasks(task_ids)
+            self.delete_rows(Task, task_ids)
+            self.after_tasks(task_ids)
+        stats = TaskStats.objects.filter(obligation_id__in=ids)
+        stats._raw_delete(stats.db)
+
+    def before_pvas(self, ids):
+        links = PVA.medicinal_products.through.objects.filter(pva_id__in=ids)
+        links._raw_delete(links.db)
+
+    def log(self, root):
+        additional_data = {'deleted': dict(self.ids), 'deletion_job': self.job.pk}
+        actor = self.job.requested_by
+        if root is not None:
+            entry = build_log_entry(root, LogEntry.Action.DELETE, model_instance_diff(root, None), actor=actor,
+                                    additional_data=additional_data)
+        else:
+            # Deleted by an earlier, interrupted run of the job.
+            entry = LogEntry(content_type=self.job.content_type, object_pk=str(self.job.object_id),
+                             object_id=self.job.object_id, object_repr=self.job.object_repr,
+                             action=LogEntry.Action.DELETE, changes={}, actor=actor,
+                             additional_data=additional_data, cid=get_cid())
+        LogEntry.objects.bulk_create([entry])
+
+
+def requeue_stale_jobs(stale_after):
+    """Puts running jobs without progress for ``stale_after`` (their process died) back in the queue."""
+    return DeletionJob.objects.filter(
+        status=DeletionJob.RUNNING, updated_at__lt=timezone.now() - stale_after,
+    ).update(status=DeletionJob.PENDING)
+
+
+class BackgroundDestroyMixin:
+    """``DELETE`` starts a ``DeletionJob`` and returns it with 202 (see ``api.deletion``)."""
+
+    @extend_schema(responses={202: DeletionJobSerializer})
+    def destroy(self, request, *args, **kwargs):
+        job, _ = start_deletion(self.get_object(), request.user)
+        return Response(DeletionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': reverse('deletionjob-detail', args=[job.pk])})
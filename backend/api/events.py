@@ -0,0 +1,132 @@
+"""
+Server-sent events about tasks.
+
+``broker`` is an in-process pub/sub: every open ``events/`` stream is an
+``asyncio.Queue`` on the event loop of the ASGI server, and publishing from a
+synchronous view schedules one callback per loop that puts the (already
+encoded) event into each queue of that loop. Idle streams just wait on their
+queue, so they cost no CPU. Events only reach streams served by the same
+process, so the API has to run under ASGI (``freevigilance.asgi``) as a single
+process, or behind a broker replacing this one.
+
+A stream that falls ``EVENTS_QUEUE_SIZE`` events behind is closed; clients
+catch up with ``sync/?since=`` after reconnecting.
+
+``EventSource`` cannot send an ``Authorization`` header, and the JWT must not
+end up in URLs (server logs, proxies, browser history). Clients instead get a
+stream ticket from ``events/ticket/`` and open ``events/?ticket=``: the ticket
+is signed for this purpose only, expires after ``EVENTS_TICKET_MAX_AGE``
+seconds and opens one stream.
+"""
+import asyncio
+import json
+import logging
+import secrets
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+TASK_CREATED = 'task_created'
+TASK_STATUS_CHANGED = 'task_status_changed'
+COMMENT_ADDED = 'comment_added'
+
+_CLOSE = object()
+
+TICKET_SALT = 'api.events.ticket'
+
+
+def issue_ticket(user):
+    return signing.dumps({'user': user.pk, 'nonce': secrets.token_urlsafe(16)}, salt=TICKET_SALT)
+
+
+def redeem_ticket(ticket):
+    """Active user of an unused, unexpired ``ticket``, else ``None``."""
+    try:
+        data = signing.loads(ticket, salt=TICKET_SALT, max_age=settings.EVENTS_TICKET_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    # Kept for as long as the ticket is valid, so it cannot open a second stream.
+    if not caches[settings.EVENTS_TICKET_CACHE].add(f'api:events-ticket:{data["nonce"]}', True,
+                                                    settings.EVENTS_TICKET_MAX_AGE):
+        return None
+    return get_user_model().objects.filter(pk=data['user'], is_active=True).first()
+
+
+def encode_event(event_type, data):
+    return f'event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False, cls=DjangoJSONEncoder)}\n\n'
+
+
+class EventBroker:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)  # event loop -> queues
+
+    def subscribe(self):
+        """Must be called from the event loop that will read the queue."""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers[asyncio.get_running_loop()].add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        with self.lock:
+            for loop, queues in list(self.subscribers.items()):
+                queues.discard(queue)
+                if not queues:
+                    del self.subscribers[loop]
+
+    def publish(self, event_type, data):
+        """Thread-safe; delivers the event to every current subscriber."""
+        message = encode_event(event_type, data)
+        with self.lock:
+            targets = [(loop, list(queues)) for loop, queues in self.subscribers.items()]
+        for loop, queues in targets:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queues, message)
+            except RuntimeError:
+                # The loop is closed: its streams are gone.
+                with self.lock:
+                    self.subscribers.pop(loop, None)
+
+    def _deliver(self, queues, message):
+        for queue in queues:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.unsubscribe(queue)
+                queue.get_nowait()
+                queue.put_nowait(_CLOSE)
+
+    async def stream(self, heartbeat):
+        """Encoded events as they are published, with a comment every ``heartbeat`` seconds of silence."""
+        queue = self.subscribe()
+        try:
+            # Sent right away, so that proxies and clients see the stream is open.
+            yield ': connected\n\n'
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                if message is _CLOSE:
+                    return
+                yield message
+        finally:
+            self.unsubscribe(queue)
+
+
+broker = EventBroker(queue_size=settings.EVENTS_QUEUE_SIZE)
+
+
+def publish_on_commit(event_type, data):
+    transaction.on_commit(lambda: broker.publish(event_type, data))
@@ -0,0 +1,93 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+EXPORT_FORMATS = {
+    CSV: 'text/csv; charset=utf-8',
+    NDJSON: 'application/x-ndjson; charset=utf-8',
+}
+
+
+class _Echo:
+    """File-like object whose write() just hands the line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple)):
+        return '; '.join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value, ensure_ascii=False, cls=DjangoJSONEncoder)
+    return value
+
+
+def iter_rows(queryset, serializer, chunk_size):
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        yield serializer.to_representation(instance)
+
+
+def stream_csv(rows, fields):
+    writer = csv.writer(_Echo())
+    # BOM so that spreadsheet software detects UTF-8 for Cyrillic data.
+    yield '\ufeff' + writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([_csv_value(row.get(field)) for field in fields])
+
+
+def stream_json_array(rows):
+    separator = '['
+    for row in rows:
+        yield separator + json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
+
+
+class ExportMixin:
+    """
+    Adds an ``export/`` action that streams the filtered queryset as CSV or
+    NDJSON, row by row, using the viewset's own queryset, filters and serializer.
+    """
+    export_filename = 'export'
+    export_chunk_size = 2000
+
+    def get_export_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    @extend_schema(
+        parameters=[OpenApiParameter('file_format', str, enum=list(EXPORT_FORMATS), default=CSV)],
+        responses={(200, 'text/csv'): OpenApiTypes.BINARY, (200, 'application/x-ndjson'): OpenApiTypes.BINARY},
+    )
+    @action(detail=False)
+    def export(self, request):
+        file_format = request.query_params.get('file_format', CSV)
+        if file_format not in EXPORT_FORMATS:
+            raise ValidationError({'file_format': f'Неподдерживаемый формат: {file_format}.'})
+
+        serializer = self.get_serializer()
+        rows = iter_rows(self.get_export_queryset(), serializer, self.export_chunk_size)
+        if file_format == CSV:
+            fields = [name for name, field in serializer.fields.items() if not field.write_only]
+            content = stream_csv(rows, fields)
+        else:
+            content = stream_ndjson(rows)
+
+        response = StreamingHttpResponse(content, content_type=EXPORT_FORMATS[file_format])
+        response['Content-Disposition'] = f'attachment; filename="{self.export_filename}.{file_format}"'
+        return response
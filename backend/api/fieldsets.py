@@ -0,0 +1,164 @@
+"""
+Sparse fieldsets: ``?fields=`` and ``?expand=`` on read endpoints.
+
+``?fields=id,title,status`` keeps only the listed output fields.
+``?expand=obligation,schedule`` keeps only the listed expansions of the
+serializer's ``Meta.expandable_fields``, each of which names the fields it
+adds: display fields are dropped when their expansion is not listed and
+nested objects are replaced by their id. Without ``?expand=`` everything is
+expanded, as without the parameters.
+
+When either parameter is given, the queryset is rebuilt from the remaining
+fields: ``select_related`` only follows relations they read,
+``prefetch_related`` only keeps the lookups they need, and ``only()`` loads
+just their columns.
+"""
+import re
+
+from django.core.exceptions import FieldDoesNotExist
+from drf_spectacular.utils import OpenApiParameter
+from rest_framework import serializers
+from rest_framework.exceptions import ValidationError
+
+SPARSE_FIELDSET_PARAMETERS = [
+    OpenApiParameter('fields', str, description='Поля ответа через запятую'),
+    OpenApiParameter('expand', str, description='Раскрываемые связи через запятую'),
+]
+
+_display_re = re.compile(r'^get_(\w+)_display$')
+
+
+def _split(value):
+    return [name for name in (part.strip() for part in value.split(',')) if name]
+
+
+def trim_serializer(serializer, fields=None, expand=None):
+    """Drops and collapses the fields of ``serializer`` (or of its child, for ``many=True``) in place."""
+    child = getattr(serializer, 'child', serializer)
+    expandable = getattr(child.Meta, 'expandable_fields', {})
+    errors = {}
+    if expand is not None:
+        unknown = [name for name in expand if name not in expandable]
+        if unknown:
+            errors['expand'] = f'Неизвестные связи: {", ".join(unknown)}.'
+    if fields is not None:
+        unknown = [name for name in fields if name not in child.fields]
+        if unknown:
+            errors['fields'] = f'Неизвестные поля: {", ".join(unknown)}.'
+    if errors:
+        raise ValidationError(errors)
+
+    if expand is not None:
+        for name, expansion_fields in expandable.items():
+            if name in expand:
+                continue
+            for field_name in expansion_fields:
+                if isinstance(child.fields.get(field_name), serializers.BaseSerializer):
+                    source = child.fields[field_name].source
+                    child.fields[field_name] = serializers.PrimaryKeyRelatedField(
+                        read_only=True, source=None if source == field_name else source)
+                else:
+                    child.fields.pop(field_name, None)
+    if fields is not None:
+        for field_name in list(child.fields):
+            if field_name not in fields:
+                del child.fields[field_name]
+    return serializer
+
+
+def _concrete_columns(model, path):
+    return {'__'.join(path + [field.name]) for field in model._meta.concrete_fields}
+
+
+def query_plan(serializer, model):
+    """``(select_related, prefetch_related, only)`` lookups needed to render the fields of ``serializer``."""
+    child = getattr(serializer, 'child', serializer)
+    select, prefetch, columns = set(), set(), set()
+    for field in child.fields.values():
+        if field.write_only:
+            continue
+        if not field.source_attrs:
+            # ``source='*'``: the whole instance.
+            columns |= _concrete_columns(model, [])
+            continue
+        current, path = model, []
+        for i, attr in enumerate(field.source_attrs):
+            last = i == len(field.source_attrs) - 1
+            try:
+                model_field = current._meta.get_field(attr)
+            except FieldDoesNotExist:
+                match = _display_re.match(attr)
+                if match:
+                    columns.add('__'.join(path + [match.group(1)]))
+                else:
+                    # A method or property: anything may be used.
+                    columns |= _concrete_columns(current, path)
+                break
+            if not model_field.is_relation:
+                columns.add('__'.join(path + [attr]))
+                break
+            lookup = '__'.join(path + [attr])
+            if model_field.many_to_many or model_field.one_to_many:
+                prefetch.add(lookup)
+                break
+            columns.add(lookup)
+            if last:
+                if isinstance(field, serializers.BaseSerializer):
+                    select.add(lookup)
+                    columns |= _concrete_columns(model_field.related_model, path + [attr])
+                elif isinstance(field, serializers.SlugRelatedField):
+                    select.add(lookup)
+                    columns.add(f'{lookup}__{field.slug_field}')
+                break
+            select.add(lookup)
+            current, path = model_field.related_model, path + [attr]
+    return select, prefetch, columns
+
+
+class SparseFieldsetMixin:
+    """
+    ``?fields=``/``?expand=`` support for read requests of a view. Actions
+    outside ``sparse_fieldset_actions`` (all actions when ``None``) ignore them.
+    """
+    sparse_fieldset_actions = None
+
+    def get_sparse_fieldset(self):
+        """``(fields, expand)`` lists, ``None`` for parameters not given; ``None`` if not applicable."""
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return None
+        action = getattr(self, 'action', None)
+        if self.sparse_fieldset_actions is not None and action not in self.sparse_fieldset_actions:
+            return None
+        params = request.query_params
+        if 'fields' not in params and 'expand' not in params:
+            return None
+        fields = _split(params['fields']) if 'fields' in params else None
+        expand = _split(params['expand']) if 'expand' in params else None
+        return fields, expand
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fieldset = self.get_sparse_fieldset()
+        if fieldset is not None:
+            trim_serializer(serializer, *fieldset)
+        return serializer
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        fieldset = self.get_sparse_fieldset()
+        if fieldset is None:
+            return queryset
+        serializer = trim_serializer(super().get_serializer(), *fieldset)
+        select, prefetch, columns = query_plan(serializer, queryset.model)
+        # Keyset pagination reads the ordering fields of the boundary rows.
+        page_ordering = getattr(self.paginator, 'page_ordering', None)
+        ordering = page_ordering(queryset) if page_ordering is not None else ()
+        # Annotations (the search rank) are selected anyway and cannot go into ``only()``.
+        columns.update(name.lstrip('-') for name in ordering if name.lstrip('-') not in queryset.query.annotations)
+        columns.add(queryset.model._meta.pk.name)
+        prefetch = [lookup for lookup in queryset._prefetch_related_lookups
+                    if (lookup if isinstance(lookup, str) else lookup.prefetch_to).split('__')[0] in prefetch]
+        queryset = queryset.select_related(None).prefetch_related(None).prefetch_related(*prefetch).only(*columns)
+        # ``select_related()`` without arguments would follow every foreign key.
+        return queryset.select_related(*select) if select else queryset
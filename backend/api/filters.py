@@ -1,43 +1,75 @@
 from django_filters import rest_framework as filters
-from .models import Task, PVA, Obligation
+from .models import Task, PVA, Obligation, LogEntryWithArchive, normalize_text
+from .search import search
 from auditlog.models import LogEntry
 
-class TaskFilter(filters.FilterSet):
+
+class NormalizedCharFilter(filters.CharFilter):
+    """
+    Case-insensitive text filter over a ``*_normalized`` shadow column: the
+    value is normalized the same way as the column, so a plain
+    ``exact``/``contains`` lookup gives Unicode-aware results.
+
+    Only ``exact`` is an index seek. ``contains`` is ``LIKE '%value%'``,
+    which no index serves: it scans the shadow column, cheaper than folding
+    every row in the query but still linear. Indexed word search is ``?search=``
+    (``api.search``).
+    """
+    def filter(self, qs, value):
+        return super().filter(qs, normalize_text(value) if value else value)
+
+
+class SearchFilterMixin(filters.FilterSet):
+    search = filters.CharFilter(method='filter_search', label='Полнотекстовый поиск')
+
+    def filter_search(self, queryset, name, value):
+        return search(queryset, value)
+
+
+class TaskFilter(SearchFilterMixin):
+    title__icontains = NormalizedCharFilter(field_name='title_normalized', lookup_expr='contains')
+    description__icontains = NormalizedCharFilter(field_name='description_normalized', lookup_expr='contains')
+    assigned_to__last_name__icontains = NormalizedCharFilter(
+        field_name='assigned_to__search_profile__last_name_normalized', lookup_expr='contains')
+    assigned_to__username__iexact = NormalizedCharFilter(field_name='assigned_to__search_profile__username_normalized')
+    created_by__last_name__icontains = NormalizedCharFilter(
+        field_name='created_by__search_profile__last_name_normalized', lookup_expr='contains')
+    obligation__responsibility_type__title__iexact = NormalizedCharFilter(
+        field_name='obligation__responsibility_type__title_normalized')
+
     class Meta:
         model = Task
         fields = {
-            'title': ['icontains'],
             'status': ['exact'],
-            'description': ['icontains'],
             'deadline': ['gte', 'lte'],
             'assigned_to': ['exact'],
-            'assigned_to__last_name': ['icontains'],
-            'assigned_to__username': ['iexact'],
             'created_by': ['exact'],
-            'created_by__last_name': ['icontains'],
             'created_by__username': ['exact'],
             'obligation': ['exact'],
-            'obligation__responsibility_type__title': ['iexact'],
         }
 
-class ObligationFilter(filters.FilterSet):
+class ObligationFilter(SearchFilterMixin):
+    title__icontains = NormalizedCharFilter(field_name='title_normalized', lookup_expr='contains')
+    description__icontains = NormalizedCharFilter(field_name='description_normalized', lookup_expr='contains')
+    responsibility_type__title__iexact = NormalizedCharFilter(field_name='responsibility_type__title_normalized')
+
     class Meta:
         model = Obligation
         fields = {
             'pva': ['exact'],
-            'title': ['icontains'],
-            'description': ['icontains'],
-            'responsibility_type__title': ['iexact'],
+            'is_active': ['exact'],
             'start_date': ['gte', 'lte'],
             'end_date': ['gte', 'lte'],
         }
 
-class PVAFilter(filters.FilterSet):
+class PVAFilter(SearchFilterMixin):
+    requisites__icontains = NormalizedCharFilter(field_name='requisites_normalized', lookup_expr='contains')
+    medicinal_products__title__icontains = NormalizedCharFilter(
+        field_name='medicinal_products__title_normalized', lookup_expr='contains')
+
     class Meta:
         model = PVA
         fields = {
-            'requisites': ['icontains'],
-            'medicinal_products__title': ['icontains'],
             'status': ['exact'],
             'start_date': ['gte', 'lte'],
             'end_date': ['gte', 'lte'],
@@ -45,6 +77,10 @@ class PVAFilter(filters.FilterSet):
         
 
 class LogEntryFilter(filters.FilterSet):
+    actor__username__iexact = NormalizedCharFilter(field_name='actor__search_profile__username_normalized')
+    actor__last_name__icontains = NormalizedCharFilter(
+        field_name='actor__search_profile__last_name_normalized', lookup_expr='contains')
+
     class Meta:
         model = LogEntry
         fields = {
@@ -52,7 +88,10 @@ class LogEntryFilter(filters.FilterSet):
             'object_id': ['exact'],
             'content_type__model': ['exact'],
             'actor': ['exact'],
-            'actor__username': ['iexact'],
-            'actor__last_name': ['icontains'],
             'timestamp': ['gte', 'lte'],
-        }
\ No newline at end of file
+        }
+
+
+class LogEntryWithArchiveFilter(LogEntryFilter):
+    class Meta(LogEntryFilter.Meta):
+        model = LogEntryWithArchive
@@ -0,0 +1,135 @@
+"""
+PVA lifecycle from dates (``manage.py transition_pvas``).
+
+A PVA is ``PLANNED`` before ``start_date``, ``COMPLETED`` after
+``end_date``, ``ENDING`` within ``PVA_ENDING_LEAD_TIME`` of ``end_date`` and
+``ACTIVE`` otherwise; PVAs without the dates that decide it keep their
+status. Rows whose status differs are fixed chunk by chunk, each chunk in
+its own transaction with one ``UPDATE`` computing the status in the
+database and one summary audit entry per transition (ids in
+``additional_data``) instead of one entry per row.
+
+``Obligation.is_active`` is kept in line the same way: false once the
+obligation's ``end_date`` has passed.
+"""
+from collections import defaultdict
+
+from auditlog.cid import get_cid
+from auditlog.models import LogEntry
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Case, CharField, F, Q, Value, When
+from django.utils import timezone
+
+from .models import PVA, Obligation
+
+
+def pva_target_status(today, lead_time=None):
+    """Expression of the status a PVA should have on ``today``; null when its dates do not decide it."""
+    lead_time = settings.PVA_ENDING_LEAD_TIME if lead_time is None else lead_time
+    return Case(
+        When(end_date__lt=today, then=Value(PVA.COMPLETED)),
+        When(start_date__gt=today, then=Value(PVA.PLANNED)),
+        When(end_date__lte=today + lead_time, then=Value(PVA.ENDING)),
+        When(start_date__isnull=False, then=Value(PVA.ACTIVE)),
+        default=Value(None),
+        output_field=CharField(),
+    )
+
+
+def obligation_target_active(today):
+    return Case(When(end_date__lt=today, then=Value(False)), default=Value(True))
+
+
+def pending_pva_transitions(today, lead_time=None):
+    """Queryset of ``(id, status, target)`` rows of PVAs whose status differs from their dates."""
+    return (PVA.objects.annotate(target=pva_target_status(today, lead_time))
+            .filter(target__isnull=False).exclude(status=F('target'))
+            .order_by('id').values_list('id', 'status', 'target'))
+
+
+def pending_obligation_changes(today):
+    return (Obligation.objects.filter(Q(end_date__lt=today, is_active=True) | Q(end_date__gte=today, is_active=False))
+            .order_by('id').values_list('id', 'is_active'))
+
+
+def plan(today, lead_time=None):
+    """
+    What ``apply`` would change: ``({(old status, new status): [PVA ids]},
+    {is_active after: [obligation ids]})``.
+    """
+    transitions = defaultdict(list)
+    for pva_id, status, target in pending_pva_transitions(today, lead_time):
+        transitions[status, target].append(pva_id)
+    obligations = defaultdict(list)
+    for obligation_id, is_active in pending_obligation_changes(today):
+        obligations[not is_active].append(obligation_id)
+    return dict(transitions), dict(obligations)
+
+
+def summary_entry(model, ids, changes, text, actor=None):
+    """One audit entry standing for the same change of all ``ids``."""
+    return LogEntry(
+        content_type=ContentType.objects.get_for_model(model),
+        object_pk='',
+        object_repr=f'{model._meta.verbose_name_plural}: {len(ids)}',
+        action=LogEntry.Action.UPDATE,
+        changes=changes,
+        changes_text=text,
+        additional_data={'ids': ids},
+        actor=actor,
+        cid=get_cid(),
+    )
+
+
+def apply(today, lead_time=None, chunk_size=1000, actor=None):
+    """
+    Moves PVAs to the status of their dates and updates ``Obligation.is_active``.
+    Returns the same mappings as ``plan`` for what was changed.
+    """
+    status_names = dict(PVA.PVA_STATUS_CHOICES)
+    transitions = defaultdict(list)
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            rows = list(pending_pva_transitions(today, lead_time).filter(id__gt=last_id)[:chunk_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            ids = [pva_id for pva_id, _, _ in rows]
+            # Recomputed in the UPDATE, so a row changed meanwhile still gets the status of its dates.
+            PVA.objects.filter(id__in=ids).update(status=pva_target_status(today, lead_time))
+            batch = defaultdict(list)
+            for pva_id, status, target in rows:
+                batch[status, target].append(pva_id)
+            LogEntry.objects.bulk_create([
+                summary_entry(PVA, batch_ids, {'status': [old, new]},
+                              f'Статус по датам договора: {status_names[old]} → {status_names[new]}', actor)
+                for (old, new), batch_ids in batch.items()
+            ])
+        for transition, batch_ids in batch.items():
+            transitions[transition] += batch_ids
+
+    obligations = defaultdict(list)
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            rows = list(pending_obligation_changes(today).filter(id__gt=last_id)[:chunk_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            ids = [obligation_id for obligation_id, _ in rows]
+            Obligation.objects.filter(id__in=ids).update(is_active=obligation_target_active(today),
+                                                         updated_at=timezone.now())
+            batch = defaultdict(list)
+            for obligation_id, is_active in rows:
+                batch[not is_active].append(obligation_id)
+            LogEntry.objects.bulk_create([
+                summary_entry(Obligation, batch_ids, {'is_active': [str(not active), str(active)]},
+                              'Срок обязательства истек' if not active else 'Срок обязательства продлен', actor)
+                for active, batch_ids in batch.items()
+            ])
+        for active, batch_ids in batch.items():
+            obligations[active] += batch_ids
+    return dict(transitions), dict(obligations)
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from api.archive import archive_log_entries, export_archive_tables
+
+
+class Command(BaseCommand):
+    help = ('Moves audit log entries older than AUDITLOG_HOT_RETENTION to monthly archive tables and exports '
+            'archive tables older than AUDITLOG_ARCHIVE_RETENTION to files. Meant to be run daily.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument('--keep-snapshots', action='store_true',
+                            help='Keeps serialized_data of archived entries.')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        moved = archive_log_entries(now - settings.AUDITLOG_HOT_RETENTION, chunk_size=options['chunk_size'],
+                                    keep_snapshots=options['keep_snapshots'], using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {moved} audit log entries.'))
+
+        if settings.AUDITLOG_ARCHIVE_RETENTION is not None:
+            exported = export_archive_tables(now - settings.AUDITLOG_ARCHIVE_RETENTION,
+                                             settings.AUDITLOG_ARCHIVE_EXPORT_DIR, using=options['database'])
+            for path in exported:
+                self.stdout.write(f'Exported {path}')
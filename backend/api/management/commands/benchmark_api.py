@@ -0,0 +1,112 @@
+import json
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from api.benchmark import compare, run, temporary_user
+from api.models import User
+
+
+class Command(BaseCommand):
+    help = ('Load-tests every endpoint of the API in-process at several concurrency levels and reports p50/p95/p99 '
+            'latency, throughput and SQL queries per request. Results are saved as JSON and can be compared '
+            'with an earlier run, e.g. of --base-url against the WSGI and then the ASGI server. Write scenarios '
+            'change data: run it on a seeded copy (see seed_data).')
+
+    def add_arguments(self, parser):
+        user = parser.add_mutually_exclusive_group(required=True)
+        user.add_argument('--user', metavar='USERNAME',
+                          help='Existing user to send the requests as; staff for the metrics and profile endpoints.')
+        user.add_argument('--temporary-user', action='store_true',
+                          help='Creates a staff user for the run and deletes it, with what it created, afterwards.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint and concurrency level.')
+        parser.add_argument('--read-only', action='store_true', help='Skips the scenarios that write.')
+        parser.add_argument('--endpoints', nargs='+', metavar='LABEL',
+                            help='Runs only the scenarios whose label contains one of these, e.g. tasks auditlog.')
+        parser.add_argument('--base-url', metavar='URL',
+                            help='Sends the requests to a running server using this database, e.g. '
+                                 'http://127.0.0.1:8001/, instead of in-process. SQL queries are not counted.')
+        parser.add_argument('--output', help='JSON file for the results (benchmark_results/<time>.json by default).')
+        parser.add_argument('--compare', metavar='JSON', help='Results of an earlier run to compare with.')
+
+    def handle(self, *args, **options):
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as file:
+                    previous = json.load(file)
+            except (OSError, ValueError) as error:
+                raise CommandError(f'Cannot read {options["compare"]}: {error}')
+
+        self.stdout.write(f'{"endpoint":<36}{"clients":>8}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+                          f'{"queries":>9}{"errors":>8}')
+        # Failed requests are counted in the results; their log records would bury the table.
+        request_logger = logging.getLogger('django.request')
+        request_logger.disabled = True
+        try:
+            with self.user(options) as user:
+                report = run(user, options['concurrency'], options['requests'], read_only=options['read_only'],
+                             only=options['endpoints'], base_url=options['base_url'], log=self.write_result)
+        finally:
+            request_logger.disabled = False
+        if report is None:
+            raise CommandError('No tasks, obligations or PVAs to run the benchmark on; run seed_data first.')
+        if report['not_covered']:
+            self.stdout.write(self.style.WARNING(f'Endpoints without scenarios: {", ".join(report["not_covered"])}'))
+
+        if options['output']:
+            path = options['output']
+        else:
+            directory = settings.BASE_DIR / 'benchmark_results'
+            directory.mkdir(exist_ok=True)
+            path = directory / f'{timezone.now():%Y%m%d-%H%M%S}.json'
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2, cls=DjangoJSONEncoder)
+        self.stdout.write(self.style.SUCCESS(f'Saved results to {path}'))
+
+        if previous is not None:
+            self.stdout.write(f'Compared with {options["compare"]} ({previous.get("git_commit") or "unknown commit"}):')
+            self.stdout.write(f'{"endpoint":<36}{"clients":>8}{"req/s":>16}{"p95 ms":>16}{"queries":>12}')
+            for endpoint, concurrency, result, earlier in compare(report, previous):
+                self.stdout.write(
+                    f'{endpoint[:35]:<36}{concurrency:>8}'
+                    f'{self.change(earlier["throughput"], result["throughput"]):>16}'
+                    f'{self.change(earlier["latency_ms"]["p95"], result["latency_ms"]["p95"]):>16}'
+                    f'{self.queries(earlier):>5} →{self.queries(result):>5}'
+                )
+
+    @staticmethod
+    @contextmanager
+    def user(options):
+        if options['temporary_user']:
+            with temporary_user() as user:
+                yield user
+            return
+        try:
+            user = User.objects.get(username=options['user'], is_active=True)
+        except User.DoesNotExist:
+            raise CommandError(f'No active user {options["user"]!r}.')
+        yield user
+
+    def write_result(self, result):
+        label = result['endpoint']
+        latency = result['latency_ms']
+        self.stdout.write(
+            f'{label[:35]:<36}{result["concurrency"]:>8}{result["throughput"]:>10.1f}{latency["p50"]:>10.1f}'
+            f'{latency["p95"]:>10.1f}{latency["p99"]:>10.1f}{self.queries(result):>9}{result["errors"]:>8}'
+        )
+
+    @staticmethod
+    def queries(result):
+        # Not counted for runs against a server.
+        return '-' if result['queries'] is None else f'{result["queries"]["mean"]:.1f}'
+
+    @staticmethod
+    def change(before, after):
+        percent = (after - before) / before * 100 if before else 0.0
+        return f'{after:.1f} ({percent:+.0f}%)'
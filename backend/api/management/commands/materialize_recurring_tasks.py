@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.services import materialize_recurring_tasks
+
+
+class Command(BaseCommand):
+    help = 'Creates iterations of recurring tasks up to the configured horizon. Meant to be run daily.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon-days', type=int, help='Overrides RECURRING_TASKS_HORIZON.')
+
+    def handle(self, *args, **options):
+        horizon = options['horizon_days']
+        created = materialize_recurring_tasks(horizon=timedelta(days=horizon) if horizon is not None else None)
+        self.stdout.write(self.style.SUCCESS(f'Created {len(created)} task iterations.'))
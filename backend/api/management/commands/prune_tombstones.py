@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Deletes records of deleted objects older than SYNC_TOMBSTONE_RETENTION. Meant to be run daily.'
+
+    def handle(self, *args, **options):
+        pruned = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f'Pruned {pruned} tombstones.'))
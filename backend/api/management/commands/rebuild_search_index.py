@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from api.search import install_search_indexes, rebuild_search_indexes
+
+
+class Command(BaseCommand):
+    help = 'Installs the full-text search indexes if missing and rebuilds them from the source tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        install_search_indexes(using=options['database'])
+        rebuild_search_indexes(using=options['database'])
+        self.stdout.write(self.style.SUCCESS('Search indexes rebuilt.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.stats import rebuild_task_stats
+
+
+class Command(BaseCommand):
+    help = 'Recounts the task dashboard counters from the tasks table.'
+
+    def handle(self, *args, **options):
+        rebuild_task_stats()
+        self.stdout.write(self.style.SUCCESS('Task stats rebuilt.'))
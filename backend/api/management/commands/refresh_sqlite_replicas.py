@@ -0,0 +1,28 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Overwrites the SQLite read replicas (DATABASE_REPLICAS) with a consistent copy of the primary '
+            'SQLite database. Run periodically to try replica routing locally; the interval is the replication lag.')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('The primary database is not SQLite.')
+        primary.ensure_connection()
+        for alias in settings.DATABASE_READ_REPLICAS:
+            replica = connections[alias]
+            if replica.vendor != 'sqlite':
+                self.stdout.write(f'Skipped {alias}: not SQLite.')
+                continue
+            replica.close()
+            target = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f'Copied the primary database to {alias}.'))
@@ -0,0 +1,40 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+
+from api.reminders import ReminderWorker
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Sends assignees a digest email of their tasks whose deadlines are REMINDER_OFFSETS away. '
+            'Runs until stopped; one worker is enough, several do not send a reminder twice.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=settings.REMINDER_POLL_INTERVAL,
+                            help='Seconds between polls.')
+        parser.add_argument('--once', action='store_true',
+                            help='Sends the reminders due now (and missed within REMINDER_CATCH_UP) and exits.')
+
+    def handle(self, *args, **options):
+        worker = ReminderWorker()
+        while True:
+            started = time.monotonic()
+            close_old_connections()
+            try:
+                digests = worker.poll()
+            except DatabaseError:
+                logger.exception('Reminder poll failed')
+            else:
+                if digests:
+                    self.stdout.write(f'Sent {digests} reminder digests.')
+            if options['once']:
+                break
+            try:
+                time.sleep(max(0.0, options['interval'] - (time.monotonic() - started)))
+            except KeyboardInterrupt:
+                break
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.deletion import requeue_stale_jobs, run_job
+from api.models import DeletionJob
+
+
+class Command(BaseCommand):
+    help = ('Runs the queued deletions of PVAs and obligations, and those left unfinished by a process that '
+            'died. They normally run in the process that accepted the DELETE request.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale-after', type=int, default=10,
+                            help='Minutes without progress after which a running job is taken over.')
+        parser.add_argument('--chunk-size', type=int, default=settings.DELETION_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(timedelta(minutes=options['stale_after']))
+        if requeued:
+            self.stdout.write(f'Resuming {requeued} interrupted jobs.')
+        job_ids = DeletionJob.objects.filter(status=DeletionJob.PENDING).order_by('created_at').values_list('id', flat=True)
+        for job_id in list(job_ids):
+            if not run_job(job_id, options['chunk_size']):
+                continue
+            job = DeletionJob.objects.get(id=job_id)
+            self.stdout.write(f'Job {job.pk} ({job.object_repr}): {job.status}, deleted {job.deleted}'
+                              + (f', error: {job.error}' if job.error else ''))
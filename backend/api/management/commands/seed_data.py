@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from api.seeding import seed
+
+
+class Command(BaseCommand):
+    help = ('Fills the database with synthetic PVAs, obligations, tasks (recurring ones included), comments and '
+            'audit entries for load testing (see benchmark_api). Can be run repeatedly.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--products', type=int, default=50)
+        parser.add_argument('--pvas', type=int, default=20)
+        parser.add_argument('--obligations-per-pva', type=int, default=5)
+        parser.add_argument('--tasks-per-obligation', type=int, default=20)
+        parser.add_argument('--recurring-share', type=float, default=0.1,
+                            help='Share of tasks that are recurring; their iterations are created as well.')
+        parser.add_argument('--comments-per-task', type=int, default=2, help='Average number of comments per task.')
+        parser.add_argument('--audit-entries-per-task', type=int, default=3)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, help='Random seed, for reproducible data.')
+
+    def handle(self, *args, **options):
+        created = seed(
+            users=options['users'], products=options['products'], pvas=options['pvas'],
+            obligations_per_pva=options['obligations_per_pva'], tasks_per_obligation=options['tasks_per_obligation'],
+            recurring_share=options['recurring_share'], comments_per_task=options['comments_per_task'],
+            audit_entries_per_task=options['audit_entries_per_task'], batch_size=options['batch_size'],
+            random_seed=options['seed'], log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Created ' + ', '.join(f'{count} {name}' for name, count in created.items()) + '.'))
@@ -0,0 +1,42 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api import lifecycle
+
+
+class Command(BaseCommand):
+    help = ('Moves PVAs to the status their start and end dates give (PLANNED, ACTIVE, ENDING, COMPLETED) and '
+            'marks obligations past their end date as inactive. Meant to be run daily.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Reports the changes without making them.')
+        parser.add_argument('--ending-lead-days', type=int,
+                            help='Days before end_date a PVA is ENDING (PVA_ENDING_LEAD_TIME by default).')
+        parser.add_argument('--date', type=date.fromisoformat, help='Day to compute statuses for (today by default).')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        today = options['date'] or timezone.localdate()
+        lead_time = timedelta(days=options['ending_lead_days']) if options['ending_lead_days'] is not None else None
+        if options['dry_run']:
+            transitions, obligations = lifecycle.plan(today, lead_time)
+        else:
+            transitions, obligations = lifecycle.apply(today, lead_time, chunk_size=options['chunk_size'])
+
+        verb = 'Would move' if options['dry_run'] else 'Moved'
+        for (old, new), ids in sorted(transitions.items()):
+            self.stdout.write(f'{verb} {len(ids)} PVAs from {old} to {new}'
+                              + (f': {self.format_ids(ids)}' if options['verbosity'] > 1 else ''))
+        for active, ids in sorted(obligations.items()):
+            self.stdout.write(f'{verb} {len(ids)} obligations to {"active" if active else "inactive"}'
+                              + (f': {self.format_ids(ids)}' if options['verbosity'] > 1 else ''))
+        if not transitions and not obligations:
+            self.stdout.write('Nothing to change.')
+        elif not options['dry_run']:
+            self.stdout.write(self.style.SUCCESS('Done.'))
+
+    @staticmethod
+    def format_ids(ids):
+        return ', '.join(map(str, ids))
@@ -0,0 +1,161 @@
+"""
+Per-route request metrics in the Prometheus text format (``api/metrics/``).
+
+``api.middleware.MetricsMiddleware`` times every request and every query it
+runs (a wrapper put on each database connection when it opens, counting only
+while a request is being measured) and records, per route and method:
+latency, SQL queries and DB time per request, response size and status
+codes. The route is ``<ViewSet>.<action>`` for viewsets (``TaskViewSet.my``)
+and the URL name otherwise (``obligation-tasks``). Streamed responses are
+recorded when the stream ends, with the queries made while streaming. DB
+time covers executing the queries, not fetching the rows of chunked cursors.
+
+The metrics are kept in memory per process: with several worker processes
+each scrape sees the process that served it.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.size = 0
+
+
+current_request = ContextVar('current_request_metrics', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current_request.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - start
+        metrics.queries += 1
+
+
+def instrument_connection(sender, connection, **kwargs):
+    # The wrapper object outlives its connections, and this runs on every reconnect.
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def install():
+    from django.db.backends.signals import connection_created
+    connection_created.connect(instrument_connection, dispatch_uid='api.metrics')
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_time = Histogram(DB_TIME_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.statuses = {}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = Lock()
+        self.routes = {}
+
+    def record(self, route, method, status, metrics):
+        latency = time.perf_counter() - metrics.start
+        with self.lock:
+            route_metrics = self.routes.get((route, method))
+            if route_metrics is None:
+                route_metrics = self.routes[route, method] = RouteMetrics()
+            route_metrics.latency.observe(latency)
+            route_metrics.queries.observe(metrics.queries)
+            route_metrics.db_time.observe(metrics.db_time)
+            route_metrics.size.observe(metrics.size)
+            route_metrics.statuses[status] = route_metrics.statuses.get(status, 0) + 1
+
+    def render(self):
+        with self.lock:
+            routes = sorted(self.routes.items())
+            lines = []
+            for name, attr, help_text in (
+                    ('request_duration_seconds', 'latency', 'Request latency.'),
+                    ('request_db_queries', 'queries', 'SQL queries per request.'),
+                    ('request_db_duration_seconds', 'db_time', 'Time spent in SQL queries per request.'),
+                    ('response_size_bytes', 'size', 'Response body size.')):
+                lines += [f'# HELP freevigilance_{name} {help_text}', f'# TYPE freevigilance_{name} histogram']
+                for (route, method), route_metrics in routes:
+                    histogram = getattr(route_metrics, attr)
+                    labels = f'route="{_escape(route)}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                        cumulative += count
+                        lines.append(f'freevigilance_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'freevigilance_{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'freevigilance_{name}_count{{{labels}}} {cumulative}')
+            lines += ['# HELP freevigilance_requests_total Requests by response status.',
+                      '# TYPE freevigilance_requests_total counter']
+            for (route, method), route_metrics in routes:
+                for status, count in sorted(route_metrics.statuses.items()):
+                    lines.append(f'freevigilance_requests_total{{route="{_escape(route)}",method="{method}",'
+                                 f'status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED_ROUTE
+    actions = getattr(match.func, 'actions', None)
+    if actions is not None:
+        action = actions.get(request.method.lower(), request.method.lower())
+        return f'{match.func.cls.__name__}.{action}'
+    return match.url_name or match.route
+
+
+def measured_stream(content, metrics, finish):
+    """``content`` of a streamed response, counting its size and queries; calls ``finish`` at the end."""
+    iterator = iter(content)
+    try:
+        while True:
+            token = current_request.set(metrics)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                current_request.reset(token)
+            metrics.size += len(chunk)
+            yield chunk
+    finally:
+        finish()
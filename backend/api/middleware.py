@@ -1,15 +1,163 @@
+from asgiref.sync import async_to_sync, iscoroutinefunction, markcoroutinefunction, sync_to_async
 from auditlog.context import set_actor
 from auditlog.middleware import AuditlogMiddleware as _AuditlogMiddleware
 from django.utils.functional import SimpleLazyObject
 
+from .audit_writer import audit_actor
+from .metrics import RequestMetrics, current_request, measured_stream, registry, route_name
+from .profiling import profile_request, profiling_requested, staff_user
+from .routers import RoutingState, mark_wrote, routed_stream, routing_state
+
+
+class AsyncCapableMiddleware:
+    """
+    Middleware that runs in the mode of the chain it is in, like Django's own:
+    under ASGI ``__acall__`` awaits the next handler, so the async views are
+    not pushed through a thread and back by each middleware on the way.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+
+class AuditlogMiddleware(AsyncCapableMiddleware, _AuditlogMiddleware):
+    def __init__(self, get_response):
+        _AuditlogMiddleware.__init__(self, get_response)
+        super().__init__(get_response)
 
-class AuditlogMiddleware(_AuditlogMiddleware):
     def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        context, token = self._set_actor(request)
+        try:
+            with context:
+                return self.get_response(request)
+        finally:
+            audit_actor.reset(token)
+
+    async def __acall__(self, request):
+        context, token = self._set_actor(request)
+        try:
+            with context:
+                return await self.get_response(request)
+        finally:
+            audit_actor.reset(token)
+
+    def _set_actor(self, request):
         remote_addr = self._get_remote_addr(request)
 
         user = SimpleLazyObject(lambda: getattr(request, "user", None))
 
-        context = set_actor(actor=user, remote_addr=remote_addr)
+        return set_actor(actor=user, remote_addr=remote_addr), audit_actor.set(user)
+
+
+class ReplicaRoutingMiddleware(AsyncCapableMiddleware):
+    """Per-request state of ``api.routers``; remembers users who wrote for read-your-writes."""
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = RoutingState()
+        token = routing_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routing_state.reset(token)
+
+        finish = self._finish(request, state)
+        if response.streaming and not response.is_async:
+            response.streaming_content = routed_stream(response.streaming_content, state, finish)
+        else:
+            # Async streams (events) do not use the database.
+            finish()
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = routing_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            routing_state.reset(token)
+
+        finish = self._finish(request, state)
+        if response.streaming and not response.is_async:
+            response.streaming_content = routed_stream(response.streaming_content, state, finish)
+        elif state.wrote:
+            # The user may still be the lazy one of the session and the cache may be the database.
+            await sync_to_async(finish)()
+        return response
+
+    @staticmethod
+    def _finish(request, state):
+        def finish():
+            if state.wrote:
+                # Set by DRF once it has authenticated the request.
+                mark_wrote(getattr(request, 'user', None))
+        return finish
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """Records the latency, SQL queries and response size of each request in ``api.metrics.registry``."""
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self._record(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self._record(request, response, metrics)
+
+    @staticmethod
+    def _record(request, response, metrics):
+        def finish():
+            registry.record(route_name(request), request.method, response.status_code, metrics)
+
+        if not response.streaming:
+            metrics.size = len(response.content)
+            finish()
+        elif response.is_async:
+            # Event streams never end; recorded as soon as they start.
+            finish()
+        else:
+            response.streaming_content = measured_stream(response.streaming_content, metrics, finish)
+        return response
+
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    """Profiles requests of staff users that ask for it (see ``api.profiling``)."""
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if profiling_requested(request):
+            user = staff_user(request)
+            if user is not None:
+                return profile_request(self.get_response, request, user)
+        return self.get_response(request)
 
-        with context:
-            return self.get_response(request)
\ No newline at end of file
+    async def __acall__(self, request):
+        if profiling_requested(request):
+            user = await sync_to_async(staff_user)(request)
+            if user is not None:
+                # cProfile and the query wrapper only see their own thread: a profiled request is
+                # served from the worker thread that the database work of its view runs in too.
+                return await sync_to_async(profile_request)(async_to_sync(self.get_response), request, user)
+        return await self.get_response(request)
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.6 on 2026-10-18 12:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_alter_comment_options_alter_medicinalproduct_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['deadline', 'id'], name='api_task_deadlin_e47aab_idx'),
+        ),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+NORMALIZED_FIELDS = {
+    'responsibilitytype': ('title',),
+    'medicinalproduct': ('title',),
+    'pva': ('requisites', 'description'),
+    'obligation': ('title', 'description'),
+    'task': ('title', 'description'),
+}
+
+
+def normalize_text(value):
+    return value.casefold().replace('ё', 'е') if value else ''
+
+
+def fill_normalized_fields(apps, schema_editor):
+    for model_name, fields in NORMALIZED_FIELDS.items():
+        model = apps.get_model('api', model_name)
+        batch = []
+        for obj in model.objects.only('pk', *fields).iterator(chunk_size=1000):
+            for name in fields:
+                setattr(obj, f'{name}_normalized', normalize_text(getattr(obj, name)))
+            batch.append(obj)
+            if len(batch) == 1000:
+                model.objects.bulk_update(batch, [f'{name}_normalized' for name in fields])
+                batch = []
+        model.objects.bulk_update(batch, [f'{name}_normalized' for name in fields])
+
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    UserSearchProfile = apps.get_model('api', 'UserSearchProfile')
+    UserSearchProfile.objects.bulk_create([
+        UserSearchProfile(user_id=user.pk,
+                          username_normalized=normalize_text(user.username),
+                          last_name_normalized=normalize_text(user.last_name))
+        for user in User.objects.only('pk', 'username', 'last_name').iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_task_deadline_id_idx'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchProfile',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_profile', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('username_normalized', models.CharField(db_index=True, max_length=150)),
+                ('last_name_normalized', models.CharField(db_index=True, max_length=150)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='medicinalproduct',
+            name='title_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='obligation',
+            name='description_normalized',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='obligation',
+            name='title_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='pva',
+            name='description_normalized',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='pva',
+            name='requisites_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='responsibilitytype',
+            name='title_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='description_normalized',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='title_normalized',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_normalized_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_normalized_text_columns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LogEntryWithArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_pk', models.CharField(max_length=255)),
+                ('object_id', models.BigIntegerField(blank=True, null=True)),
+                ('object_repr', models.TextField()),
+                ('serialized_data', models.JSONField(null=True)),
+                ('action', models.PositiveSmallIntegerField(choices=[(0, 'create'), (1, 'update'), (2, 'delete'), (3, 'access')])),
+                ('changes_text', models.TextField(blank=True)),
+                ('changes', models.JSONField(null=True)),
+                ('cid', models.CharField(max_length=255, null=True)),
+                ('remote_addr', models.GenericIPAddressField(null=True)),
+                ('timestamp', models.DateTimeField()),
+                ('additional_data', models.JSONField(null=True)),
+            ],
+            options={
+                'db_table': 'api_logentry_with_archive',
+                'managed': False,
+            },
+        ),
+    ]
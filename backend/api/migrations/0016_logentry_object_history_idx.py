@@ -0,0 +1,21 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Covering index for per-object history (``content_type``, ``object_id``,
+    newest first) on auditlog's table, which this project does not own.
+    """
+
+    dependencies = [
+        ('api', '0015_logentry_with_archive'),
+        ('auditlog', '0015_alter_logentry_changes'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS auditlog_logentry_object_history_idx '
+            'ON auditlog_logentry (content_type_id, object_id, timestamp, id)',
+            'DROP INDEX IF EXISTS auditlog_logentry_object_history_idx',
+        ),
+    ]
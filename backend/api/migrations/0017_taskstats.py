@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, DateField
+from django.db.models.functions import TruncMonth
+
+
+def fill_task_stats(apps, schema_editor):
+    Task = apps.get_model('api', 'Task')
+    TaskStats = apps.get_model('api', 'TaskStats')
+    groups = (
+        Task.objects
+        .annotate(deadline_month=TruncMonth('deadline', output_field=DateField()))
+        .values('status', 'assigned_to_id', 'obligation_id', 'deadline_month')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    TaskStats.objects.bulk_create((TaskStats(**group) for group in groups.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_logentry_object_history_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('NOT_STARTED', 'Не начата'), ('IN_PROGRESS', 'В работе'), ('COMPLETED', 'Завершена'), ('HIDDEN', 'Скрыта')], max_length=20)),
+                ('deadline_month', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('assigned_to', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('obligation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.obligation')),
+            ],
+            options={
+                'verbose_name': 'Статистика задач',
+                'verbose_name_plural': 'Статистика задач',
+                'constraints': [models.UniqueConstraint(fields=('status', 'assigned_to', 'obligation', 'deadline_month'), name='api_taskstats_key')],
+            },
+        ),
+        migrations.RunPython(fill_task_stats, migrations.RunPython.noop),
+    ]
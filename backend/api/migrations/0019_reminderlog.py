@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_updated_at_and_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('offset_minutes', models.PositiveIntegerField()),
+                ('deadline', models.DateTimeField()),
+                ('sent_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.task')),
+            ],
+            options={
+                'verbose_name': 'Напоминание',
+                'verbose_name_plural': 'Напоминания',
+                'constraints': [models.UniqueConstraint(fields=('task', 'offset_minutes', 'deadline'), name='api_reminderlog_key')],
+            },
+        ),
+    ]
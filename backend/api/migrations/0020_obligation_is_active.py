@@ -0,0 +1,25 @@
+# Generated by Django 5.1.6 on 2026-10-18 13:41
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_is_active(apps, schema_editor):
+    Obligation = apps.get_model('api', 'Obligation')
+    Obligation.objects.filter(end_date__lt=timezone.localdate()).update(is_active=False, updated_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_reminderlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='obligation',
+            name='is_active',
+            field=models.BooleanField(db_index=True, default=True),
+        ),
+        migrations.RunPython(fill_is_active, migrations.RunPython.noop),
+    ]
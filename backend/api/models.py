@@ -1,10 +1,98 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 from auditlog.registry import auditlog
-from auditlog.models import AuditlogHistoryField
+from auditlog.models import AuditlogHistoryField, LogEntry
+from django.contrib.contenttypes.models import ContentType
 
-class ResponsibilityType(models.Model):
+
+def normalize_text(value):
+    """
+    Case-insensitive form of Russian text: full Unicode case folding (SQLite's
+    own is ASCII-only) and ё folded to е.
+    """
+    return value.casefold().replace('ё', 'е') if value else ''
+
+
+class NormalizedFieldsMixin(models.Model):
+    """
+    Keeps ``<field>_normalized`` shadow columns, listed in ``normalized_fields``,
+    in sync with their source fields on ``save()``. Bulk operations have to
+    call ``normalize_fields()`` themselves.
+    """
+    normalized_fields = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def with_normalized_fields(cls, fields):
+        fields = set(fields)
+        return fields | {f'{name}_normalized' for name in cls.normalized_fields if name in fields}
+
+    def normalize_fields(self):
+        for name in self.normalized_fields:
+            setattr(self, f'{name}_normalized', normalize_text(getattr(self, name)))
+
+    def save(self, *args, **kwargs):
+        self.normalize_fields()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = self.with_normalized_fields(kwargs['update_fields'])
+        super().save(*args, **kwargs)
+
+
+class UpdatedAtMixin(models.Model):
+    """
+    ``updated_at`` change watermark for delta sync. ``save(update_fields=...)``
+    includes it; bulk updates and ``QuerySet.update()`` have to set it themselves.
+    """
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'updated_at'}
+        super().save(*args, **kwargs)
+
+
+class Tombstone(models.Model):
+    """Deleted object, reported to delta sync clients (see ``api.sync``)."""
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['content_type', 'deleted_at'])]
+
+
+class UserSearchProfile(models.Model):
+    """Normalized copies of the ``User`` fields used in filters."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='search_profile')
+    username_normalized = models.CharField(max_length=150, db_index=True)
+    last_name_normalized = models.CharField(max_length=150, db_index=True)
+
+    # The ``User`` fields copied here.
+    source_fields = frozenset({'username', 'last_name'})
+
+    @classmethod
+    def sync(cls, user, created=False):
+        """Copies the fields of ``user``; an existing profile is only written if they changed."""
+        values = {
+            'username_normalized': normalize_text(user.username),
+            'last_name_normalized': normalize_text(user.last_name),
+        }
+        if created:
+            cls.objects.update_or_create(user=user, defaults=values)
+        else:
+            cls.objects.filter(user=user).exclude(**values).update(**values)
+
+
+class ResponsibilityType(NormalizedFieldsMixin):
+    normalized_fields = ('title',)
     title = models.CharField(max_length=255, unique=True)
+    title_normalized = models.CharField(max_length=255, db_index=True, editable=False, default='')
 
     def __str__(self) -> str:
         return f"{self._meta.verbose_name} #{self.pk}"
@@ -13,9 +101,11 @@ class ResponsibilityType(models.Model):
         verbose_name = "Тип обязательства"
         verbose_name_plural = "Типы обязательств"
 
-class MedicinalProduct(models.Model):
+class MedicinalProduct(NormalizedFieldsMixin):
+    normalized_fields = ('title',)
     title = models.CharField(max_length=255, unique=True)
     description = models.TextField(blank=True)
+    title_normalized = models.CharField(max_length=255, db_index=True, editable=False, default='')
     
     def __str__(self) -> str:
         return f"{self._meta.verbose_name} #{self.pk}"
@@ -24,7 +114,7 @@ class MedicinalProduct(models.Model):
         verbose_name = "Лекарственный препарат"
         verbose_name_plural = "Лекарственные препараты"
 
-class PVA(models.Model):
+class PVA(NormalizedFieldsMixin):
     PLANNED = "PLANNED"
     ACTIVE = "ACTIVE"
     ENDING = "ENDING"
@@ -35,6 +125,7 @@ class PVA(models.Model):
         (ENDING, "Завершающийся"),
         (COMPLETED, "Завершен")
     ]
+    normalized_fields = ('requisites', 'description')
     requisites = models.CharField(max_length=500)
     medicinal_products = models.ManyToManyField(MedicinalProduct)
     description = models.TextField(blank=True)
@@ -43,6 +134,8 @@ class PVA(models.Model):
     status = models.CharField(choices=PVA_STATUS_CHOICES, default=PLANNED, max_length=20)
     start_date = models.DateField(blank=True, null=True)
     end_date = models.DateField(blank=True, null=True)
+    requisites_normalized = models.CharField(max_length=500, db_index=True, editable=False, default='')
+    description_normalized = models.TextField(editable=False, default='')
 
     def __str__(self) -> str:
         return f"{self._meta.verbose_name} #{self.pk}"
@@ -52,13 +145,18 @@ class PVA(models.Model):
         verbose_name_plural = "Договоры"
 
 
-class Obligation(models.Model):
+class Obligation(NormalizedFieldsMixin, UpdatedAtMixin):
+    normalized_fields = ('title', 'description')
     pva = models.ForeignKey(PVA, on_delete=models.CASCADE)
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     start_date = models.DateField()
     end_date = models.DateField()
     responsibility_type = models.ForeignKey(ResponsibilityType, on_delete=models.SET_NULL, null=True, blank=True)
+    # false once end_date has passed; maintained by the transition_pvas command
+    is_active = models.BooleanField(default=True, db_index=True)
+    title_normalized = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    description_normalized = models.TextField(editable=False, default='')
 
     def __str__(self) -> str:
         return f"{self._meta.verbose_name} #{self.pk}"
@@ -98,7 +196,7 @@ class TaskSchedule(models.Model):
         verbose_name = "Расписание"
         verbose_name_plural = "Расписания"
 
-class Task(models.Model):
+class Task(NormalizedFieldsMixin, UpdatedAtMixin):
     NOT_STARTED = "NOT_STARTED"
     IN_PROGRESS = "IN_PROGRESS"
     COMPLETED = "COMPLETED"
@@ -109,6 +207,7 @@ class Task(models.Model):
         (COMPLETED, "Завершена"),
         (HIDDEN, "Скрыта")
     ]
+    normalized_fields = ('title', 'description')
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_tasks')
     assigned_to = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='assigned_tasks', blank=True, null=True)
     schedule = models.ForeignKey(TaskSchedule, on_delete=models.SET_NULL, related_name='tasks', blank=True, null=True)
@@ -119,9 +218,20 @@ class Task(models.Model):
     deadline = models.DateTimeField()
     is_recurring = models.BooleanField(default=False)
     completion_evidence_link = models.CharField(max_length=2048, blank=True)
+    title_normalized = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    description_normalized = models.TextField(editable=False, default='')
 
     def __str__(self) -> str:
         return f"{self._meta.verbose_name} #{self.pk}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        from .stats import raw_stats_key
+
+        instance = super().from_db(db, field_names, values)
+        # What ``TaskStats`` counts the task under, so that a save applies the difference.
+        instance._stats_key = raw_stats_key(instance)
+        return instance
     
     class Meta:
         verbose_name = "Задача"
@@ -130,9 +240,10 @@ class Task(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['deadline']),
             models.Index(fields=['assigned_to', 'status', 'deadline']),
+            models.Index(fields=['deadline', 'id']),
         ]
 
-class Comment(models.Model):
+class Comment(UpdatedAtMixin):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE)
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='comments')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -144,6 +255,102 @@ class Comment(models.Model):
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
+        # keyset pages of a task's comments (CommentCursorPagination), also serves comment counts
+        # and last comments of tasks (api.services.with_comment_activity)
+        indexes = [models.Index(fields=['task', 'created_at', 'id'])]
 
 
+class TaskStats(models.Model):
+    """
+    Number of tasks per status, assignee, obligation and deadline month (its
+    first day), kept up to date by ``api.stats`` on every change of a task.
+    """
+    status = models.CharField(choices=Task.TASK_STATUS_CHOICES, max_length=20)
+    assigned_to = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    obligation = models.ForeignKey(Obligation, on_delete=models.CASCADE, related_name='+')
+    deadline_month = models.DateField()
+    count = models.IntegerField(default=0)
 
+    class Meta:
+        verbose_name = "Статистика задач"
+        verbose_name_plural = "Статистика задач"
+        constraints = [
+            models.UniqueConstraint(fields=['status', 'assigned_to', 'obligation', 'deadline_month'],
+                                    name='api_taskstats_key'),
+        ]
+
+
+class ReminderLog(models.Model):
+    """
+    Deadline reminder sent for a task (see ``api.reminders``): one row per
+    task, reminder offset and deadline, so a moved deadline is reminded of again.
+    """
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='+')
+    offset_minutes = models.PositiveIntegerField()
+    deadline = models.DateTimeField()
+    sent_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Напоминание"
+        verbose_name_plural = "Напоминания"
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'offset_minutes', 'deadline'], name='api_reminderlog_key'),
+        ]
+
+
+class DeletionJob(models.Model):
+    """Background deletion of a PVA or an obligation with everything under it (see ``api.deletion``)."""
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    DONE = "DONE"
+    FAILED = "FAILED"
+    STATUS_CHOICES = [
+        (PENDING, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Завершено"),
+        (FAILED, "Ошибка"),
+    ]
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, related_name='+')
+    object_id = models.BigIntegerField()
+    object_repr = models.CharField(max_length=255)
+    status = models.CharField(choices=STATUS_CHOICES, default=PENDING, max_length=20)
+    # rows to delete and deleted so far, by model label
+    total = models.JSONField(default=dict)
+    deleted = models.JSONField(default=dict)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='+')
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True)
+    # set after every chunk: a running job not updated for long belongs to a process that died
+    updated_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        verbose_name = "Удаление"
+        verbose_name_plural = "Удаления"
+        indexes = [models.Index(fields=['content_type', 'object_id'])]
+
+
+class LogEntryWithArchive(models.Model):
+    """
+    Read-only view over the audit log and its monthly archive tables (see
+    ``api.archive``), with the same columns as ``LogEntry``. Archived entries
+    have their ``serialized_data`` snapshot dropped unless archived with it.
+    """
+    content_type = models.ForeignKey(ContentType, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    object_pk = models.CharField(max_length=255)
+    object_id = models.BigIntegerField(blank=True, null=True)
+    object_repr = models.TextField()
+    serialized_data = models.JSONField(null=True)
+    action = models.PositiveSmallIntegerField(choices=LogEntry.Action.choices)
+    changes_text = models.TextField(blank=True)
+    changes = models.JSONField(null=True)
+    actor = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+')
+    cid = models.CharField(max_length=255, null=True)
+    remote_addr = models.GenericIPAddressField(null=True)
+    timestamp = models.DateTimeField()
+    additional_data = models.JSONField(null=True)
+
+    class Meta:
+        managed = False
+        db_table = 'api_logentry_with_archive'
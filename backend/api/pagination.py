@@ -0,0 +1,191 @@
+import json
+from base64 import b64decode, b64encode
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .search import rank_ordering
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Opt-in keyset pagination over a composite ordering.
+
+    Unlike the stock ``CursorPagination``, which stores only the first ordering
+    field plus an offset, the cursor here holds the values of every ordering
+    field of the boundary row, so each page is a single index range scan
+    ``(a, b) > (a0, b0)`` no matter how deep the client scrolls. The last
+    ordering field must be unique (usually ``id``) and none of them nullable.
+
+    Pagination only kicks in when the request carries ``cursor`` or
+    ``page_size``; otherwise the full list is returned as before.
+
+    Results of ``?search=`` are paged in relevance order, ``(rank, id)``,
+    rather than in ``ordering`` (see ``page_ordering``).
+    """
+    ordering = ('id',)
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    invalid_cursor_message = 'Некорректный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` for async views."""
+        queryset = self.get_page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page([instance async for instance in queryset])
+
+    def get_page_queryset(self, queryset, request):
+        """The page plus one row to tell whether there is a next one, or ``None`` without pagination."""
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        ordering = self.page_ordering(queryset)
+        self.fields = [self._field_name(f) for f in ordering]
+        self.descending = [f.startswith('-') for f in ordering]
+
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor['reverse'])
+
+        ordering = [
+            ('-' if desc != reverse else '') + name
+            for name, desc in zip(self.fields, self.descending)
+        ]
+        queryset = queryset.order_by(*ordering)
+        if self.cursor:
+            queryset = queryset.filter(self._after(self._parse_position(queryset), reverse))
+
+        return queryset[:self.page_size + 1]
+
+    def page_ordering(self, queryset):
+        """The ordering pages of ``queryset`` follow: its relevance for search results, else ``ordering``."""
+        ranking = rank_ordering(queryset)
+        return self.ordering if ranking is None else (*ranking, 'id')
+
+    def set_page(self, results):
+        reverse = bool(self.cursor and self.cursor['reverse'])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        if reverse:
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            return self.encode_cursor(self._position(self.page[-1]), reverse=False)
+        if self.cursor and self.cursor['reverse']:
+            # An empty backwards page: continue forward from where we came from.
+            return self.encode_cursor(self.cursor['position'], reverse=False, inclusive=True)
+        return None
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            return self.encode_cursor(self._position(self.page[0]), reverse=True)
+        if self.cursor and not self.cursor['reverse']:
+            return self.encode_cursor(self.cursor['position'], reverse=True, inclusive=True)
+        return remove_query_param(self.base_url, self.cursor_query_param)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            data = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position = data['p']
+            if len(position) != len(self.fields):
+                raise ValueError
+            return {
+                'position': position,
+                'reverse': bool(data.get('r')),
+                'inclusive': bool(data.get('i')),
+            }
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, position, reverse=False, inclusive=False):
+        data = {'p': position}
+        if reverse:
+            data['r'] = 1
+        if inclusive:
+            data['i'] = 1
+        encoded = b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _field_name(self, ordering_field):
+        return ordering_field.lstrip('-')
+
+    def _position(self, instance):
+        position = []
+        for name in self.fields:
+            # Rows of ``.values()`` querysets are dicts.
+            value = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return position
+
+    def _parse_position(self, queryset):
+        """The cursor position as field values, checked before they reach the query."""
+        annotations = queryset.query.annotations
+        position = []
+        for name, value in zip(self.fields, self.cursor['position']):
+            field = annotations[name].output_field if name in annotations else queryset.model._meta.get_field(name)
+            try:
+                value = field.to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                value = None
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            position.append(value)
+        return position
+
+    def _after(self, position, reverse):
+        """
+        Lexicographic "row comes after the cursor" predicate, expanded into
+        ``a > a0 OR (a = a0 AND b > b0) ...`` so every backend can use the
+        composite index for it.
+        """
+        inclusive = self.cursor['inclusive']
+        condition = Q()
+        equal = Q()
+        last = len(self.fields) - 1
+        for i, (name, desc, value) in enumerate(zip(self.fields, self.descending, position)):
+            lookup = 'lt' if desc != reverse else 'gt'
+            if i == last and inclusive:
+                lookup += 'e'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return condition
+
+
+class TaskCursorPagination(KeysetCursorPagination):
+    ordering = ('deadline', 'id')
+
+
+class CommentCursorPagination(KeysetCursorPagination):
+    ordering = ('created_at', 'id')
+
+
+class LogEntryCursorPagination(KeysetCursorPagination):
+    ordering = ('-timestamp', '-id')
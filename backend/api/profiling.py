@@ -0,0 +1,180 @@
+"""
+Opt-in request profiling for staff users.
+
+A request with the ``X-Profile: 1`` header or the ``_profile=1`` query
+parameter from a staff user (JWT) runs under ``cProfile`` with every SQL
+query recorded (start, duration, alias, SQL). The body of a streamed
+response is profiled chunk by chunk as it is sent, without holding it in
+memory, and the profile is saved when the stream ends or is closed; its
+duration then includes the time the client took to read it. The profile is
+saved in ``PROFILING_DIR`` as ``<id>.prof`` (the raw ``pstats`` dump) and
+``<id>.json`` (request, SQL timeline and the top functions), the oldest
+ones beyond ``PROFILING_MAX_PROFILES`` are deleted, and its id is returned
+in the ``X-Profile-Id`` header. Listed and downloaded under ``api/profiles/``.
+
+Other requests only pay for the check of the header and the parameter:
+the query wrapper is installed just for profiled requests.
+"""
+import cProfile
+import io
+import json
+import pstats
+import re
+import secrets
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAMETER = '_profile'
+TOP_FUNCTIONS = 50
+
+_id_re = re.compile(r'^\d{8}-\d{12}-[0-9a-f]{8}$')
+
+
+def profiling_requested(request):
+    return request.META.get(PROFILE_HEADER) == '1' or request.GET.get(PROFILE_PARAMETER) == '1'
+
+
+def staff_user(request):
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    if result is None or not result[0].is_staff:
+        return None
+    return result[0]
+
+
+class SQLTimeline:
+    def __init__(self, start):
+        self.start = start
+        self.queries = []
+
+    def wrapper(self, alias):
+        def record(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                self.queries.append({
+                    'start_ms': (start - self.start) * 1000,
+                    'duration_ms': (time.perf_counter() - start) * 1000,
+                    'database': alias,
+                    'sql': sql,
+                    'many': many,
+                })
+        return record
+
+
+class RequestProfile:
+    def __init__(self, request, user):
+        self.request = request
+        self.user = user
+        self.id = f'{timezone.now():%Y%m%d-%H%M%S%f}-{secrets.token_hex(4)}'
+        self.start = time.perf_counter()
+        self.timeline = SQLTimeline(self.start)
+        self.profiler = cProfile.Profile()
+
+    @contextmanager
+    def running(self):
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(self.timeline.wrapper(alias)))
+            self.profiler.enable()
+            try:
+                yield
+            finally:
+                self.profiler.disable()
+
+    def stream(self, content, response):
+        """``content`` of ``response``, each chunk generated under the profiler; saves the profile at the end."""
+        iterator = iter(content)
+        try:
+            while True:
+                with self.running():
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                yield chunk
+        finally:
+            self.save(response)
+
+    def save(self, response):
+        duration = time.perf_counter() - self.start
+        queries = self.timeline.queries
+        stats = io.StringIO()
+        pstats.Stats(self.profiler, stream=stats).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+        save_profile(self.id, self.profiler, {
+            'id': self.id,
+            'created_at': timezone.now(),
+            'method': self.request.method,
+            'path': self.request.get_full_path(),
+            'user': self.user.username,
+            'status': response.status_code,
+            'duration_ms': duration * 1000,
+            'query_count': len(queries),
+            'db_duration_ms': sum(query['duration_ms'] for query in queries),
+            'queries': queries,
+            'top_functions': stats.getvalue(),
+        })
+
+
+def profile_request(get_response, request, user):
+    """Runs ``get_response`` under the profiler and returns the response with ``X-Profile-Id`` set."""
+    profile = RequestProfile(request, user)
+    with profile.running():
+        response = get_response(request)
+    if response.streaming and not response.is_async:
+        response.streaming_content = profile.stream(response.streaming_content, response)
+    else:
+        profile.save(response)
+    response['X-Profile-Id'] = profile.id
+    return response
+
+
+def save_profile(profile_id, profiler, data):
+    directory = settings.PROFILING_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(directory / f'{profile_id}.prof')
+    with open(directory / f'{profile_id}.json', 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, cls=DjangoJSONEncoder)
+    for old_id in profile_ids()[settings.PROFILING_MAX_PROFILES:]:
+        for suffix in ('.json', '.prof'):
+            (directory / f'{old_id}{suffix}').unlink(missing_ok=True)
+
+
+def profile_ids():
+    """Ids of the stored profiles, newest first."""
+    directory = settings.PROFILING_DIR
+    if not directory.exists():
+        return []
+    return sorted((path.stem for path in directory.glob('*.json') if _id_re.match(path.stem)), reverse=True)
+
+
+def profile_path(profile_id, suffix):
+    """Path of a stored profile file, ``None`` if there is no such profile."""
+    if not _id_re.match(profile_id):
+        return None
+    path = settings.PROFILING_DIR / f'{profile_id}{suffix}'
+    return path if path.exists() else None
+
+
+def load_profile(profile_id):
+    path = profile_path(profile_id, '.json')
+    if path is None:
+        return None
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        # Deleted or being written meanwhile.
+        return None
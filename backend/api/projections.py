@@ -0,0 +1,230 @@
+"""
+Fast path for read-only lists: ``.values()`` rows instead of model instances.
+
+``Projection`` compiles a serializer once per request into one step per
+output field: the ``.values()`` lookups it needs (joins included) and a
+function mapping them to the output value, using the serializer field's own
+``to_representation`` for scalars so that the JSON is identical. This skips
+building a model instance with its related objects and walking dotted
+sources for every row.
+
+Supported are model fields (also across foreign keys), ``get_<field>_display``,
+the methods in ``METHOD_PROJECTIONS``, primary key and slug related fields,
+nested serializers of foreign keys and annotations of the listed queryset
+passed in ``annotations``; ``compile_projection`` returns ``None`` for
+serializers with anything else, and those views fall back to the serializer.
+With ``LIST_PROJECTIONS`` off every list uses the serializer (``benchmark_api``
+compares the two).
+"""
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import serializers
+from rest_framework.fields import empty
+from rest_framework.relations import PKOnlyObject
+from rest_framework.response import Response
+
+_display_re = re.compile(r'^get_(\w+)_display$')
+
+# ``(model, method)``: the fields the method reads and a function of their values.
+METHOD_PROJECTIONS = {
+    (User, 'get_full_name'): (('first_name', 'last_name'), lambda first, last: f'{first} {last}'.strip()),
+}
+
+
+_SKIP = object()
+
+
+class ProjectionNotSupported(Exception):
+    pass
+
+
+def _lookup(path):
+    return '__'.join(path)
+
+
+def _scalar(field, lookup):
+    to_representation = field.to_representation
+
+    def project(row):
+        value = row[lookup]
+        return None if value is None else to_representation(value)
+    return project
+
+
+def _compile_field(field, model, prefix, lookups, annotations=()):
+    """Adds the lookups ``field`` needs to ``lookups`` and returns ``row -> value``."""
+    if field.source == '*' or not field.source_attrs:
+        raise ProjectionNotSupported(field.field_name)
+    if field.source_attrs == [field.source] and field.source in annotations:
+        lookups.add(field.source)
+        return _scalar(field, field.source)
+    current, path = model, list(prefix)
+    relations = []
+    for i, attr in enumerate(field.source_attrs):
+        last = i == len(field.source_attrs) - 1
+        try:
+            model_field = current._meta.get_field(attr)
+        except FieldDoesNotExist:
+            if not last:
+                raise ProjectionNotSupported(field.field_name)
+            match = _display_re.match(attr)
+            if match:
+                model_field = current._meta.get_field(match.group(1))
+                choices = dict(model_field.flatchoices)
+                lookup = _lookup(path + [model_field.name])
+                lookups.add(lookup)
+                to_representation = field.to_representation
+
+                def project(row):
+                    value = row[lookup]
+                    value = choices.get(value, value)
+                    return None if value is None else to_representation(str(value))
+                return _guarded(field, project, relations)
+            if (current, attr) not in METHOD_PROJECTIONS:
+                raise ProjectionNotSupported(field.field_name)
+            names, function = METHOD_PROJECTIONS[current, attr]
+            method_lookups = [_lookup(path + [name]) for name in names]
+            lookups.update(method_lookups)
+            to_representation = field.to_representation
+
+            def project(row):
+                value = function(*(row[lookup] for lookup in method_lookups))
+                return None if value is None else to_representation(value)
+            return _guarded(field, project, relations)
+
+        if not model_field.is_relation:
+            if not last:
+                raise ProjectionNotSupported(field.field_name)
+            lookup = _lookup(path + [attr])
+            lookups.add(lookup)
+            return _guarded(field, _scalar(field, lookup), relations)
+        if model_field.many_to_many or model_field.one_to_many:
+            raise ProjectionNotSupported(field.field_name)
+
+        fk_lookup = _lookup(path + [attr])
+        lookups.add(fk_lookup)
+        if last:
+            if isinstance(field, serializers.BaseSerializer):
+                project = compile_fields(field, model_field.related_model, path + [attr], lookups)
+                return _guarded(field, project, relations, fk_lookup)
+            if isinstance(field, serializers.SlugRelatedField):
+                lookup = f'{fk_lookup}__{field.slug_field}'
+                lookups.add(lookup)
+                return _guarded(field, lambda row: row[lookup], relations, fk_lookup)
+            if isinstance(field, serializers.PrimaryKeyRelatedField):
+                to_representation = field.to_representation
+                return _guarded(field, lambda row: to_representation(PKOnlyObject(row[fk_lookup])),
+                                relations, fk_lookup)
+            raise ProjectionNotSupported(field.field_name)
+        # A null foreign key on the way makes the value null, like DRF's attribute lookup.
+        relations.append(fk_lookup)
+        current, path = model_field.related_model, path + [attr]
+
+
+def _missing(field):
+    """
+    What DRF outputs for ``field`` when its source runs into a null foreign
+    key: the default, null, or nothing at all (``_SKIP``).
+    """
+    if field.default is not empty:
+        return lambda: None if (value := field.get_default()) is None else field.to_representation(value)
+    if field.allow_null:
+        return lambda: None
+    if not field.required:
+        return lambda: _SKIP
+    # DRF raises an error for such rows.
+    raise ProjectionNotSupported(field.field_name)
+
+
+def _guarded(field, project, relations, nullable=None):
+    """
+    ``project`` for rows where none of the traversed foreign keys
+    ``relations`` is null; ``None`` if the final one, ``nullable``, is.
+    """
+    if not relations and nullable is None:
+        return project
+    missing = _missing(field) if relations else None
+
+    def guarded(row):
+        for lookup in relations:
+            if row[lookup] is None:
+                return missing()
+        if nullable is not None and row[nullable] is None:
+            return None
+        return project(row)
+    return guarded
+
+
+def compile_fields(serializer, model, prefix, lookups, annotations=()):
+    steps = [
+        (name, _compile_field(field, model, prefix, lookups, annotations))
+        for name, field in serializer.fields.items()
+        if not field.write_only
+    ]
+
+    def project(row):
+        result = {}
+        for name, step in steps:
+            value = step(row)
+            if value is not _SKIP:
+                result[name] = value
+        return result
+    return project
+
+
+class Projection:
+    def __init__(self, serializer, model, annotations=()):
+        child = getattr(serializer, 'child', serializer)
+        self.lookups = set()
+        self.project = compile_fields(child, model, [], self.lookups, annotations)
+
+    def values(self, queryset, *extra):
+        """``queryset`` as rows with the needed lookups and ``extra`` ones, e.g. pagination keys."""
+        return queryset.values(*sorted(self.lookups), *(name for name in extra if name not in self.lookups))
+
+    def rows(self, rows):
+        return [self.project(row) for row in rows]
+
+
+def compile_projection(serializer, model, annotations=()):
+    try:
+        return Projection(serializer, model, annotations)
+    except ProjectionNotSupported:
+        return None
+
+
+class ProjectedListMixin:
+    """
+    Serves list actions (``list`` and those going through ``list_response``)
+    from ``Projection`` rows, falling back to the serializer when it cannot
+    be projected.
+    """
+
+    def get_list_projection(self, queryset):
+        if not settings.LIST_PROJECTIONS:
+            return None
+        return compile_projection(self.get_serializer(), queryset.model, queryset.query.annotations)
+
+    def projected_queryset(self, queryset, projection):
+        # Keyset pagination reads the ordering fields of the boundary rows.
+        page_ordering = getattr(self.paginator, 'page_ordering', None)
+        ordering = page_ordering(queryset) if page_ordering is not None else ()
+        return projection.values(queryset, *(name.lstrip('-') for name in ordering))
+
+    def list(self, request, *args, **kwargs):
+        return self.list_response(self.filter_queryset(self.get_queryset()))
+
+    def list_response(self, queryset):
+        projection = self.get_list_projection(queryset)
+        if projection is None:
+            serialize = lambda items: self.get_serializer(items, many=True).data
+        else:
+            queryset = self.projected_queryset(queryset, projection)
+            serialize = projection.rows
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serialize(page))
+        return Response(serialize(queryset))
@@ -0,0 +1,66 @@
+import calendar
+from datetime import date
+
+from .models import TaskSchedule
+
+LAST_WEEK = -1
+
+
+def _month_index(day: date) -> int:
+    return day.year * 12 + day.month - 1
+
+
+def _day_in_month(year, month, day_of_month, day_of_week, week_of_month):
+    """
+    Day number of the occurrence within a month: either the ``week_of_month``-th
+    ``day_of_week`` (``-1`` or a week past the end of the month means the last
+    one), or ``day_of_month`` clamped to the month length.
+    """
+    first_weekday, length = calendar.monthrange(year, month)
+    if week_of_month is not None and day_of_week is not None:
+        first = 1 + (day_of_week - first_weekday) % 7
+        last = first + (length - first) // 7 * 7
+        if week_of_month == LAST_WEEK:
+            return last
+        return min(first + (week_of_month - 1) * 7, last)
+    return min(day_of_month, length)
+
+
+def occurrences(schedule: TaskSchedule, anchor: date, start: date | None = None, end: date | None = None):
+    """
+    Yields the dates of ``schedule`` within ``[start, end]`` (clipped to the
+    schedule's own ``start_date``/``end_date``) in ascending order.
+
+    ``anchor`` is the deadline of the first iteration; schedule fields that are
+    not set default to its weekday, day and month. Fields that do not apply to
+    the frequency are ignored: ``day_of_week`` for daily schedules,
+    ``week_of_month``/``day_of_month`` for weekly ones.
+    """
+    lo = max(filter(None, (start, schedule.start_date)))
+    hi = min(filter(None, (end, schedule.end_date)))
+    if lo > hi:
+        return
+
+    day_of_week = schedule.day_of_week if schedule.day_of_week is not None else anchor.weekday()
+    day_of_month = schedule.day_of_month or anchor.day
+
+    match schedule.frequency_type:
+        case TaskSchedule.DAILY:
+            for ordinal in range(lo.toordinal(), hi.toordinal() + 1):
+                yield date.fromordinal(ordinal)
+        case TaskSchedule.WEEKLY:
+            first = lo.toordinal() + (day_of_week - lo.weekday()) % 7
+            for ordinal in range(first, hi.toordinal() + 1, 7):
+                yield date.fromordinal(ordinal)
+        case TaskSchedule.MONTHLY | TaskSchedule.YEARLY:
+            if schedule.frequency_type == TaskSchedule.MONTHLY:
+                months = range(_month_index(lo), _month_index(hi) + 1)
+            else:
+                month = (schedule.month_of_year or anchor.month) - 1
+                months = range(lo.year * 12 + month, hi.year * 12 + month + 1, 12)
+            for index in months:
+                year, month = divmod(index, 12)
+                day = date(year, month + 1, _day_in_month(
+                    year, month + 1, day_of_month, day_of_week, schedule.week_of_month))
+                if lo <= day <= hi:
+                    yield day
@@ -0,0 +1,217 @@
+"""
+Deadline reminders (``manage.py reminder_worker``).
+
+Assignees of open tasks get a reminder ``REMINDER_OFFSETS`` before the
+deadline. The worker never scans all tasks: every poll it loads only the
+reminders falling due in the next stretch of ``REMINDER_LOOKAHEAD`` not
+loaded yet, with one deadline range query per offset (``deadline`` index),
+plus those of tasks changed since the previous poll (``updated_at`` index),
+whose deadline or assignee may have moved. Loaded reminders wait in a
+``TimeWheel`` until due.
+
+Due reminders are checked against the current task, grouped by assignee
+and sent as one digest email per user. A reminder is recorded in
+``ReminderLog`` (claimed in a transaction, so concurrent workers do not
+both send it) before its email is sent and released if sending fails, so
+each is sent once; a worker killed between the two loses that digest.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ReminderLog, Task
+
+logger = logging.getLogger(__name__)
+
+OPEN_STATUSES = [Task.NOT_STARTED, Task.IN_PROGRESS]
+RETRY_DELAY = timedelta(minutes=1)
+# ``updated_at`` is set before commit: changes are looked for this far back, like in ``api.sync``.
+CHANGES_LAG = timedelta(minutes=1)
+
+
+class TimeWheel:
+    """
+    Hashed timing wheel: ``size`` slots of ``tick`` each, one per moment of
+    the horizon. Adding is O(1) and ``advance`` only visits the slots passed;
+    items must not be scheduled further ahead than ``size * tick``.
+    """
+
+    def __init__(self, tick, size, start):
+        self.tick = tick
+        self.slots = [[] for _ in range(size)]
+        self.current = self._tick_of(start)
+
+    def _tick_of(self, moment):
+        return int(moment.timestamp() // self.tick.total_seconds())
+
+    def add(self, due, item):
+        position = max(self._tick_of(due), self.current)
+        if position - self.current >= len(self.slots):
+            raise ValueError('Reminder is beyond the horizon of the wheel.')
+        self.slots[position % len(self.slots)].append((due, item))
+
+    def advance(self, now):
+        """Removes and returns the items due at ``now`` or earlier."""
+        due_items = []
+        last = self._tick_of(now)
+        while True:
+            slot = self.slots[self.current % len(self.slots)]
+            if slot:
+                # The slot of ``now`` may hold items due later within its tick.
+                due_items += [item for due, item in slot if due <= now]
+                slot[:] = [(due, item) for due, item in slot if due > now]
+            if self.current >= last:
+                return due_items
+            self.current += 1
+
+    def __len__(self):
+        return sum(map(len, self.slots))
+
+
+class ReminderWorker:
+    def __init__(self, now=None, offsets=None, lookahead=None, catch_up=None, tick=timedelta(seconds=15)):
+        now = now or timezone.now()
+        self.offsets = sorted(offsets or settings.REMINDER_OFFSETS)
+        self.lookahead = lookahead or settings.REMINDER_LOOKAHEAD
+        self.catch_up = catch_up if catch_up is not None else settings.REMINDER_CATCH_UP
+        # Reminders due after ``loaded_until`` are not loaded yet.
+        self.loaded_until = now - self.catch_up
+        self.changes_since = now - CHANGES_LAG
+        # Past reminders go to the current slot, so the wheel only has to span the lookahead.
+        self.wheel = TimeWheel(tick, int(max(self.lookahead, RETRY_DELAY) / tick) + 2, now)
+        # Keys of the reminders in the wheel.
+        self.scheduled = set()
+
+    def poll(self, now=None):
+        """Loads the reminders due soon, sends the due ones and returns the number of digests sent."""
+        now = now or timezone.now()
+        due = self.wheel.advance(now)
+        self.load(now)
+        return self.send(due + self.wheel.advance(now), now)
+
+    def load(self, now):
+        start, end = self.loaded_until, now + self.lookahead
+        if end > start:
+            for offset in self.offsets:
+                rows = Task.objects.filter(
+                    deadline__gt=start + offset, deadline__lte=end + offset,
+                    status__in=OPEN_STATUSES, assigned_to__isnull=False,
+                ).values_list('id', 'deadline')
+                for task_id, deadline in rows:
+                    self.schedule(task_id, offset, deadline)
+            self.loaded_until = end
+
+        # Tasks that changed may have reminders in the stretch already loaded.
+        changed = Task.objects.filter(
+            updated_at__gte=self.changes_since, status__in=OPEN_STATUSES, assigned_to__isnull=False,
+        ).filter(self._deadline_ranges(now - self.catch_up, self.loaded_until))
+        self.changes_since = now - CHANGES_LAG
+        for task_id, deadline in changed.values_list('id', 'deadline'):
+            for offset in self.offsets:
+                if deadline - offset <= self.loaded_until:
+                    self.schedule(task_id, offset, deadline)
+
+    def _deadline_ranges(self, start, end):
+        condition = Q()
+        for offset in self.offsets:
+            condition |= Q(deadline__gt=start + offset, deadline__lte=end + offset)
+        return condition
+
+    def schedule(self, task_id, offset, deadline):
+        key = (task_id, int(offset.total_seconds() // 60), deadline)
+        if key not in self.scheduled:
+            self.scheduled.add(key)
+            self.wheel.add(deadline - offset, key)
+
+    def send(self, keys, now):
+        if not keys:
+            return 0
+        self.scheduled.difference_update(keys)
+        tasks = Task.objects.select_related('assigned_to', 'obligation').in_bulk({task_id for task_id, _, _ in keys})
+        sent = set(ReminderLog.objects.filter(
+            task_id__in=tasks, deadline__in={deadline for _, _, deadline in keys},
+        ).values_list('task_id', 'offset_minutes', 'deadline'))
+
+        by_user = defaultdict(list)
+        for key in sorted(keys, key=lambda key: key[2]):
+            task = tasks.get(key[0])
+            # Completed, hidden, reassigned or rescheduled since it was loaded: not due any more.
+            if (task is None or key in sent or task.deadline != key[2] or task.status not in OPEN_STATUSES
+                    or task.assigned_to is None or not task.assigned_to.email):
+                continue
+            by_user[task.assigned_to].append((key, task))
+        if not by_user:
+            return 0
+
+        digests = 0
+        try:
+            with get_connection() as connection:
+                for user in list(by_user):
+                    reminders = self.claim(by_user.pop(user), now)
+                    if not reminders:
+                        continue
+                    try:
+                        digest_email(user, [task for _, task in reminders], connection).send()
+                    except Exception:
+                        logger.exception('Could not send reminders to %s', user.email)
+                        keys = [key for key, _ in reminders]
+                        ReminderLog.objects.filter(_keys_condition(keys)).delete()
+                        self.retry(keys, now)
+                        continue
+                    digests += 1
+        except Exception:
+            logger.exception('Could not connect to the mail server')
+            self.retry([key for reminders in by_user.values() for key, _ in reminders], now)
+        return digests
+
+    def retry(self, keys, now):
+        for key in keys:
+            self.scheduled.add(key)
+            self.wheel.add(now + RETRY_DELAY, key)
+
+    def claim(self, reminders, now):
+        """Records ``reminders`` as sent and returns those no other worker had recorded."""
+        try:
+            with transaction.atomic():
+                ReminderLog.objects.bulk_create([
+                    ReminderLog(task_id=key[0], offset_minutes=key[1], deadline=key[2], sent_at=now)
+                    for key, _ in reminders
+                ])
+            return reminders
+        except IntegrityError:
+            # Another worker got some of them first: claim the rest one by one.
+            claimed = []
+            for key, task in reminders:
+                try:
+                    with transaction.atomic():
+                        ReminderLog.objects.create(task_id=key[0], offset_minutes=key[1], deadline=key[2], sent_at=now)
+                except IntegrityError:
+                    continue
+                claimed.append((key, task))
+            return claimed
+
+
+def _keys_condition(keys):
+    condition = Q()
+    for task_id, offset_minutes, deadline in keys:
+        condition |= Q(task_id=task_id, offset_minutes=offset_minutes, deadline=deadline)
+    return condition
+
+
+def digest_email(user, tasks, connection=None):
+    lines = [f'{user.get_full_name() or user.username}, приближаются сроки задач:', '']
+    for task in tasks:
+        deadline = timezone.localtime(task.deadline)
+        lines.append(f'• {task.title} — срок {deadline:%d.%m.%Y %H:%M} ({task.obligation.title})')
+    return EmailMessage(
+        subject=f'Приближаются сроки задач: {len(tasks)}',
+        body='\n'.join(lines),
+        to=[user.email],
+        connection=connection,
+    )
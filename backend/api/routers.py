@@ -0,0 +1,107 @@
+"""
+Primary/replica routing.
+
+Writes always go to ``default``. Reads go to ``default`` too, except in
+requests that a view with ``ReplicaReadMixin`` marked as read-only: there
+they go to a random alias of ``DATABASE_READ_REPLICAS``, if any.
+
+Read-your-writes: a request that wrote anything marks its user for
+``READ_YOUR_WRITES_WINDOW`` in the ``READ_YOUR_WRITES_CACHE`` cache, and that
+user's reads stay on the primary meanwhile, so a replica lagging by less than
+the window never shows them stale data. The window has to cover the
+replication lag. Later reads of the writing request itself also stay on the
+primary.
+
+The routing state lives for one request (``api.middleware.ReplicaRoutingMiddleware``),
+including the body of a streamed response (exports, the calendar), which is
+read after the view has returned; outside requests (commands, the audit log
+writer thread) everything uses the primary.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+
+
+class RoutingState:
+    def __init__(self):
+        self.read_from_replica = False
+        self.wrote = False
+
+
+routing_state = ContextVar('routing_state', default=None)
+
+
+def routed_stream(content, state, finish):
+    """``content`` of a streamed response, read with the routing ``state`` of its request; calls ``finish`` at the end."""
+    iterator = iter(content)
+    try:
+        while True:
+            token = routing_state.set(state)
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                routing_state.reset(token)
+            yield chunk
+    finally:
+        finish()
+
+
+def _sticky_key(user_id):
+    return f'api:read-your-writes:{user_id}'
+
+
+def _cache():
+    return caches[settings.READ_YOUR_WRITES_CACHE]
+
+
+def mark_wrote(user):
+    if user is not None and user.is_authenticated:
+        _cache().set(_sticky_key(user.pk), True, settings.READ_YOUR_WRITES_WINDOW.total_seconds())
+
+
+def is_sticky(user):
+    return user is not None and user.is_authenticated and _cache().get(_sticky_key(user.pk), False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = routing_state.get()
+        if state is None or not state.read_from_replica or state.wrote or not settings.DATABASE_READ_REPLICAS:
+            return None
+        return random.choice(settings.DATABASE_READ_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = routing_state.get()
+        if state is not None:
+            state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_READ_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    Sends the reads of safe requests to ``replica_read_actions`` (all of them
+    for views without actions) to a read replica, unless the user wrote recently.
+    """
+    replica_read_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        state = routing_state.get()
+        action = getattr(self, 'action', None)
+        if (state is not None and settings.DATABASE_READ_REPLICAS and request.method in SAFE_METHODS
+                and (action is None or action in self.replica_read_actions) and not is_sticky(request.user)):
+            state.read_from_replica = True
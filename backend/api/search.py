@@ -0,0 +1,200 @@
+"""
+Indexed full-text search for tasks, obligations and PVAs.
+
+On SQLite every searchable table gets a contentless FTS5 table
+(``<table>_fts``, rowid = object id) kept in sync by triggers, so bulk inserts
+and queryset updates are indexed as well. Both indexed text and queries have
+ё folded to е. On PostgreSQL a GIN index over the ``tsvector`` of
+the same columns is used, plus a trigram index on the title-like column.
+
+The indexes are not models: they are (re)installed after every ``migrate``,
+since SQLite drops triggers whenever a migration rebuilds the table.
+"""
+import re
+
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Task, Obligation, PVA
+
+SEARCH_FIELDS = {
+    Task: ('title', 'description'),
+    Obligation: ('title', 'description'),
+    PVA: ('requisites', 'description'),
+}
+# bm25 weight of the first (title-like) column relative to the description.
+TITLE_WEIGHT = 10.0
+POSTGRES_CONFIG = 'russian'
+
+_token_re = re.compile(r'\w+')
+
+
+def _tokens(value):
+    return _token_re.findall(value.replace('ё', 'е').replace('Ё', 'Е'))
+
+
+class SQLiteSearchBackend:
+    # bm25 is lower for better matches.
+    ranking = ('search_rank',)
+
+    def fts_table(self, model):
+        return f'{model._meta.db_table}_fts'
+
+    def _normalized(self, prefix, field):
+        # unicode61 folds case but treats ё and е as different letters.
+        return f"replace(replace({prefix}{field}, 'ё', 'е'), 'Ё', 'Е')"
+
+    def install(self, connection, model, fields):
+        table, fts = model._meta.db_table, self.fts_table(model)
+        columns = ', '.join(fields)
+        new_values = ', '.join(self._normalized('new.', field) for field in fields)
+        old_values = ', '.join(self._normalized('old.', field) for field in fields)
+        triggers = {
+            f'{fts}_ai': f'AFTER INSERT ON {table} BEGIN '
+                         f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END',
+            f'{fts}_ad': f'AFTER DELETE ON {table} BEGIN '
+                         f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); END",
+            f'{fts}_au': f'AFTER UPDATE OF {columns} ON {table} BEGIN '
+                         f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+                         f'INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END',
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [table]
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({columns}, '
+                f"content='', tokenize='unicode61 remove_diacritics 2')"
+            )
+            for name, body in triggers.items():
+                cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {body}')
+            if not existing.issuperset(triggers):
+                self.rebuild(connection, model)
+
+    def rebuild(self, connection, model):
+        table, fts = model._meta.db_table, self.fts_table(model)
+        fields = SEARCH_FIELDS[model]
+        values = ', '.join(self._normalized('', field) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('delete-all')")
+            cursor.execute(f'INSERT INTO {fts}(rowid, {", ".join(fields)}) SELECT id, {values} FROM {table}')
+
+    def search(self, queryset, value):
+        tokens = _tokens(value)
+        if not tokens:
+            return queryset.none()
+        model = queryset.model
+        table, fts = model._meta.db_table, self.fts_table(model)
+        weights = ', '.join([str(TITLE_WEIGHT)] + ['1.0'] * (len(SEARCH_FIELDS[model]) - 1))
+        # Each word is matched as a prefix, so results update while typing.
+        match = ' '.join('"{}"*'.format(token) for token in tokens)
+        matches = RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [match])
+        rank = RawSQL(f'SELECT bm25({fts}, {weights}) FROM {fts} WHERE {fts} MATCH %s AND rowid = {table}.id',
+                      [match], output_field=FloatField())
+        return (
+            queryset
+            .filter(id__in=matches)
+            .annotate(search_rank=rank)
+            .order_by(*self.ranking, *queryset.query.order_by)
+        )
+
+
+class PostgresSearchBackend:
+    ranking = ('-search_rank', '-search_similarity')
+
+    def index_names(self, model):
+        table = model._meta.db_table
+        return f'{table}_search_idx', f'{table}_trgm_idx'
+
+    def install(self, connection, model, fields):
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+
+        search_index, trigram_index = self.index_names(model)
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            existing = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        indexes = [
+            GinIndex(SearchVector(*fields, config=POSTGRES_CONFIG), name=search_index),
+            GinIndex(fields=[fields[0]], opclasses=['gin_trgm_ops'], name=trigram_index),
+        ]
+        with connection.schema_editor() as schema_editor:
+            for index in indexes:
+                if index.name not in existing:
+                    schema_editor.add_index(model, index)
+
+    def rebuild(self, connection, model):
+        """Expression indexes are maintained by PostgreSQL itself."""
+
+    def search(self, queryset, value):
+        from django.contrib.postgres.lookups import TrigramWordSimilar
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+
+        tokens = _tokens(value)
+        if not tokens:
+            return queryset.none()
+        fields = SEARCH_FIELDS[queryset.model]
+        vector = SearchVector(*fields, config=POSTGRES_CONFIG)
+        query = SearchQuery(' & '.join(f'{token}:*' for token in tokens), config=POSTGRES_CONFIG, search_type='raw')
+        return (
+            queryset
+            .annotate(search_vector=vector,
+                      search_rank=SearchRank(vector, query),
+                      search_similarity=TrigramWordSimilarity(value, fields[0]))
+            # Both branches are index-backed: GIN over the tsvector and the trigram
+            # index for typo-tolerant matches on the title (the ``%>`` operator).
+            .filter(Q(search_vector=query) | Q(TrigramWordSimilar(F(fields[0]), value)))
+            .order_by(*self.ranking, *queryset.query.order_by)
+        )
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend(),
+    'postgresql': PostgresSearchBackend(),
+}
+
+
+def get_backend(using=DEFAULT_DB_ALIAS):
+    return BACKENDS.get(connections[using].vendor)
+
+
+def search(queryset, value):
+    """Filters ``queryset`` by the words in ``value`` and orders it by relevance."""
+    backend = get_backend(queryset.db)
+    if backend is None:
+        query = Q()
+        for field in SEARCH_FIELDS[queryset.model]:
+            query |= Q(**{f'{field}__icontains': value})
+        return queryset.filter(query)
+    return backend.search(queryset, value)
+
+
+def rank_ordering(queryset):
+    """
+    The relevance ordering of ``queryset`` if it went through ``search``,
+    else ``None``. Keyset pagination pages search results in this order
+    (plus ``id``) instead of its own.
+    """
+    if 'search_rank' not in queryset.query.annotations:
+        return None
+    return get_backend(queryset.db).ranking
+
+
+def install_search_indexes(using=DEFAULT_DB_ALIAS, **kwargs):
+    backend = get_backend(using)
+    if backend is None:
+        return
+    connection = connections[using]
+    for model, fields in SEARCH_FIELDS.items():
+        backend.install(connection, model, fields)
+
+
+def rebuild_search_indexes(using=DEFAULT_DB_ALIAS):
+    backend = get_backend(using)
+    if backend is None:
+        return
+    connection = connections[using]
+    for model in SEARCH_FIELDS:
+        backend.rebuild(connection, model)
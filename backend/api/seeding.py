@@ -0,0 +1,151 @@
+"""
+Synthetic data for load testing (``manage.py seed_data``).
+
+Everything is written with ``bulk_create``, so signal-maintained data is
+filled in explicitly: normalized columns, user search profiles and, at the
+end, the task counters. Audit entries are generated directly, spread over
+the past year (older ones are eligible for ``archive_auditlog``), instead of
+being recorded by auditlog. Names carry a per-run tag, so runs can be repeated.
+"""
+import random
+import secrets
+from datetime import timedelta
+
+from auditlog.models import LogEntry
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    PVA, Comment, MedicinalProduct, Obligation, ResponsibilityType, Task, TaskSchedule, User, UserSearchProfile,
+    normalize_text,
+)
+from .services import materialize_recurring_tasks
+from .stats import rebuild_task_stats
+
+RESPONSIBILITY_TYPES = ['Отчетность', 'Обработка сообщений о НР', 'Обмен информацией', 'Аудит', 'Обучение']
+FIRST_NAMES = ['Анна', 'Иван', 'Мария', 'Сергей', 'Ольга', 'Дмитрий', 'Елена', 'Алексей', 'Татьяна', 'Павел']
+LAST_NAMES = ['Иванова', 'Петров', 'Смирнова', 'Кузнецов', 'Попова', 'Соколов', 'Лебедева', 'Козлов', 'Новикова']
+TASK_TITLES = ['Подготовить ПООБ', 'Передать сообщение о НР', 'Сверить реестр сообщений', 'Проверить литературу',
+               'Обновить ПУР', 'Согласовать SDEA', 'Провести обучение персонала', 'Подготовить ответ регулятору']
+STATUS_WEIGHTS = {Task.NOT_STARTED: 5, Task.IN_PROGRESS: 3, Task.COMPLETED: 6, Task.HIDDEN: 1}
+
+
+def _normalized(objects):
+    for obj in objects:
+        obj.normalize_fields()
+    return objects
+
+
+def seed(users=20, products=50, pvas=20, obligations_per_pva=5, tasks_per_obligation=20, recurring_share=0.1,
+         comments_per_task=2, audit_entries_per_task=3, batch_size=1000, random_seed=None, log=lambda message: None):
+    """
+    Creates ``users``, ``products``, ``pvas`` with ``obligations_per_pva``
+    obligations each, ``tasks_per_obligation`` tasks per obligation (a
+    ``recurring_share`` of them recurring, with their iterations), about
+    ``comments_per_task`` comments and exactly ``audit_entries_per_task``
+    audit entries per task. Returns the number of objects created per kind.
+    """
+    rng = random.Random(random_seed)
+    tag = secrets.token_hex(3)
+    now = timezone.now()
+    created = {}
+
+    with transaction.atomic():
+        user_objects = User.objects.bulk_create([
+            User(username=f'seed_{tag}_{i}', first_name=rng.choice(FIRST_NAMES), last_name=rng.choice(LAST_NAMES),
+                 email=f'seed_{tag}_{i}@example.com', password='!')
+            for i in range(users)
+        ], batch_size=batch_size)
+        UserSearchProfile.objects.bulk_create([
+            UserSearchProfile(user=user, username_normalized=normalize_text(user.username),
+                              last_name_normalized=normalize_text(user.last_name))
+            for user in user_objects
+        ], batch_size=batch_size)
+        created['users'] = len(user_objects)
+
+        responsibility_types = [ResponsibilityType.objects.get_or_create(title=title)[0]
+                                for title in RESPONSIBILITY_TYPES]
+        product_objects = MedicinalProduct.objects.bulk_create(_normalized([
+            MedicinalProduct(title=f'Препарат {tag}-{i}', description='Таблетки, покрытые пленочной оболочкой')
+            for i in range(products)
+        ]), batch_size=batch_size)
+        created['medicinal products'] = len(product_objects)
+
+        pva_objects = PVA.objects.bulk_create(_normalized([
+            PVA(requisites=f'Договор № {tag}/{i} от {(now - timedelta(days=rng.randint(0, 1500))):%d.%m.%Y}',
+                description='Соглашение о фармаконадзоре', status=rng.choice(PVA.PVA_STATUS_CHOICES)[0],
+                start_date=(now - timedelta(days=rng.randint(30, 1500))).date(),
+                end_date=(now + timedelta(days=rng.randint(30, 1500))).date())
+            for i in range(pvas)
+        ]), batch_size=batch_size)
+        if product_objects:
+            PVA.medicinal_products.through.objects.bulk_create([
+                PVA.medicinal_products.through(pva_id=pva.id, medicinalproduct_id=product.id)
+                for pva in pva_objects
+                for product in rng.sample(product_objects, min(len(product_objects), rng.randint(1, 5)))
+            ], batch_size=batch_size)
+        created['PVAs'] = len(pva_objects)
+
+        obligations = Obligation.objects.bulk_create(_normalized([
+            Obligation(pva=pva, title=f'Обязательство {i + 1} по договору {pva.requisites}',
+                       description='Стороны обязуются своевременно обмениваться информацией',
+                       start_date=pva.start_date, end_date=pva.end_date,
+                       responsibility_type=rng.choice(responsibility_types + [None]))
+            for pva in pva_objects
+            for i in range(obligations_per_pva)
+        ]), batch_size=batch_size)
+        created['obligations'] = len(obligations)
+        log(f'Created {len(user_objects)} users, {len(pva_objects)} PVAs and {len(obligations)} obligations.')
+
+        tasks, schedules = [], []
+        statuses, weights = zip(*STATUS_WEIGHTS.items())
+        for obligation in obligations:
+            for _ in range(tasks_per_obligation):
+                task = Task(
+                    created_by=rng.choice(user_objects), assigned_to=rng.choice(user_objects + [None]),
+                    obligation=obligation,
+                    title=rng.choice(TASK_TITLES), description=f'Задача по обязательству «{obligation.title}»',
+                    status=rng.choices(statuses, weights)[0],
+                    deadline=now + timedelta(days=rng.randint(-365, 365), minutes=rng.randint(0, 24 * 60)),
+                )
+                if rng.random() < recurring_share:
+                    task.is_recurring = True
+                    task.status = Task.NOT_STARTED
+                    task.deadline = now + timedelta(days=rng.randint(0, 30))
+                    task.schedule = TaskSchedule(
+                        frequency_type=rng.choice([TaskSchedule.WEEKLY, TaskSchedule.MONTHLY]),
+                        start_date=task.deadline.date(), end_date=obligation.end_date)
+                    schedules.append(task.schedule)
+                tasks.append(task)
+        TaskSchedule.objects.bulk_create(schedules, batch_size=batch_size)
+        Task.objects.bulk_create(_normalized(tasks), batch_size=batch_size)
+        iterations = materialize_recurring_tasks(schedules)
+        tasks += iterations
+        created['tasks'] = len(tasks)
+        log(f'Created {len(tasks)} tasks ({len(iterations)} recurring iterations).')
+
+        comments = Comment.objects.bulk_create([
+            Comment(task=task, created_by=rng.choice(user_objects), text=f'Комментарий {i + 1}: статус согласован')
+            for task in tasks
+            for i in range(rng.randint(0, 2 * comments_per_task))
+        ], batch_size=batch_size)
+        created['comments'] = len(comments)
+
+        task_type = ContentType.objects.get_for_model(Task)
+        status_names = dict(Task.TASK_STATUS_CHOICES)
+        entries = []
+        for task in tasks:
+            for _ in range(audit_entries_per_task):
+                old, new = rng.sample(list(status_names), 2)
+                entries.append(LogEntry(
+                    content_type=task_type, object_pk=str(task.pk), object_id=task.pk, object_repr=str(task),
+                    action=LogEntry.Action.UPDATE, changes={'status': [old, new]}, actor_id=rng.choice(user_objects).pk,
+                    timestamp=now - timedelta(days=rng.randint(0, 365), seconds=rng.randint(0, 86400)),
+                ))
+        LogEntry.objects.bulk_create(entries, batch_size=batch_size)
+        created['audit entries'] = len(entries)
+        log(f'Created {len(comments)} comments and {len(entries)} audit entries.')
+
+        rebuild_task_stats()
+    return created
@@ -1,5 +1,10 @@
+import copy
+from django.utils import timezone
 from rest_framework import serializers
 from .models import *
+from .audit import bulk_log
+from .recurrence import LAST_WEEK
+from .stats import update_task_stats
 from auditlog.models import LogEntry
 
 class TaskStatusSerializer(serializers.Serializer):
@@ -14,26 +19,67 @@ class UserSerializer(serializers.ModelSerializer):
         exclude = ['groups', 'user_permissions']
 
 class TaskScheduleSerializer(serializers.ModelSerializer):
+    # fields each frequency leaves room for, see api.recurrence.occurrences
+    ALLOWED_FIELDS = {
+        TaskSchedule.DAILY: set(),
+        TaskSchedule.WEEKLY: {'day_of_week'},
+        TaskSchedule.MONTHLY: {'day_of_week', 'week_of_month', 'day_of_month'},
+        TaskSchedule.YEARLY: {'day_of_week', 'week_of_month', 'day_of_month', 'month_of_year'},
+    }
+
     class Meta:
         model = TaskSchedule
         fields = '__all__'
+        extra_kwargs = {
+            'day_of_week': {'min_value': 0, 'max_value': 6},
+            'day_of_month': {'min_value': 1, 'max_value': 31},
+            'month_of_year': {'min_value': 1, 'max_value': 12},
+        }
+
+    def validate_week_of_month(self, value):
+        if value is not None and value != LAST_WEEK and not 1 <= value <= 5:
+            raise serializers.ValidationError(f'Допустимы значения от 1 до 5 или {LAST_WEEK} (последняя неделя).')
+        return value
+
+    def validate(self, attrs):
+        frequency_type = attrs.get('frequency_type')
+        if frequency_type is None:
+            if self.root.partial:
+                # a partial update keeps the stored frequency, which is not known here
+                return attrs
+            frequency_type = TaskSchedule.DAILY
+        set_fields = {name for name in self.ALLOWED_FIELDS[TaskSchedule.YEARLY] if attrs.get(name) is not None}
+        errors = {
+            name: 'Поле не применимо к выбранной периодичности.'
+            for name in set_fields - self.ALLOWED_FIELDS[frequency_type]
+        }
+        if frequency_type in (TaskSchedule.MONTHLY, TaskSchedule.YEARLY):
+            if {'week_of_month', 'day_of_month'} <= set_fields:
+                errors['day_of_month'] = 'Укажите либо день месяца, либо неделю месяца.'
+            elif 'day_of_week' in set_fields and 'week_of_month' not in set_fields:
+                errors['day_of_week'] = 'День недели задаётся вместе с неделей месяца.'
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
 
 class ObligationSerializer(serializers.ModelSerializer):
     pva_display = serializers.SlugRelatedField(slug_field='requisites', read_only=True, source='pva')
     responsibility_type = serializers.SlugRelatedField(slug_field='title', queryset=ResponsibilityType.objects.all(), required=False)
     class Meta:
         model = Obligation
-        fields = '__all__'
+        exclude = ['title_normalized', 'description_normalized']
+        read_only_fields = ['is_active']
+        expandable_fields = {'pva': ['pva_display']}
 
 class ResponsibilityTypeSerializer(serializers.ModelSerializer):
     class Meta:
         model = ResponsibilityType
-        fields = '__all__'
+        exclude = ['title_normalized']
 
 class MedicinalProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = MedicinalProduct
-        fields = '__all__'
+        exclude = ['title_normalized']
 
 class PVASerializer(serializers.ModelSerializer):
     medicinal_products = serializers.SlugRelatedField(slug_field='title', many=True, queryset=MedicinalProduct.objects.all(), required=False)
@@ -41,7 +87,7 @@ class PVASerializer(serializers.ModelSerializer):
    
     class Meta:
         model = PVA
-        fields = '__all__'
+        exclude = ['requisites_normalized', 'description_normalized']
 
 class CommentSerializer(serializers.ModelSerializer):
     created_by_display = serializers.CharField(source='created_by.get_full_name', read_only=True)
@@ -59,7 +105,121 @@ class LogEntrySerializer(serializers.ModelSerializer):
         model = LogEntry
         fields = '__all__'
 
+class LogEntryCompactSerializer(serializers.ModelSerializer):
+    """Changed fields with their old and new values, without the snapshot and display fields."""
+    class Meta:
+        model = LogEntry
+        fields = ['id', 'timestamp', 'action', 'actor', 'changes']
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Resolves pks from the objects preloaded by the parent list serializer
+    instead of issuing one query per item.
+    """
+    def to_internal_value(self, data):
+        prefetched = getattr(self.root, 'prefetched_related', {}).get(self.field_name, {})
+        if not isinstance(data, bool) and str(data) in prefetched:
+            return prefetched[str(data)]
+        return super().to_internal_value(data)
+
+
+class TaskBulkListSerializer(serializers.ListSerializer):
+    """
+    Creates or updates a list of tasks with one INSERT/UPDATE per table and
+    one batch of audit entries. Instances to update are passed as a list in
+    the same order as the incoming data.
+    """
+    def run_child_validation(self, data):
+        if self.instance is not None:
+            self.child.instance = self.instance[len(self._validated_instances)]
+            self._validated_instances.append(self.child.instance)
+        return super().run_child_validation(data)
+
+    def to_internal_value(self, data):
+        self._validated_instances = []
+        if isinstance(data, list):
+            self.prefetch_related(data)
+        return super().to_internal_value(data)
+
+    def prefetch_related(self, data):
+        self.prefetched_related = {}
+        for name, field in self.child.fields.items():
+            if field.read_only or not isinstance(field, PrefetchedPrimaryKeyRelatedField):
+                continue
+            pks = {item[name] for item in data if isinstance(item, dict) and isinstance(item.get(name), (int, str))}
+            try:
+                objects = field.get_queryset().in_bulk(pks)
+            except (TypeError, ValueError):
+                continue
+            self.prefetched_related[name] = {str(pk): obj for pk, obj in objects.items()}
+
+    def _actor(self):
+        request = self.context.get('request')
+        return request.user if request else None
+
+    def create(self, validated_data):
+        schedules, tasks = [], []
+        for attrs in validated_data:
+            schedule_data = attrs.pop('schedule', None)
+            task = Task(**attrs)
+            task.normalize_fields()
+            if schedule_data:
+                task.schedule = TaskSchedule(**schedule_data)
+                schedules.append(task.schedule)
+            tasks.append(task)
+
+        TaskSchedule.objects.bulk_create(schedules)
+        Task.objects.bulk_create(tasks)
+        update_task_stats(tasks, created=True)
+
+        bulk_log([(None, schedule) for schedule in schedules] + [(None, task) for task in tasks],
+                 LogEntry.Action.CREATE, actor=self._actor())
+        return tasks
+
+    def update(self, instances, validated_data):
+        old_tasks, new_schedules, changed_schedules, detached_schedule_ids = [], [], [], []
+        fields = set()
+        now = timezone.now()
+        for task, attrs in zip(instances, validated_data):
+            old_tasks.append(copy.copy(task))
+            schedule_data = attrs.pop('schedule', None)
+            is_recurring = attrs.get('is_recurring', task.is_recurring)
+            if schedule_data and is_recurring:
+                if task.schedule is None:
+                    task.schedule = TaskSchedule(**schedule_data)
+                    new_schedules.append(task.schedule)
+                    fields.add('schedule')
+                else:
+                    changed_schedules.append((copy.copy(task.schedule), task.schedule))
+                    for attr, value in schedule_data.items():
+                        setattr(task.schedule, attr, value)
+            elif task.schedule_id and not is_recurring:
+                detached_schedule_ids.append(task.schedule_id)
+                task.schedule = None
+                fields.add('schedule')
+            for attr, value in attrs.items():
+                setattr(task, attr, value)
+            task.normalize_fields()
+            task.updated_at = now
+            fields.update(attrs)
+
+        TaskSchedule.objects.bulk_create(new_schedules)
+        if changed_schedules:
+            schedule_fields = [f.name for f in TaskSchedule._meta.concrete_fields if not f.primary_key]
+            TaskSchedule.objects.bulk_update([new for _, new in changed_schedules], schedule_fields)
+        if fields:
+            Task.objects.bulk_update(instances, Task.with_normalized_fields(fields) | {'updated_at'})
+            update_task_stats(instances)
+
+        actor = self._actor()
+        bulk_log([(None, schedule) for schedule in new_schedules], LogEntry.Action.CREATE, actor=actor)
+        bulk_log(changed_schedules + list(zip(old_tasks, instances)), LogEntry.Action.UPDATE, actor=actor)
+        TaskSchedule.objects.filter(id__in=detached_schedule_ids, tasks__isnull=True).delete()
+        return instances
+
+
 class TaskSerializer(serializers.ModelSerializer):
+    serializer_related_field = PrefetchedPrimaryKeyRelatedField
     schedule = TaskScheduleSerializer(required=False)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     created_by_display = serializers.CharField(source='created_by.get_full_name', read_only=True)
@@ -68,11 +228,24 @@ class TaskSerializer(serializers.ModelSerializer):
     obligation_display = serializers.CharField(source='obligation.title', read_only=True,)
     pva_display = serializers.CharField(source='obligation.pva.requisites', read_only=True)
     responsibility_type_display = serializers.CharField(source='obligation.responsibility_type.title', read_only=True)        
+    # annotated by api.services.with_comment_activity, left out for tasks loaded without it
+    comment_count = serializers.IntegerField(read_only=True)
+    last_comment_at = serializers.DateTimeField(read_only=True)
+    last_changed_at = serializers.DateTimeField(read_only=True)
         
     class Meta:
         model = Task
-        fields = '__all__'
+        exclude = ['title_normalized', 'description_normalized']
         read_only_fields = ['status', 'created_by']
+        list_serializer_class = TaskBulkListSerializer
+        expandable_fields = {
+            'schedule': ['schedule'],
+            'created_by': ['created_by_display'],
+            'assigned_to': ['assigned_to_display'],
+            'obligation': ['obligation_display'],
+            'pva': ['pva_display'],
+            'responsibility_type': ['responsibility_type_display'],
+        }
         
     def create(self, validated_data):
         schedule_data = validated_data.pop('schedule', None)
@@ -101,4 +274,41 @@ class TaskSerializer(serializers.ModelSerializer):
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
         instance.save()
-        return instance
\ No newline at end of file
+        return instance
+
+
+class CalendarTaskSerializer(TaskSerializer):
+    is_virtual = serializers.BooleanField(read_only=True)
+
+
+class SyncQuerySerializer(serializers.Serializer):
+    since = serializers.DateTimeField(required=False)
+    cursor = serializers.CharField(required=False)
+
+
+class SyncSerializer(serializers.Serializer):
+    watermark = serializers.DateTimeField()
+    next = serializers.URLField(allow_null=True)
+    tasks = TaskSerializer(many=True)
+    obligations = ObligationSerializer(many=True)
+    comments = CommentSerializer(many=True)
+    deleted = serializers.DictField(child=serializers.ListField(child=serializers.IntegerField()))
+
+
+class EventTicketSerializer(serializers.Serializer):
+    ticket = serializers.CharField()
+    expires_in = serializers.IntegerField()
+
+
+class DeletionJobSerializer(serializers.ModelSerializer):
+    model = serializers.CharField(source='content_type.model', read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DeletionJob
+        exclude = ['content_type']
+
+    def get_progress(self, job) -> float:
+        total = sum(job.total.values())
+        return min(sum(job.deleted.values()) / total, 1.0) if total else float(job.status == DeletionJob.DONE)
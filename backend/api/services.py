@@ -1,28 +1,120 @@
-from .models import Task, TaskSchedule, MedicinalProduct
-import copy
+from .models import Comment, Task, TaskSchedule
+from .audit import bulk_log
+from .stats import update_task_stats
+from .recurrence import occurrences
+from auditlog.models import LogEntry
+from django.conf import settings
+from django.db.models import Count, DateTimeField, IntegerField, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 from datetime import datetime, timedelta
-import calendar
-
-def create_recurring_task_iteration(task: Task):
-    new_task = copy.copy(task)
-    new_task.id = None
-    new_task.status = Task.NOT_STARTED
-    new_task.completion_evidence_link = ""
-
-    schedule = task.schedule
-    match schedule.frequency_type:
-        case TaskSchedule.DAILY:
-            new_task.deadline = task.deadline + timedelta(days=1)
-        case TaskSchedule.WEEKLY:
-            new_task.deadline = task.deadline + timedelta(weeks=1)
-        case TaskSchedule.MONTHLY:
-            if task.deadline.month == 12:
-                year = task.deadline.year+1
-                month = 1
-            else:
-                year = task.deadline.year 
-                month = task.deadline.month + 1
-            new_task.deadline = task.deadline.replace(year=year, month=month, day=min(calendar.monthrange(year, month)[1], task.deadline.day))      
-        case TaskSchedule.YEARLY:
-                new_task.deadline = task.deadline.replace(year=task.deadline.year+1)
-    return new_task
\ No newline at end of file
+
+RECURRING_ITERATION_CHANGES_TEXT = 'Автоматически создана новая итерация повторяющейся задачи. ID предыдущей итерации: {}.'
+
+
+def iter_iteration_deadlines(template: Task, first_deadline: datetime, start=None, until=None):
+    """
+    Deadlines of the iterations of ``template.schedule`` that come after
+    ``template`` (the latest existing iteration), optionally restricted to the
+    dates ``[start, until]``. ``first_deadline`` is the deadline of the first
+    iteration, which fixes the time of day and the defaults for unset
+    schedule fields.
+    """
+    first_deadline = timezone.localtime(first_deadline)
+    after = timezone.localtime(template.deadline).date() + timedelta(days=1)
+    start = max(start, after) if start else after
+    for day in occurrences(template.schedule, first_deadline.date(), start, until):
+        yield datetime.combine(day, first_deadline.timetz())
+
+
+def plan_recurring_task_iterations(template: Task, first_deadline: datetime, until):
+    """Unsaved iterations of ``template.schedule`` after ``template`` up to ``until``."""
+    return [
+        Task(
+            created_by_id=template.created_by_id,
+            assigned_to_id=template.assigned_to_id,
+            schedule=template.schedule,
+            obligation_id=template.obligation_id,
+            title=template.title,
+            description=template.description,
+            title_normalized=template.title_normalized,
+            description_normalized=template.description_normalized,
+            is_recurring=True,
+            deadline=deadline,
+        )
+        for deadline in iter_iteration_deadlines(template, first_deadline, until=until)
+    ]
+
+
+def recurring_schedules():
+    """
+    Schedules that still drive a recurring task, annotated with the id of their
+    latest iteration (``latest_task_id``) and the deadline of the first one
+    (``first_deadline``).
+    """
+    latest = Task.objects.filter(schedule=OuterRef('pk')).order_by('-deadline', '-id')
+    return TaskSchedule.objects.filter(tasks__is_recurring=True).annotate(
+        latest_task_id=Subquery(latest.values('id')[:1]),
+        first_deadline=Min('tasks__deadline'),
+    )
+
+
+def with_comment_activity(tasks):
+    """
+    ``tasks`` annotated with ``comment_count``, ``last_comment_at`` and
+    ``last_changed_at`` (the later of ``updated_at`` and the last comment),
+    computed in the same query by correlated subqueries over the
+    ``(task, created_at)`` index of comments.
+    """
+    comments = Comment.objects.filter(task=OuterRef('pk')).order_by()
+    last_comment_at = Subquery(comments.order_by('-created_at').values('created_at')[:1], output_field=DateTimeField())
+    return tasks.annotate(
+        comment_count=Coalesce(Subquery(comments.values('task').annotate(count=Count('*')).values('count'),
+                                        output_field=IntegerField()), 0),
+        last_comment_at=last_comment_at,
+        last_changed_at=Greatest('updated_at', Coalesce(last_comment_at, 'updated_at')),
+    )
+
+
+def materialize_recurring_tasks(schedules=None, horizon: timedelta | None = None, actor=None):
+    """
+    Pre-creates iterations of recurring tasks up to ``horizon`` from today
+    (``RECURRING_TASKS_HORIZON`` by default) with a single ``bulk_create`` and
+    one batch of audit entries. Only schedules still attached to a recurring
+    task are considered; iterations that already exist are not duplicated.
+    """
+    horizon = settings.RECURRING_TASKS_HORIZON if horizon is None else horizon
+    until = timezone.localdate() + horizon
+    queryset = recurring_schedules().filter(end_date__gte=timezone.localdate())
+    if schedules is not None:
+        queryset = queryset.filter(pk__in=[schedule.pk for schedule in schedules])
+    schedules = list(queryset)
+    templates = Task.objects.select_related('schedule').in_bulk([s.latest_task_id for s in schedules])
+
+    iterations, previous = [], []
+    for schedule in schedules:
+        template = templates[schedule.latest_task_id]
+        planned = plan_recurring_task_iterations(template, schedule.first_deadline, until)
+        if planned:
+            iterations.extend(planned)
+            previous.extend([template] + planned[:-1])
+
+    Task.objects.bulk_create(iterations)
+    update_task_stats(iterations, created=True)
+    previous_ids = {iteration.pk: prev.pk for prev, iteration in zip(previous, iterations)}
+    bulk_log([(None, iteration) for iteration in iterations], LogEntry.Action.CREATE, actor=actor,
+             changes_text=lambda iteration: RECURRING_ITERATION_CHANGES_TEXT.format(previous_ids[iteration.pk]))
+    return iterations
+
+
+def reschedule_recurring_task(task: Task, actor=None):
+    """
+    Replaces the not yet started iterations after ``task`` with ones planned
+    from its current schedule.
+    """
+    Task.objects.filter(
+        schedule=task.schedule,
+        status=Task.NOT_STARTED,
+        deadline__gt=task.deadline,
+    ).exclude(pk=task.pk).delete()
+    return materialize_recurring_tasks([task.schedule], actor=actor)
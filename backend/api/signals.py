@@ -0,0 +1,75 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import SET_NULL
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import invalidate_cached_list
+from .models import (Comment, MedicinalProduct, Obligation, ResponsibilityType, Task, TaskSchedule, TaskStats,
+                     UpdatedAtMixin, UserSearchProfile)
+from .stats import add_to_stats, update_task_stats
+from .sync import record_tombstone
+
+
+@receiver(post_save, sender=User)
+def sync_user_search_profile(sender, instance, created, update_fields, **kwargs):
+    # Most saves, such as ``last_login`` on every login, do not touch the copied fields.
+    if update_fields is not None and not UserSearchProfile.source_fields & update_fields:
+        return
+    UserSearchProfile.sync(instance, created)
+
+
+@receiver(pre_save, sender=Task)
+@receiver(pre_delete, sender=Task)
+def load_task_stats_key(sender, instance, **kwargs):
+    # Instances loaded with deferred fields (``Task.from_db``) or built by hand do not know what they are
+    # counted under.
+    if getattr(instance, '_stats_key', None) is None and instance.pk is not None and not instance._state.adding:
+        instance._stats_key = Task.objects.filter(pk=instance.pk).values_list(
+            'status', 'assigned_to_id', 'obligation_id', 'deadline').first()
+
+
+@receiver(post_save, sender=Task)
+def count_saved_task(sender, instance, created, **kwargs):
+    update_task_stats([instance], created=created)
+
+
+@receiver(post_delete, sender=Task)
+def count_deleted_task(sender, instance, **kwargs):
+    update_task_stats([instance], deleted=True)
+
+
+@receiver(post_delete, sender=User)
+def unassign_task_stats(sender, instance, **kwargs):
+    # Tasks of a deleted user are unassigned with a plain UPDATE, without signals.
+    rows = TaskStats.objects.filter(assigned_to_id=instance.pk)
+    for row in rows:
+        add_to_stats((row.status, None, row.obligation_id, row.deadline_month), row.count)
+    rows.delete()
+
+
+@receiver(pre_delete, sender=User)
+@receiver(pre_delete, sender=ResponsibilityType)
+@receiver(pre_delete, sender=TaskSchedule)
+def touch_unlinked_rows(sender, instance, **kwargs):
+    # on_delete=SET_NULL clears the references with a plain UPDATE that leaves updated_at alone, and delta
+    # sync and the ETags would never show the rows that lost them.
+    now = timezone.now()
+    for relation in sender._meta.related_objects:
+        if relation.on_delete is SET_NULL and issubclass(relation.related_model, UpdatedAtMixin):
+            relation.related_model._base_manager.filter(**{relation.field.name: instance}).update(updated_at=now)
+
+
+@receiver([post_save, post_delete], sender=ResponsibilityType)
+@receiver([post_save, post_delete], sender=MedicinalProduct)
+def invalidate_reference_data(sender, **kwargs):
+    # After commit, so that a list read in between is not cached as the new version.
+    transaction.on_commit(lambda: invalidate_cached_list(sender))
+
+
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Obligation)
+@receiver(post_delete, sender=Comment)
+def remember_deletion(sender, instance, **kwargs):
+    record_tombstone(instance)
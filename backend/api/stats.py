@@ -0,0 +1,155 @@
+"""
+Dashboard counters for tasks.
+
+``TaskStats`` holds the number of tasks per (status, assignee, obligation,
+deadline month). Signal handlers apply the difference between the state a task
+was loaded with (``Task.from_db``) and the state it is saved with; bulk
+operations, which send no signals, call ``update_task_stats`` themselves.
+Responsibility type and PVA are taken from the obligation when the counters are
+read. Tasks of past months are overdue as a whole; overdue tasks of the current
+month are counted from the tasks table over its deadline index. A dashboard
+costs O(groups × months) plus the current month's overdue tasks rather than
+O(tasks).
+"""
+from collections import Counter
+from datetime import datetime, time
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DateField, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.utils import timezone
+
+from .models import Task, TaskStats, User
+
+KEY_FIELDS = ('status', 'assigned_to_id', 'obligation_id', 'deadline')
+
+
+def raw_stats_key(task, saved=None):
+    """
+    Values the counters depend on. Fields that are not loaded are taken from
+    ``saved``, the key the task had in the database; without it, ``None`` is
+    returned if any are missing.
+    """
+    values = task.__dict__
+    if saved is None:
+        if any(field not in values for field in KEY_FIELDS):
+            return None
+        saved = (None,) * len(KEY_FIELDS)
+    return tuple(values.get(field, default) for field, default in zip(KEY_FIELDS, saved))
+
+
+def stats_key(raw_key):
+    if raw_key is None:
+        return None
+    status, assigned_to_id, obligation_id, deadline = raw_key
+    if not isinstance(deadline, datetime):
+        deadline = Task._meta.get_field('deadline').to_python(deadline)
+    if timezone.is_aware(deadline):
+        deadline = timezone.localtime(deadline)
+    return status, assigned_to_id, obligation_id, deadline.date().replace(day=1)
+
+
+def add_to_stats(key, delta):
+    status, assigned_to_id, obligation_id, deadline_month = key
+    lookup = dict(status=status, assigned_to_id=assigned_to_id, obligation_id=obligation_id,
+                  deadline_month=deadline_month)
+    if TaskStats.objects.filter(**lookup).update(count=F('count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            TaskStats.objects.create(count=delta, **lookup)
+    except IntegrityError:
+        TaskStats.objects.filter(**lookup).update(count=F('count') + delta)
+
+
+def apply_stats_changes(changes):
+    """Applies ``(old_key, new_key)`` pairs; ``None`` stands for no task."""
+    deltas = Counter()
+    for old, new in changes:
+        if old == new:
+            continue
+        if old is not None:
+            deltas[old] -= 1
+        if new is not None:
+            deltas[new] += 1
+    for key, delta in deltas.items():
+        if delta:
+            add_to_stats(key, delta)
+
+
+def update_task_stats(tasks, created=False, deleted=False):
+    """Accounts for saved (or deleted) ``tasks`` since they were loaded or last accounted for."""
+    changes = []
+    for task in tasks:
+        saved = None if created else getattr(task, '_stats_key', None)
+        new = None if deleted else raw_stats_key(task, saved)
+        changes.append((stats_key(saved), stats_key(new)))
+        task._stats_key = new
+    apply_stats_changes(changes)
+
+
+def rebuild_task_stats():
+    """Recounts everything from the tasks table."""
+    groups = (
+        Task.objects
+        .annotate(deadline_month=TruncMonth('deadline', output_field=DateField()))
+        .values('status', 'assigned_to_id', 'obligation_id', 'deadline_month')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        TaskStats.objects.all().delete()
+        TaskStats.objects.bulk_create((TaskStats(**group) for group in groups.iterator()), batch_size=1000)
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def task_stats():
+    """Task counts (total and overdue) overall and by status, assignee, responsibility type and PVA."""
+    today = timezone.localdate()
+    month = today.replace(day=1)
+    overdue = Q(deadline_month__lt=month) & ~Q(status=Task.COMPLETED)
+    counts = {
+        'total': Coalesce(Sum('count'), 0),
+        'overdue': Coalesce(Sum('count', filter=overdue), 0),
+    }
+    rows = TaskStats.objects.exclude(status=Task.HIDDEN).filter(count__gt=0)
+    overdue_this_month = Task.objects.exclude(status__in=[Task.HIDDEN, Task.COMPLETED]).filter(
+        deadline__gte=_start_of(month), deadline__lt=_start_of(today))
+
+    def grouped(*fields, **expressions):
+        names = [*fields, *expressions]
+        groups = list(rows.values(*fields, **expressions).annotate(**counts).order_by(*names))
+        recent = {
+            tuple(row[name] for name in names): row['count']
+            for row in overdue_this_month.values(*fields, **expressions).annotate(count=Count('id')).order_by()
+        }
+        for group in groups:
+            group['overdue'] += recent.get(tuple(group[name] for name in names), 0)
+        return groups
+
+    statuses = dict(Task.TASK_STATUS_CHOICES)
+    by_status = grouped('status')
+    for row in by_status:
+        row['status_display'] = statuses[row['status']]
+
+    by_assignee = grouped('assigned_to')
+    users = User.objects.in_bulk([row['assigned_to'] for row in by_assignee if row['assigned_to']])
+    for row in by_assignee:
+        user = users.get(row['assigned_to'])
+        row['assigned_to_display'] = user.get_full_name() if user else None
+
+    overall = rows.aggregate(**counts)
+    overall['overdue'] += overdue_this_month.count()
+    return {
+        **overall,
+        'by_status': by_status,
+        'by_assignee': by_assignee,
+        'by_responsibility_type': grouped(
+            responsibility_type=F('obligation__responsibility_type'),
+            responsibility_type_display=F('obligation__responsibility_type__title'),
+        ),
+        'by_pva': grouped(pva=F('obligation__pva'), pva_display=F('obligation__pva__requisites')),
+    }
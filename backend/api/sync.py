@@ -0,0 +1,131 @@
+"""
+Delta sync: tasks, obligations and comments changed after a watermark
+(``updated_at``), plus the ids of rows deleted since (``Tombstone``) and of
+tasks that became hidden.
+
+Changes are returned in pages of ``SYNC_PAGE_SIZE`` rows, tasks first, then
+obligations and comments, each in ``(updated_at, id)`` order. The cursor of
+the next page carries ``since``, the watermark of the first page and the
+position reached, so a full download is a series of index range scans and
+rows changed while it runs are left to the next sync.
+"""
+import json
+from base64 import b64decode, b64encode
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment, Obligation, Task, Tombstone
+
+SYNC_MODELS = {
+    'tasks': Task,
+    'obligations': Obligation,
+    'comments': Comment,
+}
+
+
+def record_tombstone(instance):
+    Tombstone.objects.create(content_type=ContentType.objects.get_for_model(instance), object_id=instance.pk)
+
+
+def prune_tombstones():
+    return Tombstone.objects.filter(deleted_at__lt=timezone.now() - settings.SYNC_TOMBSTONE_RETENTION).delete()[0]
+
+
+def encode_cursor(cursor):
+    data = {
+        'since': cursor['since'] and cursor['since'].isoformat(),
+        'watermark': cursor['watermark'].isoformat(),
+        'model': cursor['model'],
+        'position': cursor['position'] and [cursor['position'][0].isoformat(), cursor['position'][1]],
+    }
+    return b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(encoded):
+    """The cursor ``encode_cursor`` made; ``ValueError`` if it is not one."""
+    try:
+        data = json.loads(b64decode(encoded.encode('ascii'), validate=True).decode('utf-8'))
+        since = data['since'] and parse_datetime(data['since'])
+        watermark = parse_datetime(data['watermark'])
+        position = data['position']
+        if position is not None:
+            updated_at, pk = position
+            position = parse_datetime(updated_at), pk
+            if position[0] is None or type(pk) is not int:
+                raise ValueError
+        if watermark is None or since is None and data['since'] is not None or data['model'] not in SYNC_MODELS:
+            raise ValueError
+    except (TypeError, ValueError, KeyError, UnicodeError):
+        raise ValueError('Invalid sync cursor')
+    return {'since': since, 'watermark': watermark, 'model': data['model'], 'position': position}
+
+
+def changes_since(since=None, cursor=None, page_size=None):
+    """
+    A page of rows changed after ``since`` (all rows if ``None``), keyed like
+    ``SYNC_MODELS``, and with the first page the ids deleted since then.
+    ``cursor`` (decoded) continues from the previous page; the returned one
+    is ``None`` on the last page. The watermark lags behind the time of the
+    first page by ``SYNC_WATERMARK_LAG``, so rows of transactions that were
+    still running are sent again on the next sync.
+    """
+    page_size = page_size or settings.SYNC_PAGE_SIZE
+    if cursor is None:
+        cursor = {'since': since, 'watermark': timezone.now() - settings.SYNC_WATERMARK_LAG,
+                  'model': next(iter(SYNC_MODELS)), 'position': None}
+        first_page = True
+    else:
+        since = cursor['since']
+        first_page = False
+    watermark = cursor['watermark']
+    querysets = {
+        'tasks': Task.objects.select_related(
+            'created_by',
+            'assigned_to',
+            'schedule',
+            'obligation',
+            'obligation__pva',
+            'obligation__responsibility_type'
+        ),
+        'obligations': Obligation.objects.select_related('pva', 'responsibility_type'),
+        'comments': Comment.objects.select_related('created_by'),
+    }
+    querysets = {name: queryset.filter(updated_at__lte=watermark) for name, queryset in querysets.items()}
+    deleted = {name: [] for name in SYNC_MODELS}
+    if since is not None:
+        querysets = {name: queryset.filter(updated_at__gt=since) for name, queryset in querysets.items()}
+        if first_page:
+            content_types = ContentType.objects.get_for_models(*SYNC_MODELS.values())
+            names = {content_types[model].pk: name for name, model in SYNC_MODELS.items()}
+            tombstones = Tombstone.objects.filter(content_type__in=names, deleted_at__gt=since)
+            for content_type_id, object_id in tombstones.values_list('content_type_id', 'object_id'):
+                deleted[names[content_type_id]].append(object_id)
+            deleted['tasks'] += querysets['tasks'].filter(status=Task.HIDDEN).values_list('id', flat=True)
+    querysets['tasks'] = querysets['tasks'].exclude(status=Task.HIDDEN)
+
+    names = list(SYNC_MODELS)
+    rows = {name: [] for name in names}
+    remaining, next_cursor = page_size, None
+    for name in names[names.index(cursor['model']):]:
+        queryset = querysets[name].order_by('updated_at', 'id')
+        if name == cursor['model'] and cursor['position'] is not None:
+            updated_at, pk = cursor['position']
+            queryset = queryset.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk))
+        page = list(queryset[:remaining + 1])
+        rows[name] = page[:remaining]
+        if len(page) > remaining:
+            last = rows[name][-1] if rows[name] else None
+            next_cursor = {'since': since, 'watermark': watermark, 'model': name,
+                           'position': last and (last.updated_at, last.pk)}
+            break
+        remaining -= len(page)
+    return {
+        'watermark': watermark,
+        **rows,
+        'deleted': deleted,
+        'cursor': next_cursor,
+    }
@@ -0,0 +1,20 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Writes audit entries and runs deletion jobs synchronously: tests run
+    inside a transaction that never commits, so nothing handed over on commit
+    would run.
+    """
+    test_settings = {'AUDITLOG_ASYNC': False, 'DELETION_ASYNC': False}
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.overridden_settings = override_settings(**self.test_settings)
+        self.overridden_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.overridden_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -1,4 +1,1739 @@
-from django.test import TestCase
-from .models import User, Task, Obligation, PVA, ResponsibilityType
+import csv
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from base64 import b64encode
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from auditlog.models import LogEntry
+from django.conf import settings
+from django.core import mail, signing
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import (User, Task, Obligation, PVA, Comment, DeletionJob, MedicinalProduct, ReminderLog, ResponsibilityType,
+                     TaskSchedule, TaskStats, Tombstone, UserSearchProfile)
+from . import events, lifecycle
+from .archive import archive_cutoff, archive_log_entries, archive_tables, export_archive_tables
+from .audit import build_log_entry
+from .audit_writer import AuditLogWriter, _entry_to_record, writer
+from .deletion import Deletion, requeue_stale_jobs, run_job, start_deletion
+from .fieldsets import trim_serializer
+from .projections import compile_projection
+from .metrics import Registry, RequestMetrics
+from .profiling import load_profile, profile_ids
+from .recurrence import occurrences
+from .routers import PrimaryReplicaRouter, RoutingState, routing_state
+from .reminders import ReminderWorker
+from .search import search
+from .seeding import seed
+from .serializers import TaskScheduleSerializer, TaskSerializer
+from .services import materialize_recurring_tasks
+from .stats import rebuild_task_stats
+from .views import TaskViewSet
+
+
+class TaskProjectionTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov', first_name='Иван', last_name='Иванов')
+        cls.nameless = User.objects.create_user('petrov')
+        responsibility_type = ResponsibilityType.objects.create(title='Отчет')
+        pva = PVA.objects.create(requisites='Договор № 1', start_date=date(2025, 1, 1))
+        obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                               end_date=date(2026, 1, 1), responsibility_type=responsibility_type)
+        bare_obligation = Obligation.objects.create(pva=pva, title='Без типа', start_date=date(2025, 1, 1),
+                                                    end_date=date(2026, 1, 1))
+        schedule = TaskSchedule.objects.create(frequency_type=TaskSchedule.MONTHLY, day_of_month=5,
+                                               start_date=date(2025, 1, 1), end_date=date(2026, 1, 1))
+        cls.commented = Task.objects.create(created_by=cls.user, assigned_to=cls.nameless, obligation=obligation,
+                            title='Ежемесячный отчет', description='«Кавычки» и \\ слэш', status=Task.IN_PROGRESS,
+                            deadline=datetime(2025, 3, 5, 9, 30, 15, 123456, tzinfo=dt_timezone.utc),
+                            is_recurring=True, schedule=schedule)
+        Task.objects.create(created_by=cls.nameless, obligation=bare_obligation, title='Разовая задача',
+                            deadline=datetime(2025, 12, 31, 21, 0, tzinfo=dt_timezone.utc))
+        Task.objects.create(created_by=cls.user, assigned_to=cls.user, obligation=obligation, title='Завершена',
+                            status=Task.COMPLETED, completion_evidence_link='https://example.com/evidence',
+                            deadline=datetime(2025, 6, 1, tzinfo=dt_timezone.utc))
+
+        for text in ('Принято', 'Готово'):
+            Comment.objects.create(created_by=cls.user, task=cls.commented, text=text)
+
+    def queryset(self):
+        return TaskViewSet().get_queryset()
+
+    def test_projection_matches_serializer(self):
+        renderer = JSONRenderer()
+        expected = renderer.render(TaskSerializer(self.queryset(), many=True).data)
+        projection = compile_projection(TaskSerializer(), Task, self.queryset().query.annotations)
+        self.assertIsNotNone(projection)
+        self.assertEqual(renderer.render(projection.rows(projection.values(self.queryset()))), expected)
+
+    def test_list_endpoint_matches_serializer(self):
+        self.client.force_authenticate(self.user)
+        renderer = JSONRenderer()
+        response = self.client.get('/api/tasks/')
+        self.assertEqual(response.content, renderer.render(TaskSerializer(self.queryset(), many=True).data))
+
+        with self.assertNumQueries(1):
+            tasks = {task['id']: task for task in self.client.get('/api/tasks/').json()}
+        last_comment = Comment.objects.latest('created_at')
+        self.assertEqual(tasks[self.commented.id]['comment_count'], 2)
+        self.assertEqual(tasks[self.commented.id]['last_comment_at'],
+                         TaskSerializer().fields['last_comment_at'].to_representation(last_comment.created_at))
+        self.assertEqual(tasks[self.commented.id]['last_changed_at'], tasks[self.commented.id]['last_comment_at'])
+        self.assertEqual({task['comment_count'] for task_id, task in tasks.items() if task_id != self.commented.id}, {0})
+
+        response = self.client.get('/api/tasks/', {'fields': 'id,schedule,assigned_to_display', 'expand': ''})
+        serializer = trim_serializer(TaskSerializer(self.queryset(), many=True),
+                                     ['id', 'schedule', 'assigned_to_display'], [])
+        self.assertEqual(response.content, renderer.render(serializer.data))
+
+        with override_settings(LIST_PROJECTIONS=False):
+            self.assertEqual(self.client.get('/api/tasks/').content,
+                             renderer.render(TaskSerializer(self.queryset(), many=True).data))
+
+        response = self.client.get('/api/tasks/', {'page_size': 2})
+        self.assertEqual(renderer.render(response.data['results']),
+                         renderer.render(TaskSerializer(self.queryset()[:2], many=True).data))
+        response = self.client.get(response.data['next'])
+        self.assertEqual(renderer.render(response.data['results']),
+                         renderer.render(TaskSerializer(self.queryset()[2:], many=True).data))
+
+
+class ReminderTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov', email='ivanov@example.com', first_name='Иван')
+        cls.other = User.objects.create_user('petrov', email='petrov@example.com')
+        pva = PVA.objects.create(requisites='Договор № 1', start_date=date(2025, 1, 1))
+        cls.obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                                   end_date=date(2030, 1, 1))
+
+    def task(self, deadline, assigned_to=None, status=Task.NOT_STARTED, title='Отчет'):
+        return Task.objects.create(created_by=self.user, assigned_to=assigned_to, obligation=self.obligation,
+                                   title=title, deadline=deadline, status=status)
+
+    def worker(self, now):
+        return ReminderWorker(now=now, offsets=[timedelta(hours=1)], lookahead=timedelta(minutes=15),
+                              catch_up=timedelta(minutes=30))
+
+    def test_digest_per_user_sent_once(self):
+        now = timezone.now()
+        self.task(now + timedelta(minutes=50), self.user, title='Первая')
+        self.task(now + timedelta(minutes=55), self.user, Task.IN_PROGRESS, title='Вторая')
+        self.task(now + timedelta(minutes=50), self.other)
+        self.task(now + timedelta(minutes=50), self.user, Task.COMPLETED)
+        self.task(now + timedelta(minutes=50))
+        self.task(now + timedelta(hours=3), self.user)
+
+        worker = self.worker(now)
+        self.assertEqual(worker.poll(now), 2)
+        digest = next(message for message in mail.outbox if message.to == ['ivanov@example.com'])
+        self.assertIn('Первая', digest.body)
+        self.assertIn('Вторая', digest.body)
+        self.assertEqual(ReminderLog.objects.count(), 3)
+
+        self.assertEqual(worker.poll(now + timedelta(minutes=1)), 0)
+        self.assertEqual(self.worker(now).poll(now), 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_reminders_wait_in_wheel_and_follow_deadline_changes(self):
+        # The deadline is changed at the real time of the third poll.
+        now = timezone.now() - timedelta(minutes=11)
+        task = self.task(now + timedelta(hours=1, minutes=10), self.user)
+        worker = self.worker(now)
+        self.assertEqual(worker.poll(now), 0)
+        self.assertEqual(worker.poll(now + timedelta(minutes=10)), 1)
+
+        task.deadline = now + timedelta(hours=1, minutes=12)
+        task.save()
+        self.assertEqual(worker.poll(now + timedelta(minutes=11)), 0)
+        self.assertEqual(worker.poll(now + timedelta(minutes=12)), 1)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class PVALifecycleTests(APITestCase):
+    def test_apply_moves_pvas_in_batches(self):
+        today = date(2026, 1, 10)
+        lead_time = timedelta(days=30)
+        planned = PVA.objects.create(requisites='1', status=PVA.ACTIVE, start_date=date(2026, 2, 1))
+        active = PVA.objects.create(requisites='2', start_date=date(2025, 1, 1), end_date=date(2027, 1, 1))
+        ending = [PVA.objects.create(requisites=str(i), status=PVA.ACTIVE, start_date=date(2025, 1, 1),
+                                     end_date=date(2026, 2, 1)) for i in range(3)]
+        completed = PVA.objects.create(requisites='3', status=PVA.ENDING, end_date=date(2026, 1, 9))
+        undated = PVA.objects.create(requisites='4', status=PVA.ENDING)
+        obligation = Obligation.objects.create(pva=completed, title='ПСБ', start_date=date(2025, 1, 1),
+                                               end_date=date(2026, 1, 9))
+
+        self.assertEqual(lifecycle.plan(today, lead_time), lifecycle.apply(today, lead_time, chunk_size=2))
+        statuses = dict(PVA.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[planned.id], PVA.PLANNED)
+        self.assertEqual(statuses[active.id], PVA.ACTIVE)
+        self.assertEqual({statuses[pva.id] for pva in ending}, {PVA.ENDING})
+        self.assertEqual(statuses[completed.id], PVA.COMPLETED)
+        self.assertEqual(statuses[undated.id], PVA.ENDING)
+        obligation.refresh_from_db()
+        self.assertFalse(obligation.is_active)
+
+        entries = LogEntry.objects.filter(object_pk='', changes__status=[PVA.ACTIVE, PVA.ENDING])
+        self.assertEqual(sorted(len(entry.additional_data['ids']) for entry in entries), [1, 2])
+        self.assertEqual(lifecycle.plan(today, lead_time), ({}, {}))
+
+
+class DeletionJobTests(APITestCase):
+    @override_settings(DELETION_CHUNK_SIZE=2)
+    def test_pva_deleted_bottom_up_with_one_audit_entry(self):
+        user = User.objects.create_user('ivanov')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        pva.medicinal_products.add(MedicinalProduct.objects.create(title='Препарат'))
+        other = Obligation.objects.create(pva=PVA.objects.create(requisites='Договор № 2'), title='Другое',
+                                          start_date=date(2025, 1, 1), end_date=date(2026, 1, 1))
+        obligations = [Obligation.objects.create(pva=pva, title=str(i), start_date=date(2025, 1, 1),
+                                                 end_date=date(2026, 1, 1)) for i in range(2)]
+        tasks = [Task.objects.create(created_by=user, assigned_to=user, obligation=obligation, title='Отчет',
+                                     deadline=timezone.now()) for obligation in obligations * 2 + [other]]
+        comments = [Comment.objects.create(created_by=user, task=task, text='Готово') for task in tasks]
+        ReminderLog.objects.create(task=tasks[0], offset_minutes=60, deadline=tasks[0].deadline)
+        LogEntry.objects.all().delete()
+
+        self.client.force_authenticate(user)
+        response = self.client.delete(f'/api/pvas/{pva.id}/')
+        self.assertEqual(response.status_code, 202)
+        job = self.client.get(response['Location']).json()
+        self.assertEqual((job['status'], job['progress']), (DeletionJob.DONE, 1.0))
+        self.assertEqual(job['deleted'], {'api.Comment': 4, 'api.Task': 4, 'api.Obligation': 2, 'api.PVA': 1})
+
+        self.assertFalse(PVA.objects.filter(id=pva.id).exists())
+        self.assertEqual(list(Task.objects.values_list('id', flat=True)), [tasks[-1].id])
+        self.assertEqual(list(Comment.objects.values_list('id', flat=True)), [comments[-1].id])
+        self.assertEqual(list(TaskStats.objects.filter(count__gt=0).values_list('obligation_id', 'count')),
+                         [(other.id, 1)])
+        self.assertEqual(Tombstone.objects.count(), 10)
+        entry = LogEntry.objects.get()
+        self.assertEqual((entry.action, entry.object_id), (LogEntry.Action.DELETE, pva.id))
+        self.assertEqual(sorted(entry.additional_data['deleted']['api.Task']), [task.id for task in tasks[:-1]])
+
+
+@override_settings(DELETION_ASYNC=True, DELETION_CHUNK_SIZE=2)
+class DeletionJobResumeTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+        cls.pva = PVA.objects.create(requisites='Договор № 1')
+        obligations = [Obligation.objects.create(pva=cls.pva, title=str(i), start_date=date(2025, 1, 1),
+                                                 end_date=date(2026, 1, 1)) for i in range(2)]
+        for obligation in obligations * 2:
+            task = Task.objects.create(created_by=cls.user, obligation=obligation, title='Отчет',
+                                       deadline=timezone.now())
+            Comment.objects.create(created_by=cls.user, task=task, text='Готово')
+
+    def test_started_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            job, created = start_deletion(self.pva, self.user)
+        self.assertTrue(created)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(job.status, DeletionJob.PENDING)
+        self.assertEqual(start_deletion(self.pva, self.user), (job, False))
+
+    def crash(self, method, calls):
+        """A job of the PVA whose process died in the ``calls + 1``-th call of ``Deletion.<method>``."""
+        job, _ = start_deletion(self.pva, self.user)
+        original = getattr(Deletion, method)
+        made = 0
+
+        def dying(deletion, *args, **kwargs):
+            nonlocal made
+            if made == calls:
+                raise SystemExit
+            made += 1
+            return original(deletion, *args, **kwargs)
+
+        with mock.patch.object(Deletion, method, dying), self.assertRaises(SystemExit):
+            run_job(job.pk, chunk_size=2)
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.RUNNING)
+        DeletionJob.objects.filter(id=job.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        return job
+
+    def resume(self, job):
+        # A job making progress is left to its runner.
+        self.assertEqual(requeue_stale_jobs(timedelta(hours=2)), 0)
+        self.assertFalse(run_job(job.pk))
+        self.assertEqual(requeue_stale_jobs(timedelta(minutes=10)), 1)
+        self.assertTrue(run_job(job.pk))
+        job.refresh_from_db()
+        self.assertEqual(job.status, DeletionJob.DONE)
+        self.assertEqual(job.deleted, {'api.Comment': 4, 'api.Task': 4, 'api.Obligation': 2, 'api.PVA': 1})
+        self.assertFalse(Obligation.objects.exists())
+        self.assertFalse(PVA.objects.exists())
+        return LogEntry.objects.get(action=LogEntry.Action.DELETE, object_id=self.pva.pk)
+
+    def test_resumed_after_interruption(self):
+        # Died with the comments and tasks deleted.
+        job = self.crash('delete_chunks', 2)
+        self.assertEqual(job.deleted, {'api.Comment': 4, 'api.Task': 4})
+        entry = self.resume(job)
+        self.assertEqual(entry.object_repr, str(self.pva))
+        self.assertEqual(entry.changes_dict['requisites'], ['Договор № 1', 'None'])
+        # Only what the resumed run deleted itself.
+        self.assertEqual(entry.additional_data['deleted'].keys(), {'api.Obligation', 'api.PVA'})
+
+    def test_resumed_after_root_deleted(self):
+        # Died with everything deleted, before the audit entry and the status were saved.
+        job = self.crash('log', 0)
+        entry = self.resume(job)
+        self.assertEqual((entry.object_repr, entry.changes, entry.actor),
+                         (job.object_repr, {}, self.user))
+        self.assertEqual(entry.additional_data, {'deleted': {}, 'deletion_job': job.pk})
+
+
+class DeletionJobThreadTests(APITransactionTestCase):
+    @override_settings(DELETION_ASYNC=True)
+    def test_job_runs_in_thread_after_commit(self):
+        user = User.objects.create_user('ivanov')
+        obligation = Obligation.objects.create(pva=PVA.objects.create(requisites='Договор № 1'), title='ПСБ',
+                                               start_date=date(2025, 1, 1), end_date=date(2026, 1, 1))
+        Task.objects.create(created_by=user, obligation=obligation, title='Отчет', deadline=timezone.now())
+        self.client.force_authenticate(user)
+        response = self.client.delete(f'/api/obligations/{obligation.id}/')
+        self.assertEqual(response.status_code, 202)
+        [thread] = [thread for thread in threading.enumerate()
+                    if thread.name == f'deletion-job-{response.data["id"]}']
+        thread.join(30)
+        self.assertFalse(thread.is_alive())
+        job = DeletionJob.objects.get(id=response.data['id'])
+        self.assertEqual((job.status, job.deleted), (DeletionJob.DONE, {'api.Task': 1, 'api.Obligation': 1}))
+        self.assertFalse(Obligation.objects.filter(id=obligation.id).exists())
+
+
+class KeysetPaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                               end_date=date(2026, 1, 1))
+        cls.task = Task.objects.create(created_by=cls.user, obligation=obligation, title='Отчет',
+                                       deadline=timezone.now())
+        comments = [Comment.objects.create(created_by=cls.user, task=cls.task, text=str(i)) for i in range(7)]
+        # Ties on created_at are broken by id.
+        moment = timezone.now()
+        Comment.objects.filter(id__in=[comments[1].id, comments[2].id, comments[3].id]).update(created_at=moment)
+        cls.ids = list(Comment.objects.order_by('created_at', 'id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def url(self):
+        return f'/api/tasks/{self.task.id}/comments/'
+
+    def ids_of(self, response):
+        return [comment['id'] for comment in response.data['results']]
+
+    def test_cursor_round_trip(self):
+        response = self.client.get(self.url(), {'page_size': 3})
+        self.assertIsNone(response.data['previous'])
+        pages = [self.ids_of(response)]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(self.ids_of(response))
+        self.assertEqual(pages, [self.ids[:3], self.ids[3:6], self.ids[6:]])
+        self.assertEqual(len(self.client.get(self.url()).data), len(self.ids))
+
+    def test_reverse_paging(self):
+        first = self.client.get(self.url(), {'page_size': 2})
+        second = self.client.get(first.data['next'])
+        third = self.client.get(second.data['next'])
+        back = self.client.get(third.data['previous'])
+        self.assertEqual(self.ids_of(back), self.ids[2:4])
+        back = self.client.get(back.data['previous'])
+        self.assertEqual(self.ids_of(back), self.ids[:2])
+        self.assertIsNone(back.data['previous'])
+        self.assertEqual(self.ids_of(self.client.get(back.data['next'])), self.ids[2:4])
+
+    def test_malformed_cursor(self):
+        encoded = [b64encode(data.encode()).decode() for data in (
+            '{"p": [1]}', '{"x": 1}', '{"p": ["x", "y"]}', '{"p": {"a": 1, "b": 2}}', '{"p": [null, 1]}')]
+        for cursor in ('garbage', '!!', *encoded):
+            response = self.client.get(self.url(), {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+            self.assertEqual(response.data['detail'], 'Некорректный курсор.')
+
+        # lists ordered by a datetime field get values of the wrong JSON type
+        encoded = [b64encode(data.encode()).decode() for data in (
+            '{"p": [1, 2]}', '{"p": [{"a": 1}, 2]}', '{"p": [[1], 2]}', '{"p": [true, 2]}')]
+        for url in ('/api/tasks/', '/api/auditlog/', '/api/async/tasks/'):
+            for cursor in encoded:
+                response = self.client.get(url, {'cursor': cursor})
+                self.assertEqual(response.status_code, 404, (url, cursor))
+                self.assertEqual(response.data['detail'], 'Некорректный курсор.')
+
+
+class ExportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov', first_name='Иван', last_name='Иванов')
+        cls.pva = PVA.objects.create(requisites='Договор № 1', description='Строка; с «кавычками»\nи переносом')
+        cls.pva.medicinal_products.add(MedicinalProduct.objects.create(title='Препарат А'),
+                                       MedicinalProduct.objects.create(title='Препарат Б'))
+        obligation = Obligation.objects.create(pva=cls.pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                               end_date=date(2026, 1, 1))
+        for i in range(3):
+            Task.objects.create(created_by=cls.user, assigned_to=cls.user if i else None, obligation=obligation,
+                                title=f'Отчет {i}', deadline=datetime(2025, 3, i + 1, tzinfo=dt_timezone.utc))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def expected(self, url):
+        return json.loads(JSONRenderer().render(self.client.get(url).data))
+
+    def test_ndjson_matches_serializer(self):
+        for url in ('/api/tasks/', '/api/obligations/', '/api/pvas/'):
+            response = self.client.get(f'{url}export/', {'file_format': 'ndjson'})
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+            rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+            self.assertEqual(rows, self.expected(url))
+
+    def test_csv_matches_serializer(self):
+        response = self.client.get('/api/pvas/export/')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="pvas.csv"')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeff'))
+        header, *rows = csv.reader(io.StringIO(content[1:]))
+        expected = self.expected('/api/pvas/')
+        self.assertEqual(header, list(expected[0]))
+        self.assertEqual(len(rows), 1)
+        row = dict(zip(header, rows[0]))
+        self.assertEqual(row['medicinal_products'], 'Препарат А; Препарат Б')
+        self.assertEqual(row['description'], self.pva.description)
+        self.assertEqual(row['start_date'], '')
+        self.assertEqual(row['id'], str(self.pva.id))
+
+        response = self.client.get('/api/tasks/export/', {'assigned_to': self.user.id})
+        header, *rows = csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8')[1:]))
+        self.assertEqual([dict(zip(header, row))['title'] for row in rows], ['Отчет 1', 'Отчет 2'])
+
+    def test_unknown_format(self):
+        response = self.client.get('/api/tasks/export/', {'file_format': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TaskBulkTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        cls.obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                                   end_date=date(2026, 1, 1))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def item(self, title, **fields):
+        return dict({'title': title, 'obligation': self.obligation.id, 'deadline': '2025-06-01T09:00:00Z'}, **fields)
+
+    def task(self, title, **fields):
+        return Task.objects.create(created_by=self.user, obligation=self.obligation, title=title,
+                                   deadline=datetime(2025, 6, 1, 9, tzinfo=dt_timezone.utc), **fields)
+
+    def audit_inserts(self, queries):
+        return [query for query in queries if query['sql'].startswith('INSERT INTO "auditlog_logentry"')]
+
+    def test_bulk_create(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/tasks/bulk/', [self.item(f'Отчет {i}') for i in range(5)], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([task['title'] for task in response.data], [f'Отчет {i}' for i in range(5)])
+        tasks = Task.objects.filter(title__startswith='Отчет')
+        self.assertEqual(set(tasks.values_list('created_by', flat=True)), {self.user.id})
+        self.assertEqual(set(tasks.values_list('title_normalized', flat=True)), {f'отчет {i}' for i in range(5)})
+        entries = LogEntry.objects.filter(action=LogEntry.Action.CREATE, content_type__model='task')
+        self.assertEqual(entries.count(), 5)
+        self.assertEqual(len(self.audit_inserts(queries)), 1)
+        self.assertEqual(TaskStats.objects.get().count, 5)
+
+    def test_bulk_update(self):
+        tasks = [self.task(f'Отчет {i}') for i in range(3)]
+        LogEntry.objects.all().delete()
+        data = [{'id': task.id, 'title': f'Новый {task.id}'} for task in tasks]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch('/api/tasks/bulk/', data, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dict(Task.objects.values_list('id', 'title')), {task.id: f'Новый {task.id}' for task in tasks})
+        entries = LogEntry.objects.filter(action=LogEntry.Action.UPDATE)
+        self.assertEqual(sorted(entry.changes['title'][1] for entry in entries), sorted(item['title'] for item in data))
+        self.assertEqual(len(self.audit_inserts(queries)), 1)
+
+    def test_all_or_nothing(self):
+        response = self.client.post('/api/tasks/bulk/', [self.item('Отчет'), self.item('')], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertFalse(Task.objects.exists())
+
+        task, completed = self.task('Отчет'), self.task('Завершена', status=Task.COMPLETED)
+        for data, status_code in (
+                ([{'id': task.id, 'title': 'Новый'}, {'id': task.id + 100, 'title': 'Новый'}], 404),
+                ([{'id': task.id, 'title': 'Новый'}, {'id': completed.id, 'title': 'Новый'}], 403),
+                ([{'id': task.id, 'title': 'Новый'}, {'id': task.id, 'title': 'Другой'}], 400)):
+            self.assertEqual(self.client.patch('/api/tasks/bulk/', data, format='json').status_code, status_code)
+        other = self.task('Другая')
+        response = self.client.patch('/api/tasks/bulk/', [{'id': task.id, 'title': 'Новый'},
+                                                          {'id': other.id, 'obligation': 0}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Task.objects.get(id=task.id).title, 'Отчет')
+
+    def test_ids_must_be_integers(self):
+        task = self.task('Отчет')
+        for task_id in (str(task.id), [task.id], None, True, 1.0):
+            response = self.client.patch('/api/tasks/bulk/', [{'id': task_id, 'title': 'Новый'}], format='json')
+            self.assertEqual(response.status_code, 400, task_id)
+        self.assertEqual(Task.objects.get().title, 'Отчет')
+
+
+class RecurrenceTests(APITestCase):
+    def dates(self, anchor, start, end, frequency, **fields):
+        schedule = TaskSchedule(frequency_type=frequency, start_date=start, end_date=end, **fields)
+        return list(occurrences(schedule, anchor))
+
+    def test_daily_and_weekly(self):
+        self.assertEqual(self.dates(date(2024, 2, 27), date(2024, 2, 27), date(2024, 3, 2), TaskSchedule.DAILY),
+                         [date(2024, 2, 27), date(2024, 2, 28), date(2024, 2, 29), date(2024, 3, 1), date(2024, 3, 2)])
+        self.assertEqual(
+            self.dates(date(2025, 1, 1), date(2025, 1, 1), date(2025, 1, 31), TaskSchedule.WEEKLY, day_of_week=4),
+            [date(2025, 1, 3), date(2025, 1, 10), date(2025, 1, 17), date(2025, 1, 24), date(2025, 1, 31)])
+        # Without day_of_week: the weekday of the first deadline (a Wednesday).
+        self.assertEqual(self.dates(date(2025, 1, 1), date(2025, 1, 2), date(2025, 1, 20), TaskSchedule.WEEKLY),
+                         [date(2025, 1, 8), date(2025, 1, 15)])
+
+    def test_monthly_day_clamped_to_month_end(self):
+        self.assertEqual(
+            self.dates(date(2024, 1, 31), date(2024, 1, 1), date(2024, 6, 30), TaskSchedule.MONTHLY, day_of_month=31),
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 30), date(2024, 5, 31),
+             date(2024, 6, 30)])
+        self.assertEqual(self.dates(date(2025, 1, 31), date(2025, 2, 1), date(2025, 3, 1), TaskSchedule.MONTHLY),
+                         [date(2025, 2, 28)])
+
+    def test_monthly_week_of_month(self):
+        def dates(week_of_month, day_of_week):
+            return self.dates(date(2025, 1, 1), date(2025, 1, 1), date(2025, 3, 31), TaskSchedule.MONTHLY,
+                              week_of_month=week_of_month, day_of_week=day_of_week)
+
+        self.assertEqual(dates(2, 0), [date(2025, 1, 13), date(2025, 2, 10), date(2025, 3, 10)])
+        self.assertEqual(dates(-1, 4), [date(2025, 1, 31), date(2025, 2, 28), date(2025, 3, 28)])
+        # February 2025 has four Mondays: a fifth one is the last.
+        self.assertEqual(dates(5, 0), [date(2025, 1, 27), date(2025, 2, 24), date(2025, 3, 31)])
+
+    def test_yearly_february_29(self):
+        self.assertEqual(
+            self.dates(date(2024, 2, 29), date(2023, 1, 1), date(2026, 12, 31), TaskSchedule.YEARLY),
+            [date(2023, 2, 28), date(2024, 2, 29), date(2025, 2, 28), date(2026, 2, 28)])
+        self.assertEqual(
+            self.dates(date(2024, 1, 1), date(2024, 1, 1), date(2025, 12, 31), TaskSchedule.YEARLY,
+                       month_of_year=11, week_of_month=4, day_of_week=3),
+            [date(2024, 11, 28), date(2025, 11, 27)])
+
+    def test_range_clipped_to_schedule(self):
+        schedule = TaskSchedule(frequency_type=TaskSchedule.MONTHLY, day_of_month=15,
+                                start_date=date(2025, 3, 1), end_date=date(2025, 6, 1))
+        self.assertEqual(list(occurrences(schedule, date(2025, 3, 15), date(2025, 1, 1), date(2025, 12, 31))),
+                         [date(2025, 3, 15), date(2025, 4, 15), date(2025, 5, 15)])
+        self.assertEqual(list(occurrences(schedule, date(2025, 3, 15), date(2025, 4, 16), date(2025, 5, 14))), [])
+        self.assertEqual(list(occurrences(schedule, date(2025, 3, 15), date(2025, 7, 1))), [])
+
+
+class RecurringTaskTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        cls.obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                                   end_date=date(2030, 1, 1))
+
+    def setUp(self):
+        today = timezone.localdate()
+        self.schedule = TaskSchedule.objects.create(frequency_type=TaskSchedule.MONTHLY, day_of_month=10,
+                                                    start_date=today - timedelta(days=31),
+                                                    end_date=today + timedelta(days=365))
+        first = self.next_day(today - timedelta(days=31), 10)
+        self.template = Task.objects.create(created_by=self.user, obligation=self.obligation, title='Отчет',
+                                            is_recurring=True, schedule=self.schedule,
+                                            deadline=datetime.combine(first, time(9), tzinfo=dt_timezone.utc))
+
+    @staticmethod
+    def next_day(start, day_of_month):
+        day = start
+        while day.day != day_of_month:
+            day += timedelta(days=1)
+        return day
+
+    def iterations(self):
+        return list(Task.objects.filter(schedule=self.schedule).order_by('deadline'))
+
+    def test_materialize_is_idempotent(self):
+        created = materialize_recurring_tasks(horizon=timedelta(days=90))
+        self.assertGreaterEqual(len(created), 3)
+        iterations = self.iterations()
+        self.assertEqual(len(iterations), len(created) + 1)
+        self.assertEqual({timezone.localtime(task.deadline).day for task in iterations}, {10})
+        self.assertEqual({timezone.localtime(task.deadline).time() for task in iterations},
+                         {timezone.localtime(self.template.deadline).time()})
+        self.assertEqual(len({task.deadline for task in iterations}), len(iterations))
+        self.assertLessEqual(iterations[-1].deadline.date(), timezone.localdate() + timedelta(days=90))
+
+        self.assertEqual(materialize_recurring_tasks(horizon=timedelta(days=90)), [])
+        self.assertEqual(self.iterations(), iterations)
+        self.assertEqual(TaskStats.objects.aggregate(total=Sum('count'))['total'], len(iterations))
+
+    def test_bulk_patch_reschedules_iterations(self):
+        materialize_recurring_tasks()
+        count = len(self.iterations())
+        self.client.force_authenticate(self.user)
+        schedule = TaskScheduleSerializer(self.schedule).data
+        schedule.update(day_of_month=20)
+        response = self.client.patch('/api/tasks/bulk/', [{'id': self.template.id, 'is_recurring': True,
+                                                           'schedule': schedule}], format='json')
+        self.assertEqual(response.status_code, 200)
+        iterations = self.iterations()
+        self.assertEqual(iterations[0], self.template)
+        self.assertEqual({timezone.localtime(task.deadline).day for task in iterations[1:]}, {20})
+        self.assertIn(len(iterations), (count, count + 1))
+
+    def test_invalid_schedule_rejected(self):
+        self.client.force_authenticate(self.user)
+        task = {'title': 'Отчет', 'obligation': self.obligation.id, 'deadline': '2025-06-01T09:00:00Z',
+                'is_recurring': True}
+        schedules = Task.objects.filter(is_recurring=True).count()
+        for fields in ({'frequency_type': 'M', 'week_of_month': 0, 'day_of_week': 2},
+                       {'frequency_type': 'M', 'week_of_month': 6, 'day_of_week': 2},
+                       {'frequency_type': 'M', 'day_of_month': -5},
+                       {'frequency_type': 'M', 'day_of_month': 32},
+                       {'frequency_type': 'W', 'day_of_week': 9},
+                       {'frequency_type': 'Y', 'month_of_year': 13},
+                       {'frequency_type': 'D', 'day_of_week': 2},
+                       {'frequency_type': 'W', 'day_of_month': 5},
+                       {'frequency_type': 'M', 'month_of_year': 5},
+                       {'frequency_type': 'M', 'day_of_month': 5, 'week_of_month': 1},
+                       {'frequency_type': 'M', 'day_of_week': 2}):
+            schedule = dict(fields, start_date='2025-01-01', end_date='2025-12-31')
+            response = self.client.post('/api/tasks/', dict(task, schedule=schedule), format='json')
+            self.assertEqual(response.status_code, 400, fields)
+            self.assertIn('schedule', response.data)
+            response = self.client.post('/api/tasks/bulk/', [dict(task, schedule=schedule)], format='json')
+            self.assertEqual(response.status_code, 400, fields)
+            response = self.client.patch(f'/api/tasks/{self.template.id}/', {'schedule': schedule}, format='json')
+            self.assertEqual(response.status_code, 400, fields)
+        self.assertEqual(Task.objects.filter(is_recurring=True).count(), schedules)
+
+        schedule = {'frequency_type': 'M', 'week_of_month': -1, 'day_of_week': 4,
+                    'start_date': '2025-01-01', 'end_date': '2025-12-31'}
+        response = self.client.post('/api/tasks/', dict(task, schedule=schedule), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['schedule']['week_of_month'], -1)
+
+
+class CalendarTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        cls.obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                                   end_date=date(2026, 1, 1))
+        schedule = TaskSchedule.objects.create(frequency_type=TaskSchedule.MONTHLY, day_of_month=10,
+                                               start_date=date(2025, 1, 1), end_date=date(2025, 12, 31))
+        cls.template = Task.objects.create(created_by=cls.user, obligation=cls.obligation, title='Ежемесячный',
+                                           is_recurring=True, schedule=schedule,
+                                           deadline=datetime(2025, 1, 10, 9, tzinfo=dt_timezone.utc))
+        cls.single = Task.objects.create(created_by=cls.user, obligation=cls.obligation, title='Разовая',
+                                         deadline=datetime(2025, 2, 15, 12, tzinfo=dt_timezone.utc))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def rows(self, **params):
+        params.setdefault('deadline__gte', '2025-01-01T00:00:00Z')
+        params.setdefault('deadline__lte', '2025-04-30T00:00:00Z')
+        response = self.client.get('/api/tasks/calendar/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(row['deadline'][:10], row['id'], row['is_virtual'], row['status'])
+                for row in json.loads(b''.join(response.streaming_content))]
+
+    def test_merged_in_deadline_order(self):
+        self.assertEqual(self.rows(), [
+            ('2025-01-10', self.template.id, False, Task.NOT_STARTED),
+            ('2025-02-10', None, True, Task.NOT_STARTED),
+            ('2025-02-15', self.single.id, False, Task.NOT_STARTED),
+            ('2025-03-10', None, True, Task.NOT_STARTED),
+            ('2025-04-10', None, True, Task.NOT_STARTED),
+        ])
+
+    def test_range_bounds_are_inclusive(self):
+        self.assertEqual(
+            [row[0] for row in self.rows(deadline__gte='2025-02-10T09:00:00Z', deadline__lte='2025-03-10T09:00:00Z')],
+            ['2025-02-10', '2025-02-15', '2025-03-10'])
+        self.assertEqual(
+            [row[0] for row in self.rows(deadline__gte='2025-02-10T09:00:01Z', deadline__lte='2025-03-10T08:59:59Z')],
+            ['2025-02-15'])
+
+    def test_filters_apply_to_virtual_rows(self):
+        Task.objects.filter(id=self.template.id).update(status=Task.COMPLETED)
+        self.assertEqual(self.rows(status=Task.COMPLETED), [('2025-01-10', self.template.id, False, Task.COMPLETED)])
+        self.assertEqual([row[1:3] for row in self.rows(status=Task.NOT_STARTED)],
+                         [(None, True), (self.single.id, False), (None, True), (None, True)])
+        self.assertEqual([row[1] for row in self.rows(title__icontains='разов')], [self.single.id])
+        self.assertEqual(self.rows(assigned_to=self.user.id), [])
+
+
+class SearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        cls.obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                                   end_date=date(2026, 1, 1))
+        deadline = timezone.now()
+        cls.in_title = Task.objects.create(created_by=cls.user, obligation=cls.obligation, title='Отчёт по безопасности',
+                                           deadline=deadline + timedelta(days=2))
+        cls.in_description = Task.objects.create(created_by=cls.user, obligation=cls.obligation, title='Письмо',
+                                                 description='Приложить отчет', deadline=deadline)
+        cls.other = Task.objects.create(created_by=cls.user, obligation=cls.obligation, title='Звонок',
+                                        deadline=deadline + timedelta(days=1))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def found(self, value):
+        return set(search(Task.objects.all(), value).values_list('id', flat=True))
+
+    def test_prefixes_and_yo(self):
+        expected = {self.in_title.id, self.in_description.id}
+        self.assertEqual(self.found('отчет'), expected)
+        self.assertEqual(self.found('ОТЧЁ'), expected)
+        self.assertEqual(self.found('отчет безопас'), {self.in_title.id})
+        self.assertEqual(self.found('!!'), set())
+
+    def test_triggers_follow_writes(self):
+        Task.objects.filter(id=self.other.id).update(title='Отчет регулятору')
+        self.assertIn(self.other.id, self.found('регулятор'))
+        self.assertEqual(self.found('звонок'), set())
+        [created] = Task.objects.bulk_create([Task(created_by=self.user, obligation=self.obligation,
+                                                   title='Сверка', deadline=timezone.now())])
+        self.assertEqual(self.found('сверка'), {created.id})
+        Task.objects.filter(id=created.id).delete()
+        self.assertEqual(self.found('сверка'), set())
+
+    def test_filter_orders_by_rank(self):
+        response = self.client.get('/api/tasks/', {'search': 'отчет'})
+        self.assertEqual([task['id'] for task in response.data], [self.in_title.id, self.in_description.id])
+        response = self.client.get('/api/obligations/', {'search': 'псб'})
+        self.assertEqual([obligation['id'] for obligation in response.data], [self.obligation.id])
+
+    def test_pages_keep_rank_order(self):
+        Task.objects.bulk_create([
+            Task(created_by=self.user, obligation=self.obligation, title=f'Отчет {i}', deadline=timezone.now())
+            for i in range(3)])
+        expected = [task['id'] for task in self.client.get('/api/tasks/', {'search': 'отчет'}).data]
+        response = self.client.get('/api/tasks/', {'search': 'отчет', 'page_size': 2})
+        pages = [[task['id'] for task in response.data['results']]]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append([task['id'] for task in response.data['results']])
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(len(pages), 3)
+        back = self.client.get(response.data['previous'])
+        self.assertEqual([task['id'] for task in back.data['results']], pages[1])
+        response = self.client.get('/api/tasks/', {'search': 'отчет', 'page_size': 4, 'fields': 'title'})
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['results'], [{'title': task.title}
+                                                    for task in Task.objects.filter(id__in=expected[4:])])
+
+
+class NormalizedFilterTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('Ivanov', last_name='Ёлкин')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                               end_date=date(2026, 1, 1))
+        cls.task = Task.objects.create(created_by=cls.user, assigned_to=cls.user, obligation=obligation,
+                                       title='Отчёт ПО Безопасности', deadline=timezone.now())
+        Task.objects.create(created_by=cls.user, obligation=obligation, title='Письмо', deadline=timezone.now())
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def ids(self, **params):
+        return [task['id'] for task in self.client.get('/api/tasks/', params).data]
+
+    def test_unicode_case_and_yo(self):
+        self.assertEqual(self.ids(title__icontains='отчет по'), [self.task.id])
+        self.assertEqual(self.ids(title__icontains='БЕЗОПАСНОСТ'), [self.task.id])
+        self.assertEqual(self.ids(assigned_to__last_name__icontains='елк'), [self.task.id])
+        self.assertEqual(self.ids(assigned_to__username__iexact='IVANOV'), [self.task.id])
+        self.assertEqual(self.ids(assigned_to__username__iexact='ivano'), [])
+
+    def test_profile_follows_user(self):
+        self.user.last_name = 'Петров'
+        self.user.save()
+        self.assertEqual(UserSearchProfile.objects.get(user=self.user).last_name_normalized, 'петров')
+        self.user.username = 'Petrov'
+        self.user.save(update_fields=['username'])
+        self.assertEqual(UserSearchProfile.objects.get(user=self.user).username_normalized, 'petrov')
+
+    def test_unrelated_saves_do_not_write_profile(self):
+        self.user.last_login = timezone.now()
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save(update_fields=['last_login'])
+        self.assertFalse([q for q in queries if 'api_usersearchprofile' in q['sql']])
+        self.user.first_name = 'Иван'
+        with CaptureQueriesContext(connection) as queries:
+            self.user.save()
+        # One conditional UPDATE that matches no row.
+        self.assertEqual(len([q for q in queries if 'api_usersearchprofile' in q['sql']]), 1)
+        self.assertEqual(UserSearchProfile.objects.get(user=self.user).last_name_normalized, 'елкин')
+
+
+class AuditLogWriterTests(APITestCase):
+    def setUp(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        self.spool_dir = Path(spool_dir.name)
+        overridden = override_settings(AUDITLOG_ASYNC=True, AUDITLOG_ASYNC_SPOOL_DIR=self.spool_dir)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.addCleanup(writer.stop)
+
+    def spooled(self):
+        return [json.loads(line) for path in sorted(self.spool_dir.glob('*.jsonl'))
+                for line in path.read_text().splitlines()]
+
+    def test_entries_are_queued_until_flushed(self):
+        writer.start(thread=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            pva = PVA.objects.create(requisites='Договор № 1')
+            self.assertEqual(self.spooled(), [])
+        self.assertFalse(LogEntry.objects.get_for_object(pva).exists())
+        [record] = self.spooled()
+        self.assertEqual((record['object_id'], record['action']), (pva.id, LogEntry.Action.CREATE))
+        # Entries created through the manager are not queued.
+        self.assertIsNotNone(LogEntry.objects.log_create(pva, action=LogEntry.Action.ACCESS, force_log=True).pk)
+
+        self.assertEqual(writer.flush(), 1)
+        entry = LogEntry.objects.get_for_object(pva).get(action=LogEntry.Action.CREATE)
+        self.assertEqual(entry.changes_dict['requisites'], ['None', 'Договор № 1'])
+        self.assertEqual(self.spooled(), [])
+        self.assertEqual(writer.flush(), 0)
+
+    def test_deleted_actors_are_cleared(self):
+        writer.start(thread=False)
+        pva = PVA.objects.create(requisites='Договор № 1')
+        gone, kept = User.objects.create_user('ivanov'), User.objects.create_user('petrov')
+        for actor in (gone, kept):
+            # As replayed from the spool: only the id.
+            entry = build_log_entry(pva, LogEntry.Action.ACCESS, {})
+            entry.actor_id = actor.pk
+            writer.put(entry)
+        gone.delete()
+        writer.flush()
+        entries = LogEntry.objects.get_for_object(pva).filter(action=LogEntry.Action.ACCESS).order_by('id')
+        self.assertEqual([entry.actor_id for entry in entries], [None, kept.id])
+
+    def test_rolled_back_entries_are_dropped(self):
+        writer.start(thread=False)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    PVA.objects.create(requisites='Договор № 1')
+                    raise ValueError
+            except ValueError:
+                pass
+        self.assertEqual(self.spooled(), [])
+        self.assertEqual(writer.flush(), 0)
+
+    def test_each_flush_rotates_the_segment(self):
+        queue = AuditLogWriter(batch_size=10, queue_size=2)
+        queue.start(thread=False)
+        self.addCleanup(queue.stop)
+        pva = PVA.objects.create(requisites='Договор № 1')
+        entries = [build_log_entry(pva, LogEntry.Action.UPDATE, {'description': ['', str(i)]}) for i in range(3)]
+        queue.put(entries[0])
+        first = queue.segment
+        self.assertEqual(len(first.read_text().splitlines()), 1)
+        self.assertEqual(queue.flush(), 1)
+        self.assertFalse(first.exists())
+        queue.put(entries[1])
+        queue.put(entries[2])
+        # The queue holds two entries: the third one is written right away.
+        self.assertEqual(len(queue.segment.read_text().splitlines()), 2)
+        self.assertEqual(LogEntry.objects.filter(action=LogEntry.Action.UPDATE).count(), 1)
+        self.assertEqual(queue.flush(), 2)
+        self.assertEqual(LogEntry.objects.filter(action=LogEntry.Action.UPDATE).count(), 3)
+        self.assertEqual(self.spooled(), [])
+
+    def test_replay_claims_segments_of_dead_processes(self):
+        pva = PVA.objects.create(requisites='Договор № 1')
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        record = _entry_to_record(build_log_entry(pva, LogEntry.Action.UPDATE, {'description': ['', 'x']}))
+        line = json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+        (self.spool_dir / f'{process.pid}-0.jsonl').write_text(line * 2)
+        # Segments of live processes, e.g. claimed by another replaying process, are left alone.
+        alive = self.spool_dir / f'{os.getppid()}-0.jsonl'
+        alive.write_text(line)
+
+        replaying = AuditLogWriter()
+        replaying.start(thread=False)
+        self.addCleanup(replaying.stop)
+        self.assertEqual(LogEntry.objects.filter(action=LogEntry.Action.UPDATE).count(), 2)
+        self.assertEqual(sorted(self.spool_dir.glob('*.jsonl')), sorted([alive, replaying.segment]))
+        replaying.replay()
+        self.assertEqual(LogEntry.objects.filter(action=LogEntry.Action.UPDATE).count(), 2)
+
+
+class AuditLogWriterThreadTests(APITransactionTestCase):
+    def test_thread_writes_committed_entries(self):
+        spool_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(spool_dir.cleanup)
+        user = User.objects.create_user('ivanov')
+        self.client.force_authenticate(user)
+        with override_settings(AUDITLOG_ASYNC=True, AUDITLOG_ASYNC_SPOOL_DIR=spool_dir.name,
+                               AUDITLOG_ASYNC_FLUSH_INTERVAL=0.01):
+            response = self.client.post('/api/pvas/', {'requisites': 'Договор № 1'}, format='json')
+            writer.stop()
+        self.assertEqual(response.status_code, 201, response.content)
+        pva = PVA.objects.get(id=response.json()['id'])
+        entry = LogEntry.objects.get_for_object(pva).get(action=LogEntry.Action.CREATE)
+        self.assertEqual(entry.actor, user)
+        self.assertEqual(list(Path(spool_dir.name).iterdir()), [])
+
+
+class AuditLogArchiveTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                               end_date=date(2026, 1, 1))
+        cls.task = Task.objects.create(created_by=cls.user, obligation=obligation, title='Отчет',
+                                       deadline=timezone.now())
+        for title in ('Отчет 1', 'Отчет 2', 'Отчет 3'):
+            cls.task.title = title
+            cls.task.save()
+        entries = LogEntry.objects.get_for_object(cls.task).order_by('id')
+        cls.ids = list(entries.values_list('id', flat=True))
+        cls.changes = {entry.id: entry.changes for entry in entries}
+        cutoff = archive_cutoff()
+        # Two entries in one month past the hot window, one in the month before.
+        LogEntry.objects.filter(id=cls.ids[0]).update(timestamp=cutoff - timedelta(days=40))
+        LogEntry.objects.filter(id__in=cls.ids[1:3]).update(timestamp=cutoff - timedelta(days=1))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def changelog(self, **params):
+        response = self.client.get(f'/api/tasks/{self.task.id}/changelog/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_round_trip_through_archive_view(self):
+        self.assertEqual(archive_log_entries(archive_cutoff(), chunk_size=2), 3)
+        self.assertEqual(len(archive_tables(connection)), 2)
+        self.assertEqual(list(LogEntry.objects.get_for_object(self.task).values_list('id', flat=True)), self.ids[3:])
+
+        # Hot entries only, unless the period reaches into the archive.
+        self.assertEqual([entry['id'] for entry in self.changelog()], self.ids[3:][::-1])
+        since = (archive_cutoff() - timedelta(days=60)).isoformat()
+        entries = self.changelog(timestamp__gte=since)
+        self.assertEqual([entry['id'] for entry in entries], self.ids[::-1])
+        self.assertEqual({entry['id']: entry['changes'] for entry in entries}, self.changes)
+        archived = [entry for entry in entries if entry['id'] in self.ids[:3]]
+        self.assertTrue(all(entry['serialized_data'] is None for entry in archived))
+
+        response = self.client.get('/api/auditlog/', {'timestamp__gte': since, 'content_type__model': 'task',
+                                                      'object_id': self.task.id, 'page_size': 2})
+        self.assertEqual([entry['id'] for entry in response.data['results']], self.ids[::-1][:2])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([entry['id'] for entry in response.data['results']], self.ids[::-1][2:4])
+
+    def test_exported_months_leave_the_view(self):
+        archive_log_entries(archive_cutoff())
+        with tempfile.TemporaryDirectory() as directory:
+            [path] = export_archive_tables(archive_cutoff() - timedelta(days=1), directory)
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                self.assertEqual([json.loads(line)['id'] for line in file], self.ids[:1])
+        self.assertEqual(len(archive_tables(connection)), 1)
+        since = (archive_cutoff() - timedelta(days=60)).isoformat()
+        self.assertEqual([entry['id'] for entry in self.changelog(timestamp__gte=since)], self.ids[1:][::-1])
+
+
+class TaskChangelogTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                               end_date=date(2026, 1, 1))
+        cls.task = Task.objects.create(created_by=cls.user, obligation=obligation, title='Отчет',
+                                       deadline=timezone.now())
+        for i in range(4):
+            cls.task.title = f'Отчет {i}'
+            cls.task.save()
+        entries = LogEntry.objects.get_for_object(cls.task)
+        # Ties on the timestamp are broken by id.
+        entries.filter(id__in=list(entries.order_by('id').values_list('id', flat=True)[1:4])).update(
+            timestamp=timezone.now())
+        cls.ids = list(entries.order_by('-timestamp', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def url(self):
+        return f'/api/tasks/{self.task.id}/changelog/'
+
+    def test_pages_newest_first(self):
+        response = self.client.get(self.url(), {'page_size': 2})
+        pages = [[entry['id'] for entry in response.data['results']]]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append([entry['id'] for entry in response.data['results']])
+        self.assertEqual(pages, [self.ids[:2], self.ids[2:4], self.ids[4:]])
+        back = self.client.get(response.data['previous'])
+        self.assertEqual([entry['id'] for entry in back.data['results']], self.ids[2:4])
+        self.assertEqual([entry['id'] for entry in self.client.get(self.url()).data], self.ids)
+
+    def test_compact(self):
+        full = self.client.get(self.url()).data
+        with CaptureQueriesContext(connection) as queries:
+            compact = self.client.get(self.url(), {'compact': '1', 'page_size': 10}).data['results']
+        self.assertEqual(compact, [{name: entry[name] for name in ('id', 'timestamp', 'action', 'actor', 'changes')}
+                                   for entry in full])
+        entries_query = [query['sql'] for query in queries if 'auditlog_logentry' in query['sql']][-1]
+        self.assertNotIn('serialized_data', entries_query)
+        self.assertNotIn('auth_user', entries_query)
+
+    def test_unknown_task(self):
+        self.assertEqual(self.client.get('/api/tasks/0/changelog/').status_code, 404)
+
+
+class TaskStatsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+        cls.other = User.objects.create_user('petrov')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        cls.obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                                   end_date=date(2026, 1, 1))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def task(self, deadline, **fields):
+        return Task.objects.create(created_by=self.user, obligation=self.obligation, title='Отчет',
+                                   deadline=deadline, **fields)
+
+    def assertStatsRecounted(self):
+        def rows():
+            return sorted(TaskStats.objects.filter(count__gt=0).values_list(
+                'status', 'assigned_to_id', 'obligation_id', 'deadline_month', 'count'))
+        kept = rows()
+        rebuild_task_stats()
+        self.assertEqual(kept, rows())
+
+    def test_one_row_per_month(self):
+        start = datetime(2025, 3, 1, tzinfo=dt_timezone.utc)
+        for day in range(10):
+            self.task(start + timedelta(days=day, hours=day))
+        self.assertEqual(list(TaskStats.objects.values_list('deadline_month', 'count')), [(date(2025, 3, 1), 10)])
+
+    def test_counts_follow_changes(self):
+        tasks = [self.task(datetime(2025, month, 10, tzinfo=dt_timezone.utc)) for month in (1, 1, 2)]
+        tasks[0].status = Task.COMPLETED
+        tasks[0].save()
+        tasks[1].deadline = datetime(2025, 2, 28, tzinfo=dt_timezone.utc)
+        tasks[1].assigned_to = self.other
+        tasks[1].save()
+        # Deferred fields are read from the row being replaced.
+        partial = Task.objects.only('id', 'title').get(id=tasks[2].id)
+        partial.status = Task.IN_PROGRESS
+        partial.save(update_fields=['status'])
+        self.assertStatsRecounted()
+        response = self.client.patch(f'/api/tasks/{tasks[1].id}/', {'deadline': '2025-04-01T00:00:00Z'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        tasks[0].delete()
+        self.assertStatsRecounted()
+        self.other.delete()
+        self.assertStatsRecounted()
+
+    def test_tasks_built_but_not_loaded_are_not_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            Task(title='Отчет', deadline=timezone.now())
+        self.assertEqual(len(queries), 0)
+        task = self.task(timezone.now())
+        self.assertIsNotNone(Task.objects.get(id=task.id)._stats_key)
+        self.assertIsNone(Task.objects.only('id').get(id=task.id)._stats_key)
+
+    def test_overdue(self):
+        today = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+        self.task(today - timedelta(days=40))
+        self.task(today - timedelta(seconds=1), assigned_to=self.user)
+        self.task(today - timedelta(days=40), status=Task.COMPLETED)
+        self.task(today - timedelta(days=40), status=Task.HIDDEN)
+        self.task(today, assigned_to=self.user)
+        stats = self.client.get('/api/tasks/stats/').data
+        self.assertEqual((stats['total'], stats['overdue']), (4, 2))
+        self.assertEqual({row['status']: (row['total'], row['overdue']) for row in stats['by_status']},
+                         {Task.NOT_STARTED: (3, 2), Task.COMPLETED: (1, 0)})
+        self.assertEqual({row['assigned_to']: (row['total'], row['overdue']) for row in stats['by_assignee']},
+                         {None: (2, 1), self.user.id: (2, 1)})
+        self.assertEqual([(row['pva'], row['total'], row['overdue']) for row in stats['by_pva']],
+                         [(self.obligation.pva_id, 4, 2)])
+
+
+class CachedListTests(APITestCase):
+    url = '/api/medicinal-products/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+        cls.product = MedicinalProduct.objects.create(title='Аспирин')
+
+    def setUp(self):
+        caches[settings.REFERENCE_DATA_CACHE].clear()
+        self.client.force_authenticate(self.user)
+
+    def test_etag_and_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['title'] for product in response.data], ['Аспирин'])
+        etag = response['ETag']
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+
+        for if_none_match in (etag, f'"other", {etag}', '*'):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=if_none_match)
+            self.assertEqual(response.status_code, 304, if_none_match)
+            self.assertEqual(response.content, b'')
+            self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_served_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_writes_invalidate(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'title': 'Парацетамол'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['title'] for product in response.data], ['Аспирин', 'Парацетамол'])
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual([product['title'] for product in response.data], ['Парацетамол'])
+        # Other models' lists are not affected.
+        etag = self.client.get('/api/responsibility-types/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            MedicinalProduct.objects.create(title='Ибупрофен')
+        self.assertEqual(self.client.get('/api/responsibility-types/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+@override_settings(SYNC_PAGE_SIZE=3)
+class SyncTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        cls.obligations = [Obligation.objects.create(pva=pva, title=f'ПСБ {i}', start_date=date(2025, 1, 1),
+                                                     end_date=date(2026, 1, 1)) for i in range(2)]
+        cls.tasks = [Task.objects.create(created_by=cls.user, obligation=cls.obligations[0], title=f'Отчет {i}',
+                                         deadline=timezone.now()) for i in range(4)]
+        cls.comments = [Comment.objects.create(created_by=cls.user, task=cls.tasks[0], text=f'Комментарий {i}')
+                        for i in range(2)]
+        # Ties on updated_at are broken by id.
+        cls.since = timezone.now() - timedelta(hours=2)
+        for model in (Task, Obligation, Comment):
+            model.objects.update(updated_at=cls.since - timedelta(hours=1))
+        Task.objects.filter(id__in=[cls.tasks[1].id, cls.tasks[2].id]).update(updated_at=cls.since + timedelta(hours=1))
+        Comment.objects.filter(id=cls.comments[1].id).update(updated_at=cls.since + timedelta(minutes=30))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def download(self, params=None):
+        response = self.client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        pages = [response.data]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+        return pages
+
+    def ids(self, pages, name):
+        return [row['id'] for page in pages for row in page[name]]
+
+    def test_full_download_in_pages(self):
+        pages = self.download()
+        self.assertEqual([sum(len(page[name]) for name in ('tasks', 'obligations', 'comments')) for page in pages],
+                         [3, 3, 2])
+        self.assertEqual(self.ids(pages, 'tasks'), [self.tasks[0].id, self.tasks[3].id, self.tasks[1].id,
+                                                    self.tasks[2].id])
+        self.assertEqual(self.ids(pages, 'obligations'), [obligation.id for obligation in self.obligations])
+        self.assertEqual(self.ids(pages, 'comments'), [self.comments[0].id, self.comments[1].id])
+        self.assertEqual(len({page['watermark'] for page in pages}), 1)
+        self.assertIsNone(pages[-1]['next'])
+
+    def test_rows_changed_during_download_wait_for_next_sync(self):
+        response = self.client.get('/api/sync/')
+        watermark = response.data['watermark']
+        Obligation.objects.filter(id=self.obligations[0].id).update(updated_at=timezone.now())
+        pages = [response.data]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response.data)
+        self.assertEqual(self.ids(pages, 'obligations'), [self.obligations[1].id])
+        self.assertEqual({page['watermark'] for page in pages}, {watermark})
+
+    def test_changes_since(self):
+        hidden = self.tasks[2]
+        hidden.status = Task.HIDDEN
+        hidden.save()
+        Task.objects.filter(id=hidden.id).update(updated_at=self.since + timedelta(hours=1))
+        deleted = self.tasks[3].id
+        self.tasks[3].delete()
+        pages = self.download({'since': self.since.isoformat()})
+        self.assertEqual(self.ids(pages, 'tasks'), [self.tasks[1].id])
+        self.assertEqual(self.ids(pages, 'obligations'), [])
+        self.assertEqual(self.ids(pages, 'comments'), [self.comments[1].id])
+        self.assertEqual(pages[0]['deleted']['tasks'], [deleted, hidden.id])
+
+    @override_settings(SYNC_WATERMARK_LAG=timedelta(0))
+    def test_references_cleared_on_delete(self):
+        assignee = User.objects.create_user('petrov')
+        Task.objects.filter(id=self.tasks[0].id).update(assigned_to=assignee, updated_at=self.since - timedelta(hours=1))
+        responsibility_type = ResponsibilityType.objects.create(title='Отчет')
+        Obligation.objects.filter(id=self.obligations[1].id).update(responsibility_type=responsibility_type,
+                                                                  updated_at=self.since - timedelta(hours=1))
+        assignee.delete()
+        responsibility_type.delete()
+        pages = self.download({'since': self.since.isoformat()})
+        rows = {row['id']: row for page in pages for row in page['tasks']}
+        self.assertIsNone(rows[self.tasks[0].id]['assigned_to'])
+        rows = {row['id']: row for page in pages for row in page['obligations']}
+        self.assertEqual(list(rows), [self.obligations[1].id])
+        self.assertIsNone(rows[self.obligations[1].id]['responsibility_type'])
+
+    @override_settings(SYNC_PAGE_SIZE=1)
+    def test_deleted_ids_only_on_first_page(self):
+        deleted = self.tasks[3].id
+        self.tasks[3].delete()
+        pages = self.download({'since': self.since.isoformat()})
+        self.assertEqual(len(pages), 3)
+        self.assertEqual([page['deleted']['tasks'] for page in pages], [[deleted], [], []])
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', b64encode(b'{"model": "users"}').decode()):
+            self.assertEqual(self.client.get('/api/sync/', {'cursor': cursor}).status_code, 404)
+
+    def test_stale_since(self):
+        stale = timezone.now() - settings.SYNC_TOMBSTONE_RETENTION - timedelta(days=1)
+        self.assertEqual(self.client.get('/api/sync/', {'since': stale.isoformat()}).status_code, 410)
+
+
+@override_settings(EVENTS_HEARTBEAT_INTERVAL=0.05)
+class EventStreamTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def ticket(self):
+        return self.client.post('/api/events/ticket/').data['ticket']
+
+    def test_ticket(self):
+        response = self.client.post('/api/events/ticket/')
+        self.assertEqual(response.data['expires_in'], settings.EVENTS_TICKET_MAX_AGE)
+        self.assertEqual(events.redeem_ticket(response.data['ticket']), self.user)
+        # Single use.
+        self.assertIsNone(events.redeem_ticket(response.data['ticket']))
+        self.assertIsNone(events.redeem_ticket(response.data['ticket'] + 'x'))
+        self.assertIsNone(events.redeem_ticket(signing.dumps({'user': self.user.pk, 'nonce': 'a'})))
+        with override_settings(EVENTS_TICKET_MAX_AGE=-1):
+            self.assertIsNone(events.redeem_ticket(self.ticket()))
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.post('/api/events/ticket/').status_code, 401)
+
+    def test_rejects_tokens_in_url(self):
+        token = str(RefreshToken.for_user(self.user).access_token)
+        self.assertEqual(self.client.get('/api/events/', {'token': token}).status_code, 401)
+        self.assertEqual(self.client.get('/api/events/', {'ticket': 'garbage'}).status_code, 401)
+
+    async def test_stream(self):
+        ticket = await sync_to_async(self.ticket)()
+        response = await self.async_client.get('/api/events/', {'ticket': ticket})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        frames = aiter(response.streaming_content)
+        self.assertEqual(await anext(frames), b': connected\n\n')
+        self.assertEqual(await anext(frames), b': ping\n\n')
+
+        def publish():
+            with self.captureOnCommitCallbacks() as callbacks:
+                events.publish_on_commit(events.TASK_STATUS_CHANGED, {'id': 1, 'status': Task.COMPLETED})
+            # Nothing is sent before the commit.
+            self.assertEqual(len(callbacks), 1)
+            callbacks[0]()
+
+        await sync_to_async(publish)()
+        self.assertEqual(await anext(frames),
+                         b'event: task_status_changed\ndata: {"id": 1, "status": "COMPLETED"}\n\n')
+        await frames.aclose()
+        # The ticket has been used.
+        response = await self.async_client.get('/api/events/', {'ticket': ticket})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_lagging_stream_is_closed(self):
+        broker = events.EventBroker(queue_size=2)
+        frames = broker.stream(heartbeat=60)
+        self.assertEqual(await anext(frames), ': connected\n\n')
+        for i in range(3):
+            broker.publish(events.COMMENT_ADDED, {'id': i})
+        self.assertEqual([frame async for frame in frames], [events.encode_event(events.COMMENT_ADDED, {'id': 1})])
+        self.assertFalse(broker.subscribers)
+
+
+class AsyncViewTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov', last_name='Иванов')
+        cls.pva = PVA.objects.create(requisites='Договор № 1')
+        product = MedicinalProduct.objects.create(title='Аспирин')
+        cls.pva.medicinal_products.add(product)
+        responsibility_type = ResponsibilityType.objects.create(title='Отчет')
+        cls.obligation = Obligation.objects.create(pva=cls.pva, title='ПСБ', responsibility_type=responsibility_type,
+                                                   start_date=date(2025, 1, 1), end_date=date(2026, 1, 1))
+        cls.tasks = [Task.objects.create(created_by=cls.user, assigned_to=cls.user if i % 2 else None,
+                                         obligation=cls.obligation, title=f'Отчет {i}',
+                                         deadline=timezone.now() + timedelta(days=i)) for i in range(5)]
+        Comment.objects.create(created_by=cls.user, task=cls.tasks[0], text='Готово')
+        cls.tasks[0].title = 'Сводный отчет'
+        cls.tasks[0].save()
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def assertSameResponses(self, path, params=None):
+        sync = self.client.get(f'/api/{path}', params)
+        response = self.client.get(f'/api/async/{path}', params)
+        self.assertEqual(response.status_code, sync.status_code, path)
+        self.assertEqual(response.content.decode().replace('/api/async/', '/api/'), sync.content.decode(), path)
+        return json.loads(sync.content)
+
+    def test_lists(self):
+        task = self.tasks[0].id
+        for path, params in [
+            ('tasks/', None),
+            ('tasks/', {'status': Task.NOT_STARTED, 'assigned_to__last_name__icontains': 'иван'}),
+            ('tasks/', {'fields': 'id,title,obligation_display', 'page_size': 2}),
+            ('tasks/', {'expand': 'obligation'}),
+            ('tasks/', {'deadline__gte': 'not a date'}),
+            ('obligations/', None),
+            ('pvas/', None),
+            (f'obligations/{self.obligation.id}/tasks/', None),
+            (f'pvas/{self.pva.id}/obligations/', None),
+            (f'tasks/{task}/comments/', None),
+            (f'tasks/{task}/changelog/', None),
+            (f'tasks/{task}/changelog/', {'compact': '1', 'page_size': 1}),
+            ('obligations/0/tasks/', None),
+        ]:
+            self.assertSameResponses(path, params)
+
+    def test_pages(self):
+        data = self.assertSameResponses('tasks/', {'page_size': 2})
+        while data['next']:
+            data = self.assertSameResponses(data['next'].split('/api/', 1)[1])
+
+    def test_details(self):
+        for path in (f'tasks/{self.tasks[1].id}/', f'obligations/{self.obligation.id}/', f'pvas/{self.pva.id}/',
+                     'tasks/0/', 'tasks/x/'):
+            self.assertSameResponses(path)
+        self.assertSameResponses(f'tasks/{self.tasks[1].id}/', {'fields': 'id,status'})
+
+    def test_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertSameResponses('tasks/')
+
+    def test_middleware_is_async_capable(self):
+        async def get_response(request):
+            pass
+
+        for path in settings.MIDDLEWARE:
+            self.assertTrue(iscoroutinefunction(import_string(path)(get_response)), path)
+
+    async def test_asgi_handler(self):
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.user).access_token))()
+        headers = {'Authorization': f'Bearer {token}'}
+        for path in ('tasks/', f'tasks/{self.tasks[1].id}/', 'tasks/0/'):
+            response = await self.async_client.get(f'/api/async/{path}', headers=headers)
+            sync = await sync_to_async(self.client.get)(f'/api/{path}')
+            self.assertEqual(response.status_code, sync.status_code, path)
+            self.assertEqual(response.content.decode().replace('/api/async/', '/api/'), sync.content.decode(), path)
+
+
+class SparseFieldsetTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov', first_name='Иван', last_name='Иванов')
+        responsibility_type = ResponsibilityType.objects.create(title='Отчет')
+        cls.pva = PVA.objects.create(requisites='Договор № 1')
+        cls.obligation = Obligation.objects.create(pva=cls.pva, title='ПСБ', responsibility_type=responsibility_type,
+                                                   start_date=date(2025, 1, 1), end_date=date(2026, 1, 1))
+        schedule = TaskSchedule.objects.create(frequency_type=TaskSchedule.MONTHLY, day_of_month=5,
+                                               start_date=date(2025, 1, 1), end_date=date(2026, 1, 1))
+        cls.task = Task.objects.create(created_by=cls.user, assigned_to=cls.user, obligation=cls.obligation,
+                                       title='Ежемесячный отчет', deadline=timezone.now(), is_recurring=True,
+                                       schedule=schedule)
+        Task.objects.create(created_by=cls.user, obligation=cls.obligation, title='Разовая задача',
+                            deadline=timezone.now())
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_fields(self):
+        full = {task['id']: task for task in self.client.get('/api/tasks/').data}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/tasks/', {'fields': 'id, title,status_display,'})
+        self.assertEqual(response.data, [{name: full[task['id']][name] for name in ('id', 'title', 'status_display')}
+                                         for task in response.data])
+        self.assertEqual(len(response.data), 2)
+        # Nothing the fields do not read is joined or loaded.
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('JOIN', queries[0]['sql'])
+        self.assertNotIn('"description"', queries[0]['sql'])
+
+        response = self.client.get(f'/api/tasks/{self.task.id}/', {'fields': 'id,pva_display'})
+        self.assertEqual(response.data, {'id': self.task.id, 'pva_display': 'Договор № 1'})
+        response = self.client.get(f'/api/obligations/{self.obligation.id}/', {'fields': 'title,responsibility_type'})
+        self.assertEqual(response.data, {'title': 'ПСБ', 'responsibility_type': 'Отчет'})
+
+    def test_expand(self):
+        full = self.client.get(f'/api/tasks/{self.task.id}/').data
+        display_fields = {'schedule', 'created_by_display', 'assigned_to_display', 'obligation_display',
+                          'pva_display', 'responsibility_type_display'}
+        with CaptureQueriesContext(connection) as queries:
+            collapsed = self.client.get(f'/api/tasks/{self.task.id}/', {'expand': ''}).data
+        self.assertEqual(collapsed, {**{name: value for name, value in full.items() if name not in display_fields},
+                                     'schedule': self.task.schedule_id})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('JOIN', queries[0]['sql'])
+
+        expanded = self.client.get(f'/api/tasks/{self.task.id}/', {'expand': 'obligation,schedule'}).data
+        self.assertEqual(expanded['obligation_display'], 'ПСБ')
+        self.assertEqual(expanded['schedule'], full['schedule'])
+        self.assertFalse({'created_by_display', 'assigned_to_display', 'pva_display'} & expanded.keys())
+
+        response = self.client.get('/api/tasks/', {'fields': 'id,schedule', 'expand': ''})
+        self.assertEqual(sorted(response.data, key=lambda task: task['id']),
+                         [{'id': task.id, 'schedule': task.schedule_id} for task in Task.objects.order_by('id')])
+        response = self.client.get(f'/api/pvas/{self.pva.id}/obligations/', {'fields': 'id,pva_display', 'expand': ''})
+        self.assertEqual(response.data, [{'id': self.obligation.id}])
+
+    def test_unknown_names(self):
+        response = self.client.get('/api/tasks/', {'fields': 'id,nope', 'expand': 'zzz'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'expand': 'Неизвестные связи: zzz.', 'fields': 'Неизвестные поля: nope.'})
+
+    def test_writes_ignore_parameters(self):
+        response = self.client.patch(f'/api/tasks/{self.task.id}/?fields=id&expand=', {'title': 'Отчет'},
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['title'], 'Отчет')
+        self.assertEqual(response.data['obligation_display'], 'ПСБ')
+
+
+class RecordingRouter(PrimaryReplicaRouter):
+    """Records the alias each read was routed to and runs it on the primary: the tests have no replica."""
+    reads = []
+
+    def db_for_read(self, model, **hints):
+        self.reads.append(super().db_for_read(model, **hints) or 'default')
+        return None
+
+
+@override_settings(DATABASE_ROUTERS=['api.tests.RecordingRouter'], DATABASE_READ_REPLICAS=['replica1'])
+class ReplicaRoutingTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ivanov')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        cls.obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                                   end_date=date(2026, 1, 1))
+        for i in range(3):
+            Task.objects.create(created_by=cls.user, obligation=cls.obligation, title=f'Отчет {i}',
+                                deadline=timezone.now())
+
+    def setUp(self):
+        caches[settings.READ_YOUR_WRITES_CACHE].clear()
+        self.client.force_authenticate(self.user)
+        RecordingRouter.reads = []
+
+    def reads(self, method, path, data=None):
+        RecordingRouter.reads = []
+        response = getattr(self.client, method)(path, data, format='json')
+        self.assertLess(response.status_code, 300, path)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return set(RecordingRouter.reads)
+
+    def test_router(self):
+        router = PrimaryReplicaRouter()
+        self.assertIsNone(router.db_for_read(Task))
+        state = RoutingState()
+        token = routing_state.set(state)
+        try:
+            self.assertIsNone(router.db_for_read(Task))
+            state.read_from_replica = True
+            self.assertEqual(router.db_for_read(Task), 'replica1')
+            self.assertIsNone(router.db_for_write(Task))
+            # Later reads of a request that wrote see its writes.
+            self.assertIsNone(router.db_for_read(Task))
+            with override_settings(DATABASE_READ_REPLICAS=[]):
+                state.wrote = False
+                self.assertIsNone(router.db_for_read(Task))
+        finally:
+            routing_state.reset(token)
+        self.assertFalse(router.allow_migrate('replica1', 'api'))
+        self.assertIsNone(router.allow_migrate('default', 'api'))
+
+    def test_read_only_requests_use_replica(self):
+        self.assertEqual(self.reads('get', '/api/tasks/'), {'replica1'})
+        self.assertEqual(self.reads('get', f'/api/obligations/{self.obligation.id}/tasks/'), {'replica1'})
+        # Views without ``ReplicaReadMixin`` stay on the primary.
+        self.assertEqual(self.reads('get', '/api/sync/'), {'default'})
+
+    def test_streamed_bodies_use_replica(self):
+        self.assertEqual(self.reads('get', '/api/tasks/export/'), {'replica1'})
+        self.assertEqual(self.reads('get', '/api/tasks/calendar/'), {'replica1'})
+        # Once the body is read, nothing is routed by the request any more.
+        self.assertIsNone(routing_state.get())
+
+    def test_read_your_writes(self):
+        self.reads('post', '/api/tasks/', {'title': 'Новая', 'obligation': self.obligation.id,
+                                           'deadline': timezone.now()})
+        self.assertEqual(self.reads('get', '/api/tasks/'), {'default'})
+        other = User.objects.create_user('petrov')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.reads('get', '/api/tasks/'), {'replica1'})
+        self.client.force_authenticate(self.user)
+        caches[settings.READ_YOUR_WRITES_CACHE].delete(f'api:read-your-writes:{self.user.pk}')
+        self.assertEqual(self.reads('get', '/api/tasks/'), {'replica1'})
+
+
+def parse_metrics(text):
+    """Values of a Prometheus text exposition by series (``name{labels}``)."""
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            continue
+        name, value = line.rsplit(' ', 1)
+        samples[name] = float(value)
+    return samples
+
+
+class MetricsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        cls.user = User.objects.create_user('ivanov')
+        pva = PVA.objects.create(requisites='Договор № 1')
+        obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                               end_date=date(2026, 1, 1))
+        Task.objects.create(created_by=cls.user, obligation=obligation, title='Отчет', deadline=timezone.now())
+
+    def metrics(self):
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        return response.content.decode()
+
+    def test_render(self):
+        registry = Registry()
+        metrics = RequestMetrics()
+        metrics.queries, metrics.db_time, metrics.size = 3, 0.002, 300
+        registry.record('TaskViewSet.list', 'GET', 200, metrics)
+        metrics.queries, metrics.size = 12, 5000
+        registry.record('TaskViewSet.list', 'GET', 404, metrics)
+        registry.record('say "hi"\n', 'POST', 201, RequestMetrics())
+        text = registry.render()
+        self.assertTrue(text.endswith('\n'))
+        lines = text.splitlines()
+        self.assertEqual(lines[:2], ['# HELP freevigilance_request_duration_seconds Request latency.',
+                                     '# TYPE freevigilance_request_duration_seconds histogram'])
+        labels = 'route="TaskViewSet.list",method="GET"'
+        start = lines.index(f'freevigilance_request_db_queries_bucket{{{labels},le="0"}} 0')
+        self.assertEqual(lines[start:start + 13], [
+            *(f'freevigilance_request_db_queries_bucket{{{labels},le="{bound}"}} {count}'
+              for bound, count in zip((0, 1, 2, 5, 10, 20, 50, 100, 200, 500, '+Inf'), (0, 0, 0, 1, 1, 2, 2, 2, 2, 2, 2))),
+            f'freevigilance_request_db_queries_sum{{{labels}}} 15',
+            f'freevigilance_request_db_queries_count{{{labels}}} 2',
+        ])
+        self.assertIn(f'freevigilance_response_size_bytes_bucket{{{labels},le="4096"}} 1', lines)
+        self.assertIn(f'freevigilance_response_size_bytes_bucket{{{labels},le="16384"}} 2', lines)
+        self.assertIn('# TYPE freevigilance_requests_total counter', lines)
+        self.assertIn(f'freevigilance_requests_total{{{labels},status="404"}} 1', lines)
+        self.assertIn('freevigilance_requests_total{route="say \\"hi\\"\\n",method="POST",status="201"} 1', lines)
+        # Every bucket series is cumulative and ends with the count.
+        samples = parse_metrics(text)
+        for name in ('request_duration_seconds', 'request_db_queries', 'request_db_duration_seconds',
+                     'response_size_bytes'):
+            buckets = [value for key, value in samples.items() if key.startswith(f'freevigilance_{name}_bucket{{{labels}')]
+            self.assertEqual(buckets, sorted(buckets))
+            self.assertEqual(buckets[-1], samples[f'freevigilance_{name}_count{{{labels}}}'])
+
+    def test_requests_are_recorded(self):
+        labels = 'route="TaskViewSet.{}",method="GET"'
+        before = parse_metrics(self.metrics())
+        self.client.force_authenticate(self.user)
+        content = self.client.get('/api/tasks/').content
+        response = self.client.get('/api/tasks/export/')
+        size = len(b''.join(response.streaming_content))
+        response.close()
+        self.client.get('/api/tasks/0/')
+        after = parse_metrics(self.metrics())
+
+        def change(sample):
+            return after.get(sample, 0) - before.get(sample, 0)
+
+        list_labels, export_labels = labels.format('list'), labels.format('export')
+        self.assertEqual(change(f'freevigilance_request_duration_seconds_count{{{list_labels}}}'), 1)
+        self.assertEqual(change(f'freevigilance_response_size_bytes_sum{{{list_labels}}}'), len(content))
+        self.assertEqual(change(f'freevigilance_requests_total{{{list_labels},status="200"}}'), 1)
+        self.assertGreater(change(f'freevigilance_request_db_queries_sum{{{list_labels}}}'), 0)
+        # Streamed bodies are measured once read.
+        self.assertEqual(change(f'freevigilance_response_size_bytes_sum{{{export_labels}}}'), size)
+        self.assertEqual(change(f'freevigilance_requests_total{{{labels.format("retrieve")},status="404"}}'), 1)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+
+class ProfilingTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user('admin', is_staff=True)
+        pva = PVA.objects.create(requisites='Договор № 1')
+        obligation = Obligation.objects.create(pva=pva, title='ПСБ', start_date=date(2025, 1, 1),
+                                               end_date=date(2026, 1, 1))
+        for i in range(3):
+            Task.objects.create(created_by=cls.admin, obligation=obligation, title=f'Отчет {i}',
+                                deadline=timezone.now())
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PROFILING_DIR=Path(directory.name)))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.admin).access_token}')
+
+    def test_profile(self):
+        response = self.client.get('/api/tasks/', HTTP_X_PROFILE='1')
+        self.assertEqual(profile_ids(), [response['X-Profile-Id']])
+        profile = load_profile(response['X-Profile-Id'])
+        self.assertEqual((profile['path'], profile['user'], profile['status']), ('/api/tasks/', 'admin', 200))
+        self.assertEqual(profile['query_count'], len(profile['queries']))
+        self.assertTrue(any('"api_task"' in query['sql'] for query in profile['queries']))
+        self.assertNotIn('X-Profile-Id', self.client.get('/api/tasks/'))
+
+    async def test_profile_async_view(self):
+        token = await sync_to_async(lambda: str(RefreshToken.for_user(self.admin).access_token))()
+        response = await self.async_client.get('/api/async/tasks/', {'_profile': '1'},
+                                               headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        profile = await sync_to_async(load_profile)(response['X-Profile-Id'])
+        self.assertEqual((profile['path'], profile['status']), ('/api/async/tasks/?_profile=1', 200))
+        self.assertTrue(any('"api_task"' in query['sql'] for query in profile['queries']))
+
+    @override_settings(PROFILING_MAX_PROFILES=2)
+    def test_oldest_deleted(self):
+        ids = [self.client.get('/api/tasks/', {'_profile': '1'})['X-Profile-Id'] for _ in range(3)]
+        self.assertEqual(profile_ids(), ids[:0:-1])
+
+    def test_streamed_body_is_profiled_as_sent(self):
+        response = self.client.get('/api/tasks/export/', {'_profile': '1'})
+        chunks = iter(response.streaming_content)
+        first = next(chunks)
+        # Saved once the stream ends.
+        self.assertEqual(profile_ids(), [])
+        rows = list(csv.reader(io.StringIO((first + b''.join(chunks)).decode('utf-8-sig'))))
+        self.assertEqual(len(rows), 4)
+        profile = load_profile(response['X-Profile-Id'])
+        # The rows are read while streaming.
+        self.assertTrue(any('FROM "api_task"' in query['sql'] for query in profile['queries']))
+        self.assertIn('stream_csv', profile['top_functions'])
+
+    def test_closed_stream_is_saved(self):
+        response = self.client.get('/api/tasks/export/', {'_profile': '1'})
+        next(iter(response.streaming_content))
+        response.close()
+        self.assertEqual(profile_ids(), [response['X-Profile-Id']])
+
+
+class SeedingTests(APITestCase):
+    def seed(self, **options):
+        """Counts and contents of a ``seed()`` run, rolled back so that each run starts from the same database."""
+        options = {'random_seed': 42, **options}
+        with transaction.atomic():
+            created = seed(users=3, products=4, pvas=2, obligations_per_pva=2, tasks_per_obligation=5, **options)
+            # Without usernames and titles, which carry the tag of the run.
+            contents = (
+                list(User.objects.order_by('id').values_list('first_name', 'last_name')),
+                list(Obligation.objects.order_by('id').values_list('responsibility_type__title', flat=True)),
+                list(Task.objects.order_by('id').values_list(
+                    'title', 'status', 'is_recurring', 'assigned_to__last_name', 'schedule__frequency_type')),
+                list(Comment.objects.order_by('id').values_list('task__title', 'created_by__first_name', 'text')),
+                list(LogEntry.objects.filter(content_type__model='task').order_by('id').values_list(
+                    'action', 'changes__status', 'actor__first_name')),
+            )
+            transaction.set_rollback(True)
+        return created, contents
+
+    def test_counts(self):
+        created, (users, obligations, tasks, comments, entries) = self.seed(recurring_share=0)
+        self.assertEqual({name: count for name, count in created.items() if name != 'comments'}, {
+            'users': 3, 'medicinal products': 4, 'PVAs': 2, 'obligations': 4, 'tasks': 20, 'audit entries': 60})
+        self.assertEqual((len(users), len(obligations), len(tasks), len(entries)), (3, 4, 20, 60))
+        self.assertEqual(len(comments), created['comments'])
+        self.assertLessEqual(len(comments), 20 * 4)
+
+    def test_same_seed_same_data(self):
+        first = self.seed()
+        self.assertEqual(self.seed(), first)
+        self.assertTrue(any(is_recurring for _, _, is_recurring, _, _ in first[1][2]))
+        self.assertNotEqual(self.seed(random_seed=7), first)
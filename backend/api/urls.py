@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import *
+from .async_views import *
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet)
@@ -9,6 +10,7 @@ router.register(r'obligations', ObligationViewSet)
 router.register(r'responsibility-types', ResponsibilityTypeViewSet)
 router.register(r'medicinal-products', MedicinalProductViewSet)
 router.register(r'pvas', PVAViewSet)
+router.register(r'deletion-jobs', DeletionJobViewSet)
 
 
 urlpatterns = [
@@ -17,6 +19,25 @@ urlpatterns = [
     path('pvas/<int:id>/obligations/', PVAObligationListView.as_view(), name='pva-tasks'),
     path('tasks/<int:id>/comments/', CommentListCreateView.as_view(), name='task-comments'),
     path('tasks/<int:id>/changelog/', TaskChangelogListView.as_view(), name='task-changelog'),
-    path('auditlog/', AuditlogListView.as_view())
+    path('auditlog/', AuditlogListView.as_view(), name='auditlog'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('profiles/<str:id>/', ProfileDetailView.as_view(), name='profile-detail'),
+    path('profiles/<str:id>/download/', ProfileDownloadView.as_view(), name='profile-download'),
+    path('events/', task_events, name='task-events'),
+    path('events/ticket/', EventTicketView.as_view(), name='event-ticket'),
+
+    # Read-only async versions of the endpoints above, for deployments under ASGI.
+    path('async/tasks/', AsyncTaskListView.as_view(), name='async-task-list'),
+    path('async/tasks/<pk>/', AsyncTaskDetailView.as_view(), name='async-task-detail'),
+    path('async/obligations/', AsyncObligationListView.as_view(), name='async-obligation-list'),
+    path('async/obligations/<pk>/', AsyncObligationDetailView.as_view(), name='async-obligation-detail'),
+    path('async/pvas/', AsyncPVAListView.as_view(), name='async-pva-list'),
+    path('async/pvas/<pk>/', AsyncPVADetailView.as_view(), name='async-pva-detail'),
+    path('async/obligations/<int:id>/tasks/', AsyncObligationTaskListView.as_view(), name='async-obligation-tasks'),
+    path('async/pvas/<int:id>/obligations/', AsyncPVAObligationListView.as_view(), name='async-pva-obligations'),
+    path('async/tasks/<int:id>/comments/', AsyncCommentListView.as_view(), name='async-task-comments'),
+    path('async/tasks/<int:id>/changelog/', AsyncTaskChangelogListView.as_view(), name='async-task-changelog'),
 ]
 
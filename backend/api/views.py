@@ -1,17 +1,45 @@
+import heapq
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from asgiref.sync import sync_to_async
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, generics, status
 from .filters import *
 from .models import *
 from .serializers import *
 from .permissions import IsSelf
-from .services import create_recurring_task_iteration
+from .pagination import TaskCursorPagination, CommentCursorPagination, LogEntryCursorPagination
+from .exporters import ExportMixin, stream_json_array
+from .archive import log_entries_for
+from .caching import CachedListMixin
+from .deletion import BackgroundDestroyMixin
+from .fieldsets import SparseFieldsetMixin, SPARSE_FIELDSET_PARAMETERS
+from .projections import ProjectedListMixin
+from .routers import ReplicaReadMixin
+from .stats import task_stats
+from .metrics import registry as metrics_registry
+from .profiling import load_profile, profile_ids, profile_path
+from .sync import changes_since, decode_cursor, encode_cursor
+from .events import broker, issue_ticket, publish_on_commit, redeem_ticket, TASK_CREATED, TASK_STATUS_CHANGED, COMMENT_ADDED
+from .services import (materialize_recurring_tasks, reschedule_recurring_task, recurring_schedules, iter_iteration_deadlines,
+                       with_comment_activity)
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.decorators import action
-from drf_spectacular.utils import extend_schema, OpenApiParameter
+from rest_framework.views import APIView
+from rest_framework.exceptions import AuthenticationFailed, NotFound
+from rest_framework.utils.urls import replace_query_param
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, extend_schema_view, OpenApiParameter
 from auditlog.models import LogEntry
-from auditlog.context import disable_auditlog
-from auditlog.diff import model_instance_diff
+from django.contrib.contenttypes.models import ContentType
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
@@ -33,10 +61,19 @@ class UserViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(user)
         return Response(serializer.data)
 
-class TaskViewSet(viewsets.ModelViewSet):
+@extend_schema_view(**{action: extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS) for action in
+                        ('list', 'retrieve', 'completed', 'my', 'my_completed', 'export')})
+class TaskViewSet(ReplicaReadMixin, ProjectedListMixin, SparseFieldsetMixin, ExportMixin, viewsets.ModelViewSet):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
     filterset_class = TaskFilter
+    pagination_class = TaskCursorPagination
+    sparse_fieldset_actions = ('list', 'retrieve', 'completed', 'my', 'my_completed', 'export')
+    replica_read_actions = ('list', 'retrieve', 'completed', 'my', 'my_completed', 'export', 'calendar', 'stats')
+    export_filename = 'tasks'
+    bulk_max_items = 1000
+    calendar_default_range = timedelta(days=365)
+    calendar_chunk_size = 2000
 
     def get_permissions(self):
         if self.action=='destroy':
@@ -46,7 +83,7 @@ class TaskViewSet(viewsets.ModelViewSet):
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
-        return (
+        return with_comment_activity(
             Task.objects
             .select_related(
                 'created_by',
@@ -56,12 +93,22 @@ class TaskViewSet(viewsets.ModelViewSet):
                 'obligation__pva',
                 'obligation__responsibility_type'
             ).exclude(status=Task.HIDDEN)
-            .order_by('deadline')
+            .order_by('deadline', 'id')
         )
-    
+
     def perform_create(self, serializer):
-        return serializer.save(created_by=self.request.user)
-    
+        task = serializer.save(created_by=self.request.user)
+        if task.is_recurring and task.schedule:
+            materialize_recurring_tasks([task.schedule], actor=self.request.user)
+        publish_on_commit(TASK_CREATED, serializer.data)
+        return task
+
+    def perform_update(self, serializer):
+        task = serializer.save()
+        if 'schedule' in serializer.validated_data and task.is_recurring and task.schedule:
+            reschedule_recurring_task(task, actor=self.request.user)
+        return task
+
     def update(self, request, *args, **kwargs):
         task = self.get_object()
         if task.status == Task.COMPLETED:
@@ -81,8 +128,7 @@ class TaskViewSet(viewsets.ModelViewSet):
             self.get_queryset()
             .filter(status=Task.COMPLETED)
         )
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset)
 
     @extend_schema(responses=TaskSerializer(many=True))
     @action(detail=False)
@@ -93,8 +139,7 @@ class TaskViewSet(viewsets.ModelViewSet):
             .filter(assigned_to=user)
             .exclude(status=Task.COMPLETED)
         )
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset)
     
     @extend_schema(responses=TaskSerializer(many=True))
     @action(detail=False, url_path='my/completed')
@@ -104,10 +149,106 @@ class TaskViewSet(viewsets.ModelViewSet):
             self.get_queryset()
             .filter(assigned_to=user, status=Task.COMPLETED)
         )
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        return self.list_response(queryset)
     
 
+    @extend_schema(responses=OpenApiTypes.OBJECT)
+    @action(detail=False)
+    def stats(self, request):
+        return Response(task_stats())
+
+    @extend_schema(responses=CalendarTaskSerializer(many=True))
+    @action(detail=False)
+    def calendar(self, request):
+        """
+        Tasks with deadlines in ``[deadline__gte, deadline__lte]`` (a year from
+        now by default), including future iterations of recurring tasks that
+        are not created yet (``is_virtual``, ``id`` is null). Accepts all task
+        filters and streams the result in deadline order.
+        """
+        params = request.query_params.copy()
+        params.setdefault('deadline__gte', timezone.now().isoformat())
+        params.setdefault('deadline__lte', (timezone.now() + self.calendar_default_range).isoformat())
+        filterset = self.filterset_class(params, self.get_queryset(), request=request)
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        start, end = filterset.form.cleaned_data['deadline__gte'], filterset.form.cleaned_data['deadline__lte']
+
+        # Virtual rows are not started whatever their template's status: a status filter applies to them as such.
+        template_params = params.copy()
+        del template_params['deadline__gte'], template_params['deadline__lte']
+        template_params.pop('status', None)
+        if filterset.form.cleaned_data.get('status') in ('', None, Task.NOT_STARTED):
+            schedules = {s.id: s for s in recurring_schedules().filter(end_date__gte=start.date(), start_date__lte=end.date())}
+        else:
+            schedules = {}
+        templates = self.filterset_class(
+            template_params,
+            self.get_queryset().filter(id__in=[s.latest_task_id for s in schedules.values()], is_recurring=True),
+            request=request,
+        ).qs
+
+        serializer = self.get_serializer()
+        deadline_field = serializer.fields['deadline']
+
+        def real_tasks():
+            for task in filterset.qs.iterator(chunk_size=self.calendar_chunk_size):
+                yield task.deadline, dict(serializer.to_representation(task), is_virtual=False)
+
+        def virtual_tasks(template):
+            row = dict(serializer.to_representation(template), id=None, is_virtual=True, status=Task.NOT_STARTED,
+                       status_display=dict(Task.TASK_STATUS_CHOICES)[Task.NOT_STARTED], completion_evidence_link='')
+            first_deadline = schedules[template.schedule_id].first_deadline
+            for deadline in iter_iteration_deadlines(template, first_deadline, start.date(), end.date()):
+                if start <= deadline <= end:
+                    yield deadline, dict(row, deadline=deadline_field.to_representation(deadline))
+
+        merged = heapq.merge(real_tasks(), *map(virtual_tasks, templates), key=lambda item: item[0])
+        return StreamingHttpResponse(stream_json_array(row for _, row in merged), content_type='application/json')
+
+    @extend_schema(request=TaskSerializer(many=True), responses={200: TaskSerializer(many=True), 201: TaskSerializer(many=True)})
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        if not isinstance(request.data, list) or not all(isinstance(item, dict) for item in request.data):
+            return Response({'detail': 'Ожидается список задач.'}, status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            if request.method == 'POST':
+                serializer = self.get_serializer(data=request.data, many=True,
+                                                 allow_empty=False, max_length=self.bulk_max_items)
+                serializer.is_valid(raise_exception=True)
+                tasks = serializer.save(created_by=request.user)
+                materialize_recurring_tasks([task.schedule for task in tasks if task.is_recurring and task.schedule],
+                                            actor=request.user)
+                response_status = status.HTTP_201_CREATED
+            else:
+                ids = [item.get('id') for item in request.data]
+                # ``in_bulk`` keys are ints: "1" would not be found and [1] is not even hashable.
+                if any(type(task_id) is not int for task_id in ids) or len(set(ids)) != len(ids):
+                    return Response({'detail': 'Каждая задача должна содержать уникальный целочисленный id.'},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                tasks_by_id = self.get_queryset().in_bulk(ids)
+                missing = [task_id for task_id in ids if task_id not in tasks_by_id]
+                if missing:
+                    return Response({'detail': f'Задачи не найдены: {missing}.'}, status=status.HTTP_404_NOT_FOUND)
+                if any(task.status == Task.COMPLETED for task in tasks_by_id.values()):
+                    return Response({'detail': 'Изменение завершенной задачи запрещено.'}, status=status.HTTP_403_FORBIDDEN)
+                serializer = self.get_serializer([tasks_by_id[task_id] for task_id in ids], data=request.data, many=True,
+                                                 partial=True, allow_empty=False, max_length=self.bulk_max_items)
+                serializer.is_valid(raise_exception=True)
+                # The list serializer pops the schedules off the validated data.
+                schedule_changed = [task_id for task_id, attrs in zip(ids, serializer.validated_data) if 'schedule' in attrs]
+                tasks = serializer.save()
+                # As in perform_update; the earliest task of a schedule replaces the iterations after all of them.
+                rescheduled = {}
+                for task in sorted((tasks_by_id[task_id] for task_id in schedule_changed), key=lambda task: task.deadline):
+                    if task.is_recurring and task.schedule:
+                        rescheduled.setdefault(task.schedule_id, task)
+                for task in rescheduled.values():
+                    reschedule_recurring_task(task, actor=request.user)
+                response_status = status.HTTP_200_OK
+        queryset = self.get_queryset().filter(id__in=[task.id for task in tasks])
+        return Response(self.get_serializer(queryset, many=True).data, status=response_status)
+
     @extend_schema(request=TaskStatusSerializer, responses={200: None, 201: TaskSerializer})
     @action(detail=True, methods=['post'], url_path='change-status')
     def change_status(self, request, pk=None):
@@ -117,62 +258,71 @@ class TaskViewSet(viewsets.ModelViewSet):
         status_serializer = TaskStatusSerializer(data=request.data)
         if status_serializer.is_valid():
             new_status = status_serializer.validated_data['status']
-            print(new_status)
             if new_status == Task.COMPLETED:
                 task.completion_evidence_link = status_serializer.validated_data.get('completion_evidence_link', '')
-                if task.is_recurring:
-                    new_task = create_recurring_task_iteration(task)
-                    if new_task.deadline.date() <= task.schedule.end_date: 
-                        with disable_auditlog():
-                            new_task.save()
-                        LogEntry.objects.log_create(new_task,
-                                                    actor=request.user,
-                                                    action=LogEntry.Action.CREATE,
-                                                    changes = model_instance_diff(None, new_task),
-                                                    changes_text=f'Автоматически создана новая итерация повторяющейся задачи. ID предыдущей итерации: {task.id}.')
-                        task_serializer = self.get_serializer(new_task)
-                        task.status = new_status
-                        task.assigned_to = request.user
-                        task.save()
-                        return Response(task_serializer.data, status=status.HTTP_201_CREATED)
             task.status = new_status
             task.assigned_to = request.user
             task.save()
+            publish_on_commit(TASK_STATUS_CHANGED, {
+                'id': task.id,
+                'status': task.status,
+                'assigned_to': task.assigned_to_id,
+                'updated_at': task.updated_at,
+            })
+            if new_status == Task.COMPLETED and task.is_recurring and task.schedule:
+                next_task = self.get_next_iteration(task)
+                if next_task is None:
+                    # The horizon was not topped up in time (see materialize_recurring_tasks command).
+                    materialize_recurring_tasks([task.schedule], actor=request.user)
+                    next_task = self.get_next_iteration(task)
+                if next_task is not None:
+                    return Response(self.get_serializer(next_task).data, status=status.HTTP_201_CREATED)
             return Response({'detail': f'Статус задачи обновлен: {task.status}.'}, status=status.HTTP_200_OK)
         else:
             return Response(status_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def get_next_iteration(self, task):
+        return (
+            self.get_queryset()
+            .filter(schedule=task.schedule, status=Task.NOT_STARTED, deadline__gt=task.deadline)
+            .first()
+        )
+
 
-class ObligationViewSet(viewsets.ModelViewSet):
+@extend_schema_view(**{action: extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS) for action in
+                        ('list', 'retrieve', 'export')})
+class ObligationViewSet(ReplicaReadMixin, SparseFieldsetMixin, ExportMixin, BackgroundDestroyMixin, viewsets.ModelViewSet):
     queryset = Obligation.objects.select_related('pva', 'responsibility_type')
     serializer_class = ObligationSerializer
     filterset_class = ObligationFilter
+    export_filename = 'obligations'
 
-@extend_schema(tags=['tasks'])
-class ObligationTaskListView(generics.ListAPIView):
+@extend_schema(tags=['tasks'], parameters=SPARSE_FIELDSET_PARAMETERS)
+class ObligationTaskListView(ReplicaReadMixin, ProjectedListMixin, SparseFieldsetMixin, generics.ListAPIView):
     serializer_class = TaskSerializer
     filterset_class = TaskFilter
+    pagination_class = TaskCursorPagination
 
     def get_queryset(self):
         obligation_id = self.kwargs['id']
         obligation = get_object_or_404(Obligation, id=obligation_id)
-        return Task.objects.filter(obligation=obligation).select_related(
+        return with_comment_activity(Task.objects.filter(obligation=obligation).select_related(
                 'created_by',
                 'assigned_to',
                 'schedule',
                 'obligation',
                 'obligation__pva',
                 'obligation__responsibility_type'
-            ).order_by('deadline')
+            ).order_by('deadline', 'id'))
 
-class ResponsibilityTypeViewSet(viewsets.ModelViewSet):
+class ResponsibilityTypeViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = ResponsibilityType.objects.all()
     serializer_class = ResponsibilityTypeSerializer
     
     def get_queryset(self):
         return super().get_queryset().order_by('title')
 
-class MedicinalProductViewSet(viewsets.ModelViewSet):
+class MedicinalProductViewSet(CachedListMixin, viewsets.ModelViewSet):
     queryset = MedicinalProduct.objects.all()
     serializer_class = MedicinalProductSerializer
     
@@ -180,13 +330,29 @@ class MedicinalProductViewSet(viewsets.ModelViewSet):
         return super().get_queryset().order_by('title')
 
 
-class PVAViewSet(viewsets.ModelViewSet):
+@extend_schema_view(**{action: extend_schema(parameters=SPARSE_FIELDSET_PARAMETERS) for action in
+                        ('list', 'retrieve', 'export')})
+class PVAViewSet(ReplicaReadMixin, SparseFieldsetMixin, ExportMixin, BackgroundDestroyMixin, viewsets.ModelViewSet):
     queryset = PVA.objects.prefetch_related('medicinal_products')
     serializer_class = PVASerializer
     filterset_class = PVAFilter
-    
-@extend_schema(tags=['obligations'])
-class PVAObligationListView(generics.ListAPIView):
+    export_filename = 'pvas'
+
+
+class DeletionJobViewSet(viewsets.ReadOnlyModelViewSet):
+    """Progress of the deletions of PVAs and obligations: the user's own, all of them for staff."""
+    queryset = DeletionJob.objects.select_related('content_type').order_by('-created_at', '-id')
+    serializer_class = DeletionJobSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(requested_by=self.request.user)
+        return queryset
+
+
+@extend_schema(tags=['obligations'], parameters=SPARSE_FIELDSET_PARAMETERS)
+class PVAObligationListView(ReplicaReadMixin, SparseFieldsetMixin, generics.ListAPIView):
     serializer_class = ObligationSerializer
     filterset_class = ObligationFilter
 
@@ -196,8 +362,9 @@ class PVAObligationListView(generics.ListAPIView):
         return Obligation.objects.filter(pva=pva).select_related('pva', 'responsibility_type')
 
 
-class CommentListCreateView(generics.ListCreateAPIView):
+class CommentListCreateView(ReplicaReadMixin, generics.ListCreateAPIView):
     serializer_class = CommentSerializer
+    pagination_class = CommentCursorPagination
 
     def get_task(self):
         task_id = self.kwargs['id']
@@ -206,23 +373,174 @@ class CommentListCreateView(generics.ListCreateAPIView):
     
     def perform_create(self, serializer):
         task = self.get_task()
-        return serializer.save(created_by=self.request.user, task=task)
+        comment = serializer.save(created_by=self.request.user, task=task)
+        publish_on_commit(COMMENT_ADDED, serializer.data)
+        return comment
     
     def get_queryset(self):
         task = self.get_task()
-        return Comment.objects.filter(task=task).select_related('created_by').order_by('created_at')
+        return Comment.objects.filter(task=task).select_related('created_by').order_by('created_at', 'id')
     
 
-class AuditlogListView(generics.ListAPIView):
-    queryset = LogEntry.objects.select_related('actor', 'content_type').order_by('-timestamp')
-    serializer_class = LogEntrySerializer
-    filterset_class = LogEntryFilter
+class SyncView(generics.GenericAPIView):
+    """
+    Rows changed after ``?since=`` (the ``watermark`` of the previous sync)
+    and the ids of rows deleted or hidden since then. Without ``since`` returns
+    everything. Responses are pages of ``SYNC_PAGE_SIZE`` rows: ``next`` is
+    the link to the following page and is ``null`` on the last one, whose
+    ``watermark`` is the one to send next time.
+    """
+    serializer_class = SyncSerializer
+
+    @extend_schema(parameters=[SyncQuerySerializer])
+    def get(self, request):
+        query = SyncQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        cursor = query.validated_data.get('cursor')
+        if cursor is not None:
+            try:
+                cursor = decode_cursor(cursor)
+            except ValueError:
+                raise NotFound('Некорректный курсор.')
+            since = cursor['since']
+        else:
+            since = query.validated_data.get('since')
+        if since is not None and since < timezone.now() - settings.SYNC_TOMBSTONE_RETENTION:
+            return Response({'detail': 'Метка синхронизации устарела, требуется полная загрузка.'},
+                            status=status.HTTP_410_GONE)
+        changes = changes_since(since, cursor)
+        next_cursor = changes.pop('cursor')
+        changes['next'] = next_cursor and replace_query_param(
+            request.build_absolute_uri(), 'cursor', encode_cursor(next_cursor))
+        return Response(self.get_serializer(changes).data)
+
+
+class MetricsView(APIView):
+    """Request metrics of this process in the Prometheus text format."""
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses={(200, 'text/plain'): OpenApiTypes.STR})
+    def get(self, request):
+        return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ProfileListView(APIView):
+    """Stored request profiles (see ``api.profiling``), newest first, without SQL and function details."""
+    permission_classes = [IsAdminUser]
 
+    @extend_schema(responses={200: OpenApiTypes.OBJECT})
+    def get(self, request):
+        summaries = []
+        for profile_id in profile_ids():
+            profile = load_profile(profile_id)
+            if profile is not None:
+                del profile['queries'], profile['top_functions']
+                summaries.append(profile)
+        return Response(summaries)
 
-class TaskChangelogListView(generics.ListAPIView):
+
+class ProfileDetailView(APIView):
+    """A request profile with its SQL timeline and top functions; ``download/`` returns the ``pstats`` file."""
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses={200: OpenApiTypes.OBJECT})
+    def get(self, request, id):
+        profile = load_profile(id)
+        if profile is None:
+            return Response({'detail': 'Профиль не найден.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(profile)
+
+
+class ProfileDownloadView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(responses={(200, 'application/octet-stream'): OpenApiTypes.BINARY})
+    def get(self, request, id):
+        path = profile_path(id, '.prof')
+        try:
+            file = open(path, 'rb') if path is not None else None
+        except FileNotFoundError:
+            # Deleted from the ring buffer meanwhile.
+            file = None
+        if file is None:
+            return Response({'detail': 'Профиль не найден.'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(file, as_attachment=True, filename=path.name, content_type='application/octet-stream')
+
+
+class LogEntryListMixin:
     serializer_class = LogEntrySerializer
     filterset_class = LogEntryFilter
 
+    def get_log_entries(self):
+        """Includes archived entries when the requested period reaches them."""
+        entries = log_entries_for(self.request.query_params)
+        if entries.model is LogEntryWithArchive:
+            self.filterset_class = LogEntryWithArchiveFilter
+        return entries.select_related('actor', 'content_type')
+
+
+class AuditlogListView(ReplicaReadMixin, LogEntryListMixin, generics.ListAPIView):
+    queryset = LogEntry.objects.all()
+    pagination_class = LogEntryCursorPagination
+
+    def get_queryset(self):
+        return self.get_log_entries().order_by('-timestamp', '-id')
+
+
+@extend_schema(parameters=[OpenApiParameter('compact', bool)])
+class TaskChangelogListView(ReplicaReadMixin, LogEntryListMixin, generics.ListAPIView):
+    pagination_class = LogEntryCursorPagination
+
+    def is_compact(self):
+        return self.request.query_params.get('compact') in ('1', 'true')
+
+    def get_serializer_class(self):
+        return LogEntryCompactSerializer if self.is_compact() else LogEntrySerializer
+
     def get_queryset(self):
         task = get_object_or_404(Task, id=self.kwargs['id'])
-        return LogEntry.objects.get_for_object(task).select_related('actor', 'content_type').order_by('-timestamp')
\ No newline at end of file
+        queryset = (
+            self.get_log_entries()
+            .filter(content_type=ContentType.objects.get_for_model(Task), object_id=task.pk)
+            .order_by('-timestamp', '-id')
+        )
+        if self.is_compact():
+            queryset = queryset.select_related(None).only(*LogEntryCompactSerializer.Meta.fields)
+        return queryset
+
+
+def authenticate_event_stream(request):
+    """
+    User of a JWT from the ``Authorization`` header or, since ``EventSource``
+    cannot send headers, of a stream ticket from the ``ticket`` query parameter.
+    """
+    ticket = request.GET.get('ticket')
+    if ticket:
+        return redeem_ticket(ticket)
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return result[0] if result else None
+
+
+class EventTicketView(APIView):
+    """Single-use ticket opening ``events/?ticket=``, valid for ``EVENTS_TICKET_MAX_AGE`` seconds."""
+
+    @extend_schema(request=None, responses=EventTicketSerializer)
+    def post(self, request):
+        return Response(EventTicketSerializer({'ticket': issue_ticket(request.user),
+                                               'expires_in': settings.EVENTS_TICKET_MAX_AGE}).data)
+
+
+@require_GET
+async def task_events(request):
+    """``text/event-stream`` of task and comment events; needs ASGI."""
+    user = await sync_to_async(authenticate_event_stream)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Учетные данные не были предоставлены.'}, status=401)
+    response = StreamingHttpResponse(broker.stream(settings.EVENTS_HEARTBEAT_INTERVAL),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
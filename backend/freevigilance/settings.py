@@ -89,6 +89,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,10 +100,13 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'api.middleware.AuditlogMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'freevigilance.urls'
 
+TEST_RUNNER = 'api.testing.TestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -119,6 +124,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'freevigilance.wsgi.application'
+ASGI_APPLICATION = 'freevigilance.asgi.application'
 
 
 # Database
@@ -131,6 +137,23 @@ DATABASES = {
     }
 }
 
+# read replicas (see api.routers): DATABASE_REPLICAS is a comma-separated list of SQLite files
+# kept as copies of the primary (manage.py refresh_sqlite_replicas); replicas on other backends
+# are added to DATABASES and DATABASE_READ_REPLICAS by hand
+DATABASE_READ_REPLICAS = []
+for number, name in enumerate(filter(None, os.environ.get('DATABASE_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{number}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': name.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_READ_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['api.routers.PrimaryReplicaRouter']
+# after a write, the user's reads stay on the primary for this long (has to cover the replication lag);
+# the cache has to be shared between processes when running several workers
+READ_YOUR_WRITES_WINDOW = timedelta(seconds=10)
+READ_YOUR_WRITES_CACHE = 'default'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -181,3 +204,81 @@ CORS_ALLOWS_CREDENTIALS = True
 
 AUDITLOG_INCLUDE_ALL_MODELS=True
 AUDITLOG_DISABLE_REMOTE_ADDR = True
+AUDITLOG_EXCLUDE_TRACKING_MODELS = (
+    'api.usersearchprofile',
+    'api.taskstats',
+    'api.tombstone',
+    'api.reminderlog',
+    'api.deletionjob',
+)
+AUDITLOG_EXCLUDE_TRACKING_FIELDS = (
+    'title_normalized',
+    'description_normalized',
+    'requisites_normalized',
+    'updated_at',
+)
+# audit entries are queued and written in batches by a background thread (api.audit_writer);
+# api.testing.TestRunner writes them synchronously, tests run inside a transaction
+AUDITLOG_ASYNC = True
+AUDITLOG_ASYNC_BATCH_SIZE = 500
+AUDITLOG_ASYNC_FLUSH_INTERVAL = 1.0  # seconds
+AUDITLOG_ASYNC_QUEUE_SIZE = 10000
+# queued entries not yet written, replayed after a crash: keep it on persistent storage,
+# outside the source tree
+AUDITLOG_ASYNC_SPOOL_DIR = Path(os.environ.get(
+    'AUDITLOG_ASYNC_SPOOL_DIR', Path.home() / '.local' / 'state' / 'freevigilance' / 'auditlog_spool'))
+# audit entries older than this are moved to monthly archive tables
+AUDITLOG_HOT_RETENTION = timedelta(days=180)
+# archive tables older than this are exported to AUDITLOG_ARCHIVE_EXPORT_DIR and dropped (None keeps them)
+AUDITLOG_ARCHIVE_RETENTION = None
+AUDITLOG_ARCHIVE_EXPORT_DIR = BASE_DIR / 'auditlog_archive'
+
+# cache for reference data lists (responsibility types, medicinal products);
+# has to be shared between processes (Redis, Memcached, database) when running several workers
+REFERENCE_DATA_CACHE = 'default'
+REFERENCE_DATA_CACHE_TIMEOUT = 24 * 60 * 60
+
+# task and obligation lists are rendered from .values() rows (api.projections); off, the serializers are used
+LIST_PROJECTIONS = True
+
+# delta sync: how far back the returned watermark lags (covers transactions still in flight),
+# how long deletions are remembered and how many rows a response holds
+SYNC_WATERMARK_LAG = timedelta(seconds=5)
+SYNC_TOMBSTONE_RETENTION = timedelta(days=30)
+SYNC_PAGE_SIZE = 1000
+
+# server-sent events (api/events/): per-connection backlog before it is closed,
+# seconds of silence before a keep-alive comment is sent, and how long a stream ticket
+# (api/events/ticket/) stays valid; used tickets are remembered in a cache shared between processes
+EVENTS_QUEUE_SIZE = 100
+EVENTS_HEARTBEAT_INTERVAL = 15
+EVENTS_TICKET_MAX_AGE = 30
+EVENTS_TICKET_CACHE = 'default'
+
+# profiles of staff requests sent with "X-Profile: 1" (api/profiles/): where they are kept
+# and how many, the oldest ones are deleted
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_MAX_PROFILES = 100
+
+# deadline reminders (reminder_worker command): how long before the deadline assignees are
+# reminded, how far ahead the worker loads due reminders, how often it looks for new ones,
+# and how late a reminder missed while the worker was down is still sent
+REMINDER_OFFSETS = [timedelta(days=1), timedelta(hours=1)]
+REMINDER_LOOKAHEAD = timedelta(minutes=15)
+REMINDER_POLL_INTERVAL = 60  # seconds
+REMINDER_CATCH_UP = timedelta(hours=1)
+
+# PVAs and obligations are deleted by a background job (api.deletion), this many rows
+# per transaction; api.testing.TestRunner runs the jobs synchronously
+DELETION_CHUNK_SIZE = 500
+DELETION_ASYNC = True
+
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.filebased.EmailBackend')
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'noreply@freevigilance.local')
+
+# PVAs whose end_date is this close are moved to ENDING by the transition_pvas command
+PVA_ENDING_LEAD_TIME = timedelta(days=90)
+
+# how far ahead iterations of recurring tasks are created
+RECURRING_TASKS_HORIZON = timedelta(days=90)